@@ -1,11 +1,15 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from models import User
+from models import User, Principal
+from repositories import UserRepository
+from services.cache_service import CacheService
+from services.cache_invalidation import cache_invalidation_bus
+from services.password_hasher import password_hasher, PasswordHasherBusy
 import os
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
 
 # Security configuration
@@ -13,9 +17,22 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-this-in-produc
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Shares its cost settings with the async hasher below
+pwd_context = password_hasher.context
 security = HTTPBearer()
 
+# Authenticated users are cached per token so a dashboard fanning out a dozen
+# API calls does one user lookup, not twelve. Entries are tagged "user:<id>";
+# routers changing a user's status, role or credentials invalidate them
+# through cache_invalidation_bus.invalidate_users() on every worker.
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '60'))
+principal_cache = CacheService(
+    default_ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=20000,
+    max_bytes=32 * 1024 * 1024
+)
+cache_invalidation_bus.register_cache(principal_cache)
+
 # Database connection - will be initialized from server
 mongo_client = None
 db = None
@@ -36,6 +53,38 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the hashing thread pool (429 when it is saturated)."""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def verify_password_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if its cost settings changed."""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing thread pool (429 when it is saturated)."""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -76,15 +125,8 @@ async def get_current_user_email(credentials: HTTPAuthorizationCredentials = Dep
 
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
-    """Get current user from JWT token and return User object."""
-    if db is None:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Database not initialized"
-        )
-    
-    token = credentials.credentials
+def _token_subject(token: str) -> tuple:
+    """Validate a token and return (email, seconds the principal may be cached)"""
     payload = decode_token(token)
     email: str = payload.get("sub")
     if email is None:
@@ -93,15 +135,52 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # Get user from database
-    users_collection = db.users
-    user_doc = await users_collection.find_one({"email": email})
-    if not user_doc:
+    ttl = PRINCIPAL_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if exp is not None:
+        # Never serve a cached principal for a token that has expired
+        ttl = max(0, min(ttl, exp - time.time()))
+    return email, ttl
+
+
+async def _get_cached(kind: str, token: str, loader):
+    """
+    Cached principal of the given kind for a token, loading it on a miss.
+
+    A hit skips token decoding: entries are keyed by the exact token string,
+    which was validated when the entry was created, and never outlive it.
+    """
+    if db is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database not initialized"
+        )
+
+    key = f"{kind}:{token}"
+    value = principal_cache.get(key)
+    if value is not None:
+        return value
+
+    email, ttl = _token_subject(token)
+    value = await principal_cache.get_or_load(
+        key,
+        lambda: loader(email),
+        ttl_seconds=ttl,
+        namespaces=lambda principal: [f"user:{principal.id}"]
+    )
+    if value is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    return value
+
+
+async def _load_user(email: str) -> Optional[User]:
+    # Get user from database (only the fields the User model needs)
+    user_doc = await UserRepository(db).get_principal_by_email(email)
+    if not user_doc:
+        return None
     
     # Parse datetime fields if they are strings
     if isinstance(user_doc.get('created_at'), str):
@@ -110,3 +189,30 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_doc['updated_at'] = datetime.fromisoformat(user_doc['updated_at'])
     
     return User(**user_doc)
+
+
+async def _load_principal(email: str) -> Optional[Principal]:
+    user_doc = await UserRepository(db).get_identity_by_email(email)
+    if not user_doc:
+        return None
+    return Principal(**user_doc)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    """Get current user from JWT token and return User object."""
+    return await _get_cached("user", credentials.credentials, _load_user)
+
+
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
+    """Get the slim principal (id, email, role, status) from JWT token."""
+    return await _get_cached("principal", credentials.credentials, _load_principal)
+
+
+async def get_current_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
+    """Get the current principal, rejecting anyone who is not an admin."""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
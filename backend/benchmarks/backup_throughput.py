@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Backup Throughput Benchmark for BotSmith
+
+Measures the backup subsystem (services/backup_service.py) on synthetic
+chat messages:
+
+  - archive pipeline: raw BSON and canonical NDJSON through the gzip chunk
+    writer and back, in-process, against the legacy in-memory JSON dump
+    (peak memory from tracemalloc)
+  - end to end (--mongo): full and incremental backups of a scratch
+    database at MONGO_URL, then restores with 1, 4 and 8 workers; the
+    scratch databases are dropped afterwards
+
+Usage:
+    cd backend && python benchmarks/backup_throughput.py [--documents 200000] [--mongo]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bson
+from bson import ObjectId, json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+
+from services.backup_service import BackupService, ChunkWriter, _read_records
+
+BATCH = 1000
+
+
+def make_messages(count: int, start: int = 0):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(start, start + count):
+        yield {
+            "_id": ObjectId(),
+            "id": f"msg-{i:09d}",
+            "chatbot_id": f"bot-{i % 50:03d}",
+            "conversation_id": f"conv-{i // 12:08d}",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: how do I reset my password and update the billing email on my account?",
+            "timestamp": base + timedelta(seconds=i),
+            "timings": {"retrieval_ms": 12.5, "llm_ms": 840.1} if i % 2 else None,
+        }
+
+
+def report(label: str, documents: int, raw_bytes: int, seconds: float, extra: str = ""):
+    print(
+        f"  {label:<28} {documents / seconds:>12,.0f} docs/s  "
+        f"{raw_bytes / seconds / 1024 / 1024:>8.1f} MB/s  {seconds:>7.2f}s  {extra}"
+    )
+
+
+def bench_pipeline(documents: int):
+    print(f"\nArchive pipeline ({documents:,} messages)")
+    raw = [bson.encode(doc) for doc in make_messages(documents)]
+    raw_bytes = sum(len(record) for record in raw)
+    directory = Path(tempfile.mkdtemp(prefix="backup-bench-"))
+    try:
+        for format in ("bson", "ndjson"):
+            # Encoding is part of the cost of NDJSON; raw BSON comes off the wire as is
+            started = time.perf_counter()
+            if format == "bson":
+                records = raw
+            else:
+                records = [
+                    (json_util.dumps(bson.decode(record), json_options=CANONICAL_JSON_OPTIONS) + "\n").encode()
+                    for record in raw
+                ]
+            writer = ChunkWriter(directory, f"messages-{format}", format)
+            for i in range(0, len(records), BATCH):
+                writer.write(records[i:i + BATCH])
+            files = writer.close()
+            elapsed = time.perf_counter() - started
+            compressed = sum(file["bytes"] for file in files)
+            report(f"write {format}", documents, raw_bytes, elapsed, f"ratio {raw_bytes / compressed:.1f}x, {len(files)} files")
+
+            started = time.perf_counter()
+            read = sum(1 for file in files for _ in _read_records(directory / file["name"], format))
+            report(f"read {format}", read, raw_bytes, time.perf_counter() - started)
+
+        def legacy_dump():
+            # What GET /admin/backup/database did: every document in one dict, then one JSON body
+            docs = [bson.decode(record) for record in raw]
+            return json.dumps({"messages": docs}, default=str)
+
+        started = time.perf_counter()
+        dump = legacy_dump()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        legacy_dump()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report("legacy json.dumps", documents, raw_bytes, elapsed, f"peak {peak / 1024 / 1024:.0f} MB, uncompressed {len(dump) / 1024 / 1024:.0f} MB")
+
+        tracemalloc.start()
+        writer = ChunkWriter(directory, "messages-peak", "bson")
+        for i in range(0, len(raw), BATCH):
+            writer.write(raw[i:i + BATCH])
+        writer.close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {'chunk writer peak memory':<28} {peak / 1024 / 1024:>12.1f} MB (per batch of {BATCH})")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+async def bench_mongo(documents: int):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    source = client[f"backup_benchmark_{os.getpid()}"]
+    target = client[f"backup_benchmark_{os.getpid()}_restore"]
+    directory = Path(tempfile.mkdtemp(prefix="backup-bench-"))
+    service = BackupService(directory)
+    print(f"\nEnd to end against MongoDB ({documents:,} messages)")
+    try:
+        batch = []
+        for doc in make_messages(documents):
+            batch.append(doc)
+            if len(batch) == BATCH:
+                await source.messages.insert_many(batch)
+                batch = []
+        if batch:
+            await source.messages.insert_many(batch)
+        stats = await source.command("collStats", "messages")
+
+        started = time.perf_counter()
+        full = await service.backup(source, collections=("messages",))
+        report("full backup", full["documents"], stats["size"], time.perf_counter() - started,
+               f"{full['bytes'] / 1024 / 1024:.1f} MB on disk")
+
+        await source.messages.insert_many(list(make_messages(documents // 10, start=documents)))
+        started = time.perf_counter()
+        incremental = await service.backup(source, collections=("messages",), incremental=True)
+        report("incremental backup", incremental["documents"], stats["size"] // 10, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        result = await service.verify(incremental["id"], deep=True)
+        print(f"  {'verify (deep)':<28} {'ok' if result['ok'] else result['errors']} in {time.perf_counter() - started:.2f}s")
+
+        for workers in (1, 4, 8):
+            await target.messages.drop()
+            started = time.perf_counter()
+            restored = await service.restore(target, incremental["id"], workers=workers)
+            report(f"restore, {workers} workers", restored["documents"]["messages"], stats["size"],
+                   time.perf_counter() - started)
+    finally:
+        await client.drop_database(source.name)
+        await client.drop_database(target.name)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backup and restore throughput")
+    parser.add_argument("--documents", type=int, default=200000, help="Synthetic messages")
+    parser.add_argument("--mongo", action="store_true", help="Also run end to end against MONGO_URL")
+    args = parser.parse_args()
+
+    bench_pipeline(args.documents)
+    if args.mongo:
+        asyncio.run(bench_mongo(args.documents))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Middleware Overhead Benchmark for BotSmith
+
+Measures per-request overhead of the security middleware by driving the ASGI
+app directly (no sockets), comparing:
+
+  - bare app (no security middleware)
+  - legacy stack: the four BaseHTTPMiddleware layers as they were before the
+    pure-ASGI rewrite (replicated here for comparison)
+  - current stack: the four stages as separate pure-ASGI middleware
+  - current pipeline: the four stages composed into one SecurityPipeline
+
+Usage:
+    cd backend && python benchmarks/middleware_overhead.py [--requests 20000]
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from middleware.security import (
+    SECURITY_HEADERS,
+    SUSPICIOUS_PATTERNS,
+    SecurityPipeline,
+    SecurityHeadersMiddleware,
+    RateLimitMiddleware,
+    InputValidationMiddleware,
+    APIKeyProtectionMiddleware,
+)
+
+
+# ---------------------------------------------------------------------------
+# Legacy BaseHTTPMiddleware stack (behaviour of the pre-rewrite middleware)
+# ---------------------------------------------------------------------------
+
+legacy_storage = defaultdict(list)
+
+
+class LegacySecurityHeaders(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        for name, value in SECURITY_HEADERS.items():
+            response.headers[name] = value
+        return response
+
+
+class LegacyRateLimit(BaseHTTPMiddleware):
+    def __init__(self, app, requests_per_minute=200, requests_per_hour=5000):
+        super().__init__(app)
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_hour = requests_per_hour
+
+    async def dispatch(self, request, call_next):
+        client_ip = request.client.host if request.client else "unknown"
+        now = datetime.now()
+        legacy_storage[client_ip] = [t for t in legacy_storage[client_ip] if now - t < timedelta(hours=1)]
+        recent = [t for t in legacy_storage[client_ip] if t > now - timedelta(minutes=1)]
+        if len(recent) >= self.requests_per_minute or len(legacy_storage[client_ip]) >= self.requests_per_hour:
+            return JSONResponse({"detail": "rate limited"}, status_code=429)
+        legacy_storage[client_ip].append(datetime.now())
+        response = await call_next(request)
+        response.headers['X-RateLimit-Limit'] = str(self.requests_per_minute)
+        response.headers['X-RateLimit-Remaining'] = str(
+            self.requests_per_minute - len([t for t in legacy_storage[client_ip] if datetime.now() - t < timedelta(minutes=1)])
+        )
+        return response
+
+
+class LegacyInputValidation(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        def suspicious(text):
+            text_lower = text.lower()
+            return any(re.search(p, text_lower, re.IGNORECASE) for p in SUSPICIOUS_PATTERNS)
+
+        for key, value in request.query_params.items():
+            if suspicious(str(value)):
+                return JSONResponse({"detail": "Invalid input detected"}, status_code=400)
+        for key, value in request.headers.items():
+            if key.lower() not in ['authorization', 'cookie', 'content-type', 'accept'] and suspicious(str(value)):
+                return JSONResponse({"detail": "Invalid request headers"}, status_code=400)
+        return await call_next(request)
+
+
+class LegacyAPIKeyProtection(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        return await call_next(request)
+
+
+# ---------------------------------------------------------------------------
+# Harness
+# ---------------------------------------------------------------------------
+
+async def endpoint(request):
+    return JSONResponse({"message": "ok", "items": list(range(20))})
+
+
+def build_app():
+    return Starlette(routes=[Route("/api/bench", endpoint)])
+
+
+def legacy_stack():
+    app = build_app()
+    # Same add order as server.py used: last added runs first
+    app.add_middleware(LegacySecurityHeaders)
+    app.add_middleware(LegacyRateLimit, requests_per_minute=10**9, requests_per_hour=10**9)
+    app.add_middleware(LegacyInputValidation)
+    app.add_middleware(LegacyAPIKeyProtection)
+    return app
+
+
+def separate_stack():
+    app = build_app()
+    app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(RateLimitMiddleware, requests_per_minute=10**9, requests_per_hour=10**9)
+    app.add_middleware(InputValidationMiddleware)
+    app.add_middleware(APIKeyProtectionMiddleware)
+    return app
+
+
+def pipeline_stack():
+    app = build_app()
+    app.add_middleware(
+        SecurityPipeline,
+        stages=[
+            APIKeyProtectionMiddleware(),
+            InputValidationMiddleware(),
+            RateLimitMiddleware(requests_per_minute=10**9, requests_per_hour=10**9),
+            SecurityHeadersMiddleware(),
+        ]
+    )
+    return app
+
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/api/bench",
+    "raw_path": b"/api/bench",
+    "root_path": "",
+    "query_string": b"page=1&limit=20&search=chatbot",
+    "headers": [
+        (b"host", b"localhost"),
+        (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36"),
+        (b"accept", b"application/json"),
+        (b"accept-language", b"en-US,en;q=0.9"),
+        (b"authorization", b"Bearer eyJhbGciOiJIUzI1NiJ9.eyJzdWIiOiJhIn0.sig"),
+        (b"referer", b"https://app.example.com/dashboard"),
+    ],
+    "client": ("127.0.0.1", 50000),
+    "server": ("localhost", 8000),
+}
+
+
+async def run(app, requests: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # Warm up (builds the middleware stack)
+    for _ in range(200):
+        await app(dict(SCOPE), receive, send)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(SCOPE), receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark security middleware overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {}
+    for name, factory in [
+        ("bare app", build_app),
+        ("legacy BaseHTTPMiddleware stack", legacy_stack),
+        ("pure ASGI, separate layers", separate_stack),
+        ("pure ASGI, single pipeline", pipeline_stack),
+    ]:
+        results[name] = await run(factory(), args.requests)
+
+    baseline = results["bare app"]
+    print(f"{'configuration':<36} {'us/request':>12} {'overhead us':>12}")
+    for name, micros in results.items():
+        print(f"{name:<36} {micros:>12.1f} {micros - baseline:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Startup Profile Report for BotSmith
+
+Imports server.py in a fresh interpreter with `-X importtime` and reports
+the total import time, the packages that cost the most and the peak RSS of
+that process. Heavy optional dependencies are listed separately: they are
+meant to load on first use (or in the deferred warm-up), so any of them
+showing up here was pulled into startup again by an eager import.
+
+Phase timings of a running worker (indexes, plans, ...) are served at
+GET /api/health/startup.
+
+Usage:
+    cd backend && python benchmarks/startup_profile.py [--top 20]
+"""
+import argparse
+import re
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = [
+    "discord", "tiktoken", "pypdf", "docx", "openpyxl", "bs4", "requests",
+    "emergentintegrations", "litellm", "openai",
+]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile application startup imports")
+    parser.add_argument("--top", type=int, default=20, help="Packages to list")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(f"import server failed with exit code {result.returncode}")
+
+    self_us_by_package = {}
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, _, _, module = match.groups()
+        package = module.split(".")[0]
+        loaded.add(package)
+        self_us_by_package[package] = self_us_by_package.get(package, 0) + int(self_us)
+
+    total_ms = sum(self_us_by_package.values()) / 1000
+    # ru_maxrss is in kilobytes on Linux
+    max_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    print(f"process wall time   {wall_ms:10.1f} ms")
+    print(f"total import time   {total_ms:10.1f} ms")
+    print(f"peak RSS            {max_rss_mb:10.1f} MB\n")
+
+    print(f"{'package':<32} {'self ms':>10}")
+    ranked = sorted(self_us_by_package.items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in ranked[:args.top]:
+        print(f"{package:<32} {self_us / 1000:>10.1f}")
+
+    eager = [name for name in HEAVY_MODULES if name in loaded]
+    print(f"\nheavy modules imported at startup: {', '.join(eager) if eager else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Shared MongoDB client provider.
+
+Every module gets its database handle from here instead of constructing its
+own AsyncIOMotorClient, so each worker keeps a single connection pool that can
+be tuned through environment variables:
+
+    MONGO_URL                            connection string (required)
+    DB_NAME                              database name (default: chatbase_db)
+    MONGO_MAX_POOL_SIZE                  max connections per server (default: 100)
+    MONGO_MIN_POOL_SIZE                  connections kept warm (default: 0)
+    MONGO_MAX_IDLE_TIME_MS               idle connection lifetime (default: unset)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS          max wait for a free connection (default: unset)
+    MONGO_CONNECT_TIMEOUT_MS             socket connect timeout (default: 20000)
+    MONGO_SOCKET_TIMEOUT_MS              socket read timeout (default: unset)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS    server selection timeout (default: 30000)
+    MONGO_READ_PREFERENCE                e.g. primary, primaryPreferred, secondaryPreferred
+"""
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import Dict, Any, Optional
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+DEFAULT_DB_NAME = 'chatbase_db'
+
+_client: Optional[AsyncIOMotorClient] = None
+_client_lock = threading.Lock()
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool counters from pymongo's CMAP events"""
+
+    def __init__(self):
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pools_cleared = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "open_connections": self.connections_created - self.connections_closed,
+            "checked_out": self.checked_out,
+            "total_checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            "connections_created": self.connections_created,
+            "connections_closed": self.connections_closed,
+            "pools_cleared": self.pools_cleared,
+        }
+
+
+pool_metrics = PoolMetricsListener()
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def get_client_options() -> Dict[str, Any]:
+    """Build AsyncIOMotorClient keyword options from the environment"""
+    options = {
+        "maxPoolSize": _int_env('MONGO_MAX_POOL_SIZE') or 100,
+        "minPoolSize": _int_env('MONGO_MIN_POOL_SIZE') or 0,
+        "connectTimeoutMS": _int_env('MONGO_CONNECT_TIMEOUT_MS') or 20000,
+        "serverSelectionTimeoutMS": _int_env('MONGO_SERVER_SELECTION_TIMEOUT_MS') or 30000,
+    }
+    optional = {
+        "maxIdleTimeMS": _int_env('MONGO_MAX_IDLE_TIME_MS'),
+        "waitQueueTimeoutMS": _int_env('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+        "socketTimeoutMS": _int_env('MONGO_SOCKET_TIMEOUT_MS'),
+        "readPreference": os.environ.get('MONGO_READ_PREFERENCE'),
+    }
+    options.update({k: v for k, v in optional.items() if v is not None})
+    return options
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Return the process-wide Motor client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongo_url = os.environ['MONGO_URL']
+                options = get_client_options()
+                _client = AsyncIOMotorClient(mongo_url, event_listeners=[pool_metrics], **options)
+                logger.info(
+                    f"MongoDB client created (maxPoolSize={options['maxPoolSize']}, "
+                    f"minPoolSize={options['minPoolSize']})"
+                )
+    return _client
+
+
+def get_db_name() -> str:
+    """Name of the application database"""
+    return os.environ.get('DB_NAME', DEFAULT_DB_NAME)
+
+
+def get_database(name: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """
+    Get a database handle on the shared client
+
+    Args:
+        name: Optional database name (defaults to DB_NAME)
+    """
+    return get_client()[name or get_db_name()]
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Connection pool usage metrics for this worker"""
+    options = get_client_options()
+    return {
+        **pool_metrics.get_stats(),
+        "max_pool_size": options["maxPoolSize"],
+        "min_pool_size": options["minPoolSize"],
+        "client_initialized": _client is not None,
+    }
+
+
+def close_client():
+    """Close the shared client (called on application shutdown)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
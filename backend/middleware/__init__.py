@@ -1,5 +1,7 @@
 """Security middleware package"""
 from .security import (
+    SecurityPipeline,
+    SecurityStage,
     SecurityHeadersMiddleware,
     RateLimitMiddleware,
     InputValidationMiddleware,
@@ -9,8 +11,18 @@ from .security import (
     validate_url,
     is_safe_filename
 )
+from .rate_limiter import (
+    RateLimiter,
+    RateLimitPolicy,
+    RateLimitBackend,
+    InMemoryRateLimitBackend,
+    MongoRateLimitBackend,
+    default_policies
+)
 
 __all__ = [
+    'SecurityPipeline',
+    'SecurityStage',
     'SecurityHeadersMiddleware',
     'RateLimitMiddleware',
     'InputValidationMiddleware',
@@ -19,4 +31,10 @@ __all__ = [
     'validate_email',
     'validate_url',
     'is_safe_filename',
+    'RateLimiter',
+    'RateLimitPolicy',
+    'RateLimitBackend',
+    'InMemoryRateLimitBackend',
+    'MongoRateLimitBackend',
+    'default_policies',
 ]
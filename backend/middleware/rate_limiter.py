@@ -0,0 +1,370 @@
+"""
+Rate limiting engine for BotSmith API
+
+Uses the sliding-window counter approximation: every (key, window) pair keeps
+just the count of the current fixed bucket and the previous one, and the
+request rate is estimated as
+
+    previous * (1 - elapsed_fraction_of_current_bucket) + current
+
+so memory per client is constant no matter how many requests it makes.
+Counters live in a pluggable backend: the in-memory one is per worker and
+evicts idle keys, the MongoDB one is shared by all workers.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import math
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# (max requests, window in seconds)
+Limit = Tuple[int, int]
+
+WINDOW_NAMES = {1: "second", 60: "minute", 3600: "hour", 86400: "day"}
+
+
+def describe_limit(limit: Limit) -> str:
+    count, window = limit
+    name = WINDOW_NAMES.get(window, f"{window} seconds")
+    return f"{count} requests per {name}"
+
+
+class RateLimitResult:
+    """Outcome of a rate limit check"""
+
+    __slots__ = ("allowed", "limit", "remaining", "retry_after", "message")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: int = 0, message: str = ""):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+        self.message = message
+
+
+def _estimate(previous: int, current: int, now: float, window: int) -> Tuple[float, float]:
+    """Return (estimated count in the sliding window, elapsed fraction of current bucket)"""
+    elapsed = (now % window) / window
+    return previous * (1.0 - elapsed) + current, elapsed
+
+
+def _retry_after(previous: int, current: int, limit: int, now: float, window: int) -> int:
+    """Seconds until one more request would fit in the window"""
+    elapsed = (now % window) / window
+    until_next_bucket = window * (1.0 - elapsed)
+    if current + 1 > limit:
+        # The current bucket becomes the previous one and must decay as well
+        decay = window * (1.0 - (limit - 1) / current) if current else 0.0
+        return max(1, math.ceil(until_next_bucket + decay))
+    if previous == 0:
+        return max(1, math.ceil(until_next_bucket))
+    # Wait for the previous bucket's weight to decay enough
+    needed_elapsed = 1.0 - (limit - 1 - current) / previous
+    return max(1, math.ceil((needed_elapsed - elapsed) * window))
+
+
+class RateLimitBackend:
+    """Storage interface for rate limit counters"""
+
+    async def hit(self, key: str, limits: List[Limit], now: float) -> RateLimitResult:
+        """Check all limits for key and count the request if every limit allows it"""
+        raise NotImplementedError
+
+    async def undo(self, key: str, limits: List[Limit], now: float):
+        """Take back a request counted by an allowing hit() (another policy denied it)"""
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-process counters with bounded memory.
+
+    Keys idle for longer than the largest window are dropped on a periodic
+    sweep, and the least recently used key is evicted once max_keys is hit.
+    """
+
+    def __init__(self, max_keys: int = 100000, sweep_interval_seconds: int = 60):
+        # key -> {window: [bucket, current, previous]}
+        self._state: "OrderedDict[str, Dict[int, List[int]]]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval_seconds
+        self._next_sweep = 0.0
+        self._max_window = 0
+
+    def _sweep(self, now: float):
+        idle_cutoff = now - 2 * self._max_window
+        while self._state:
+            oldest = next(iter(self._state))
+            if self._last_seen.get(oldest, 0) >= idle_cutoff:
+                break
+            del self._state[oldest]
+            self._last_seen.pop(oldest, None)
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self._state)
+
+    async def hit(self, key: str, limits: List[Limit], now: float) -> RateLimitResult:
+        return self.hit_sync(key, limits, now)
+
+    def hit_sync(self, key: str, limits: List[Limit], now: float) -> RateLimitResult:
+        for _, window in limits:
+            if window > self._max_window:
+                self._max_window = window
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        windows = self._state.get(key)
+        if windows is None:
+            windows = {}
+            self._state[key] = windows
+            while len(self._state) > self.max_keys:
+                evicted, _ = self._state.popitem(last=False)
+                self._last_seen.pop(evicted, None)
+        else:
+            self._state.move_to_end(key)
+        self._last_seen[key] = now
+
+        remaining = None
+        reported_limit = limits[0][0]
+        for limit, window in limits:
+            bucket = int(now // window)
+            counter = windows.get(window)
+            if counter is None:
+                counter = [bucket, 0, 0]
+                windows[window] = counter
+            elif counter[0] != bucket:
+                # Roll forward: the old current becomes previous only if adjacent
+                counter[2] = counter[1] if counter[0] == bucket - 1 else 0
+                counter[1] = 0
+                counter[0] = bucket
+
+            estimated, _ = _estimate(counter[2], counter[1], now, window)
+            if estimated + 1 > limit:
+                return RateLimitResult(
+                    allowed=False,
+                    limit=limit,
+                    remaining=0,
+                    retry_after=_retry_after(counter[2], counter[1], limit, now, window),
+                    message=f"Rate limit exceeded: {describe_limit((limit, window))}"
+                )
+            left = int(limit - estimated - 1)
+            if remaining is None or left < remaining:
+                remaining = left
+
+        for _, window in limits:
+            windows[window][1] += 1
+
+        return RateLimitResult(allowed=True, limit=reported_limit, remaining=max(0, remaining or 0))
+
+    async def undo(self, key: str, limits: List[Limit], now: float):
+        windows = self._state.get(key)
+        if windows is None:
+            return
+        for _, window in limits:
+            counter = windows.get(window)
+            if counter is not None and counter[0] == int(now // window) and counter[1] > 0:
+                counter[1] -= 1
+
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """
+    Counters shared by every worker, one small document per key.
+
+    The document holds {bucket, current, previous} for each window, like the
+    in-memory counters. A check is a single find_one_and_update with an
+    update pipeline that rolls the buckets forward and counts the request
+    in every window at once; if that exceeds a limit, the request is taken
+    back with one more update, so concurrent workers never both squeeze in
+    past the limit. Documents expire through a TTL index.
+    """
+
+    def __init__(self, db, collection_name: str = "rate_limit_counters"):
+        self.collection = db[collection_name]
+        self._index_ready = False
+
+    async def _ensure_index(self):
+        if self._index_ready:
+            return
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not create rate limit TTL index: {str(e)}")
+        self._index_ready = True
+
+    @staticmethod
+    def _count(window: int, bucket: int) -> Dict[str, Any]:
+        field = f"$w{window}"
+        # Missing fields compare below any number, so a new key starts fresh
+        same = {"$gte": [f"{field}.bucket", bucket]}
+        return {
+            "bucket": {"$cond": [same, f"{field}.bucket", bucket]},
+            "current": {"$cond": [same, {"$add": [f"{field}.current", 1]}, 1]},
+            "previous": {"$cond": [
+                same,
+                f"{field}.previous",
+                {"$cond": [{"$eq": [f"{field}.bucket", bucket - 1]}, f"{field}.current", 0]}
+            ]},
+        }
+
+    @staticmethod
+    def _uncount(window: int, bucket: int) -> Dict[str, Any]:
+        field = f"$w{window}"
+        return {
+            "bucket": f"{field}.bucket",
+            "previous": f"{field}.previous",
+            "current": {"$cond": [
+                {"$eq": [f"{field}.bucket", bucket]},
+                {"$max": [{"$subtract": [f"{field}.current", 1]}, 0]},
+                f"{field}.current"
+            ]},
+        }
+
+    async def hit(self, key: str, limits: List[Limit], now: float) -> RateLimitResult:
+        from pymongo import ReturnDocument
+
+        await self._ensure_index()
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=2 * max(window for _, window in limits))
+        update = {f"w{window}": self._count(window, int(now // window)) for _, window in limits}
+        update["expires_at"] = expires_at
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": key},
+                [{"$set": update}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            remaining = None
+            for limit, window in limits:
+                counter = doc[f"w{window}"]
+                previous = counter["previous"]
+                # `current` already includes this request
+                current = counter["current"] - 1
+                estimated, _ = _estimate(previous, current, now, window)
+                if estimated + 1 > limit:
+                    await self.undo(key, limits, now)
+                    return RateLimitResult(
+                        allowed=False,
+                        limit=limit,
+                        remaining=0,
+                        retry_after=_retry_after(previous, current, limit, now, window),
+                        message=f"Rate limit exceeded: {describe_limit((limit, window))}"
+                    )
+                left = int(limit - estimated - 1)
+                if remaining is None or left < remaining:
+                    remaining = left
+        except Exception as e:
+            # Fail open: a counter store outage must not take the API down
+            logger.warning(f"Shared rate limit backend error: {str(e)}")
+            return RateLimitResult(allowed=True, limit=limits[0][0], remaining=limits[0][0])
+
+        return RateLimitResult(allowed=True, limit=limits[0][0], remaining=max(0, remaining or 0))
+
+    async def undo(self, key: str, limits: List[Limit], now: float):
+        update = {f"w{window}": self._uncount(window, int(now // window)) for _, window in limits}
+        await self.collection.update_one({"_id": key}, [{"$set": update}])
+
+
+class RateLimitPolicy:
+    """
+    A set of limits applied to matching requests.
+
+    Args:
+        name: Policy name, used as part of the counter key
+        limits: List of (max requests, window seconds)
+        path_pattern: Optional regex matched against the path; a named group
+            `chatbot_id` makes the chatbot part of the key
+        methods: Optional set of HTTP methods the policy applies to
+        scope: "ip" (per client), "chatbot" (shared by all clients of a
+            chatbot) or "chatbot_ip" (per client per chatbot)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limits: List[Limit],
+        path_pattern: Optional[str] = None,
+        methods: Optional[List[str]] = None,
+        scope: str = "ip"
+    ):
+        if scope not in ("ip", "chatbot", "chatbot_ip"):
+            raise ValueError(f"Unknown rate limit scope: {scope}")
+        self.name = name
+        self.limits = sorted(limits, key=lambda limit: limit[1])
+        self.path_regex = re.compile(path_pattern) if path_pattern else None
+        self.methods = {m.upper() for m in methods} if methods else None
+        self.scope = scope
+
+    def key_for(self, method: str, path: str, client_ip: str) -> Optional[str]:
+        """Counter key if the policy applies to this request, else None"""
+        if self.methods is not None and method.upper() not in self.methods:
+            return None
+        chatbot_id = None
+        if self.path_regex is not None:
+            match = self.path_regex.match(path)
+            if not match:
+                return None
+            chatbot_id = match.groupdict().get("chatbot_id")
+        if self.scope == "ip":
+            return f"{self.name}:{client_ip}"
+        if chatbot_id is None:
+            return None
+        if self.scope == "chatbot":
+            return f"{self.name}:{chatbot_id}"
+        return f"{self.name}:{chatbot_id}:{client_ip}"
+
+
+def default_policies(requests_per_minute: int = 60, requests_per_hour: int = 1000) -> List[RateLimitPolicy]:
+    """Global per-IP limits plus a per-chatbot limit on the public chat endpoint"""
+    return [
+        RateLimitPolicy("global", [(requests_per_minute, 60), (requests_per_hour, 3600)]),
+        RateLimitPolicy(
+            "public_chat",
+            [(60, 60)],
+            path_pattern=r"^/api/public/chat/(?P<chatbot_id>[^/]+)$",
+            methods=["POST"],
+            scope="chatbot_ip"
+        ),
+    ]
+
+
+class RateLimiter:
+    """Applies every matching policy to a request using one backend"""
+
+    def __init__(self, policies: List[RateLimitPolicy], backend: Optional[RateLimitBackend] = None):
+        self.policies = policies
+        self.backend = backend or InMemoryRateLimitBackend()
+
+    async def check(self, method: str, path: str, client_ip: str, now: Optional[float] = None) -> RateLimitResult:
+        """
+        Check and count a request against all matching policies
+
+        Returns:
+            The first denying result, or the allowing result with the fewest
+            remaining requests
+        """
+        now = time.time() if now is None else now
+        result = None
+        counted = []
+        for policy in self.policies:
+            key = policy.key_for(method, path, client_ip)
+            if key is None:
+                continue
+            policy_result = await self.backend.hit(key, policy.limits, now)
+            if not policy_result.allowed:
+                # A denied request does not count against the policies that allowed it
+                for counted_key, limits in counted:
+                    try:
+                        await self.backend.undo(counted_key, limits, now)
+                    except Exception as e:
+                        logger.warning(f"Rate limit rollback failed for {counted_key}: {str(e)}")
+                return policy_result
+            counted.append((key, policy.limits))
+            if result is None or policy_result.remaining < result.remaining:
+                result = policy_result
+        return result or RateLimitResult(allowed=True, limit=0, remaining=0)
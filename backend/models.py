@@ -178,6 +178,16 @@ class User(BaseModel):
     integration_preferences: Dict[str, Any] = {}
 
 
+class Principal(BaseModel):
+    """Slim authenticated identity for endpoints that only need id and role"""
+    model_config = ConfigDict(extra="ignore")
+
+    id: str
+    email: str
+    role: Literal["user", "moderator", "admin"] = "user"
+    status: Literal["active", "suspended", "banned"] = "active"
+
+
 class UserCreate(BaseModel):
     name: str
     email: EmailStr
@@ -675,6 +685,9 @@ class MessageRecord(BaseModel):
     content: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     session_id: Optional[str] = None
+    # Stage timings of an assistant reply ({"retrieval_ms", "llm_ms", "persistence_ms", "total_ms"});
+    # saved partial with the message and completed once the turn is done
+    timings: Optional[Dict[str, float]] = None
 
 
 # Alias for compatibility
@@ -726,6 +739,8 @@ class AnalyticsResponse(BaseModel):
     active_chatbots: int
     total_chatbots: int
     total_leads: int = 0
+    # Estimated unique chat sessions over the last 30 days (HyperLogLog, ~1.6% error)
+    unique_visitors_30d: int = 0
 
 
 # Alias for compatibility
@@ -737,6 +752,9 @@ class ChatbotAnalytics(BaseModel):
     total_conversations: int
     avg_messages_per_conversation: float
     date_range: str
+    # Estimated (HyperLogLog, ~1.6% standard error)
+    unique_sessions: int = 0
+    unique_users: int = 0
 
 
 # Advanced Analytics Models
@@ -763,13 +781,18 @@ class TopQuestion(BaseModel):
     question: str
     count: int
     percentage: float
+    # Other wordings folded into this one when paraphrases are grouped
+    variants: List[str] = []
 
 
 class TopQuestionsAnalytics(BaseModel):
     """Top questions analytics response"""
     chatbot_id: str
     top_questions: List[TopQuestion]
+    # Distinct questions tracked; a lower bound when not exact (the
+    # summaries only keep the most asked questions)
     total_unique_questions: int
+    total_unique_questions_exact: bool = True
 
 
 class SatisfactionAnalytics(BaseModel):
@@ -788,6 +811,15 @@ class PerformanceMetrics(BaseModel):
     total_responses: int
     fastest_response_ms: float
     slowest_response_ms: float
+    p50_response_ms: Optional[float] = None
+    p95_response_ms: Optional[float] = None
+    p99_response_ms: Optional[float] = None
+    # Per-stage summaries from the latency sketches: {stage: {"count", "avg_ms", "p50_ms", ...}}
+    stages: Dict[str, Dict[str, float]] = {}
+    # The percentiles and stages only cover replies whose stage timings were
+    # recorded: this many, from this UTC day on (the totals cover all history)
+    measured_responses: int = 0
+    measured_since: Optional[str] = None
 
 
 class RatingCreate(BaseModel):
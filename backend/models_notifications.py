@@ -30,6 +30,8 @@ class Notification(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     read_at: Optional[datetime] = None
     action_url: Optional[str] = None  # URL to navigate when clicked
+    count: int = 1  # Events folded into this notification when it is a digest
+    first_event_at: Optional[datetime] = None  # Earliest folded event (digests only)
 
 
 class NotificationCreate(BaseModel):
@@ -0,0 +1,297 @@
+"""
+Projection-aware data access for the hot paths.
+
+Each repository method reads one named view of a document instead of the
+whole thing, so requests stop decoding (and transferring) fields they never
+touch - branding images stored as data URLs on chatbots, extracted text on
+sources, notes and activity arrays on users.
+"""
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Dict, Any, Iterable, List, Optional
+from datetime import datetime
+from models import User
+import asyncio
+
+# Named projections, one per use-case: "<collection>.<view>"
+PROJECTIONS: Dict[str, Dict[str, int]] = {
+    # Everything the chat pipelines (web, public, messaging integrations) read
+    "chatbot.chat_runtime": {
+        "_id": 0,
+        "id": 1,
+        "user_id": 1,
+        "name": 1,
+        "status": 1,
+        "public_access": 1,
+        "instructions": 1,
+        "system_message": 1,
+        "model": 1,
+        "provider": 1,
+        "temperature": 1,
+        "max_tokens": 1,
+        "welcome_message": 1,
+        "webhook_enabled": 1,
+        "webhook_url": 1,
+    },
+    # Widget/public page configuration (includes branding images)
+    "chatbot.public_profile": {
+        "_id": 0,
+        "id": 1,
+        "name": 1,
+        "public_access": 1,
+        "welcome_message": 1,
+        "primary_color": 1,
+        "secondary_color": 1,
+        "logo_url": 1,
+        "avatar_url": 1,
+        "font_family": 1,
+        "font_size": 1,
+        "widget_theme": 1,
+        "widget_position": 1,
+        "widget_size": 1,
+        "auto_expand": 1,
+    },
+    # Ownership checks only need to know the document exists
+    "chatbot.ownership": {"_id": 0, "id": 1, "user_id": 1, "name": 1},
+    # Source list without the extracted content
+    "source.listing": {
+        "_id": 0,
+        "id": 1,
+        "chatbot_id": 1,
+        "type": 1,
+        "name": 1,
+        "url": 1,
+        "file_type": 1,
+        "file_size": 1,
+        "created_at": 1,
+        "status": 1,
+        "error_message": 1,
+    },
+    # Fields of the User model, minus admin-only bulk fields
+    "user.principal": {
+        **{field: 1 for field in User.model_fields if field not in ("internal_notes", "admin_notes")},
+        "_id": 0,
+    },
+    # Just enough to identify the caller and check its role
+    "user.identity": {"_id": 0, "id": 1, "email": 1, "role": 1, "status": 1},
+    # Owner column of admin listings
+    "user.owner_summary": {"_id": 0, "id": 1, "name": 1, "email": 1, "subscription.plan_id": 1},
+    # Chatbot ids per owner, for per-user statistics
+    "chatbot.owner_index": {"_id": 0, "id": 1, "user_id": 1, "created_at": 1},
+}
+
+
+def projection(view: str) -> Dict[str, int]:
+    """Look up a named projection (raises KeyError for unknown views)"""
+    return PROJECTIONS[view]
+
+
+class ChatbotRepository:
+    """Chatbot reads by use-case"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.chatbots
+
+    async def get(self, chatbot_id: str, view: str = "chatbot.chat_runtime") -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": chatbot_id}, projection(view))
+
+    async def get_chat_runtime(self, chatbot_id: str) -> Optional[Dict[str, Any]]:
+        """Chatbot settings needed to answer a message"""
+        return await self.get(chatbot_id, "chatbot.chat_runtime")
+
+    async def get_public_profile(self, chatbot_id: str) -> Optional[Dict[str, Any]]:
+        """Chatbot appearance settings for the public widget"""
+        return await self.get(chatbot_id, "chatbot.public_profile")
+
+    async def get_owned(
+        self,
+        chatbot_id: str,
+        user_id: str,
+        view: str = "chatbot.ownership"
+    ) -> Optional[Dict[str, Any]]:
+        """Chatbot if it belongs to the user, else None"""
+        return await self.collection.find_one({"id": chatbot_id, "user_id": user_id}, projection(view))
+
+
+class SourceRepository:
+    """Knowledge-base source reads by use-case"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.sources
+
+    async def list_for_chatbot(self, chatbot_id: str) -> List[Dict[str, Any]]:
+        """Sources of a chatbot without their extracted content"""
+        return await self.collection.find(
+            {"chatbot_id": chatbot_id}, projection("source.listing")
+        ).to_list(length=None)
+
+    async def has_completed_sources(self, chatbot_id: str) -> bool:
+        """Whether the chatbot has at least one processed source"""
+        doc = await self.collection.find_one(
+            {"chatbot_id": chatbot_id, "status": "completed"}, {"_id": 1}
+        )
+        return doc is not None
+
+
+class UserRepository:
+    """User reads by use-case"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.users
+
+    async def get_principal_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """User fields needed to build the authenticated User object"""
+        return await self.collection.find_one({"email": email}, projection("user.principal"))
+
+    async def get_identity_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """User fields needed to build the slim Principal object"""
+        return await self.collection.find_one({"email": email}, projection("user.identity"))
+
+
+class AdminStatsRepository:
+    """
+    Batched statistics for admin listings.
+
+    Every method answers for a whole page of chatbots or users at once: one
+    $in lookup or one grouped aggregation per collection, independent of the
+    number of rows, instead of a find_one/count_documents per row.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+
+    async def get_owners(self, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Owner summaries by user id"""
+        ids = list({user_id for user_id in user_ids if user_id})
+        if not ids:
+            return {}
+        cursor = self.db.users.find({"id": {"$in": ids}}, projection("user.owner_summary"))
+        return {user["id"]: user async for user in cursor}
+
+    async def count_by_chatbot(
+        self,
+        collection: str,
+        chatbot_ids: List[str],
+        match: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, int]:
+        """Documents per chatbot in a collection, from one grouped aggregation"""
+        if not chatbot_ids:
+            return {}
+        pipeline = [
+            {"$match": {"chatbot_id": {"$in": chatbot_ids}, **(match or {})}},
+            {"$group": {"_id": "$chatbot_id", "count": {"$sum": 1}}},
+        ]
+        return {doc["_id"]: doc["count"] async for doc in self.db[collection].aggregate(pipeline)}
+
+    async def get_integration_counts(self, chatbot_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """{chatbot_id: {"total", "active"}} integrations"""
+        if not chatbot_ids:
+            return {}
+        pipeline = [
+            {"$match": {"chatbot_id": {"$in": chatbot_ids}}},
+            {"$group": {
+                "_id": "$chatbot_id",
+                "total": {"$sum": 1},
+                "active": {"$sum": {"$cond": [{"$eq": ["$enabled", True]}, 1, 0]}},
+            }},
+        ]
+        return {
+            doc["_id"]: {"total": doc["total"], "active": doc["active"]}
+            async for doc in self.db.integrations.aggregate(pipeline)
+        }
+
+    async def get_last_message_times(self, chatbot_ids: List[str]) -> Dict[str, datetime]:
+        """Timestamp of the newest message per chatbot"""
+        if not chatbot_ids:
+            return {}
+        # Sorted like the (chatbot_id, timestamp) index, read backwards, so
+        # $first is answered from one index entry per chatbot
+        pipeline = [
+            {"$match": {"chatbot_id": {"$in": chatbot_ids}}},
+            {"$sort": {"chatbot_id": -1, "timestamp": -1}},
+            {"$group": {"_id": "$chatbot_id", "last": {"$first": "$timestamp"}}},
+        ]
+        return {doc["_id"]: doc["last"] async for doc in self.db.messages.aggregate(pipeline)}
+
+    async def get_chatbot_stats(self, chatbot_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-chatbot counts and last message time for a page of chatbots
+
+        Returns:
+            {chatbot_id: {"sources_count", "conversations_count", "messages_count",
+            "integrations_count", "active_integrations", "last_message_at"}}
+        """
+        sources, conversations, messages, integrations, last_messages = await asyncio.gather(
+            self.count_by_chatbot("sources", chatbot_ids),
+            self.count_by_chatbot("conversations", chatbot_ids),
+            self.count_by_chatbot("messages", chatbot_ids),
+            self.get_integration_counts(chatbot_ids),
+            self.get_last_message_times(chatbot_ids),
+        )
+        return {
+            chatbot_id: {
+                "sources_count": sources.get(chatbot_id, 0),
+                "conversations_count": conversations.get(chatbot_id, 0),
+                "messages_count": messages.get(chatbot_id, 0),
+                "integrations_count": integrations.get(chatbot_id, {}).get("total", 0),
+                "active_integrations": integrations.get(chatbot_id, {}).get("active", 0),
+                "last_message_at": last_messages.get(chatbot_id),
+            }
+            for chatbot_id in chatbot_ids
+        }
+
+    async def get_chatbots_by_owner(self, user_ids: Optional[Iterable[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Chatbots (id, created_at) per owner; every owner when user_ids is None"""
+        query: Dict[str, Any] = {}
+        if user_ids is not None:
+            query["user_id"] = {"$in": list(user_ids)}
+        by_owner: Dict[str, List[Dict[str, Any]]] = {}
+        async for bot in self.db.chatbots.find(query, projection("chatbot.owner_index")):
+            by_owner.setdefault(bot.get("user_id"), []).append(bot)
+        return by_owner
+
+    async def get_user_stats(
+        self,
+        user_ids: Optional[Iterable[str]] = None,
+        include: Iterable[str] = ("messages", "conversations", "sources", "last_message")
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-user totals over their chatbots
+
+        Args:
+            user_ids: Users to report (default: every user owning a chatbot)
+            include: Which of messages, conversations, sources and
+                last_message to compute; chatbot counts are always included
+
+        Returns:
+            {user_id: {"chatbots_count", "first_chatbot_at", "messages_count",
+            "conversations_count", "sources_count", "last_message_at"}}
+        """
+        user_ids = list(user_ids) if user_ids is not None else None
+        by_owner = await self.get_chatbots_by_owner(user_ids)
+        chatbot_ids = [bot["id"] for bots in by_owner.values() for bot in bots if bot.get("id")]
+
+        include = set(include)
+        counted = [name for name in ("messages", "conversations", "sources") if name in include]
+        results = await asyncio.gather(
+            *(self.count_by_chatbot(name, chatbot_ids) for name in counted),
+            self.get_last_message_times(chatbot_ids) if "last_message" in include else asyncio.sleep(0, result={}),
+        )
+        counts = dict(zip(counted, results[:-1]))
+        last_messages = results[-1]
+
+        stats = {}
+        for user_id in (user_ids if user_ids is not None else by_owner):
+            bots = by_owner.get(user_id, [])
+            ids = [bot.get("id") for bot in bots]
+            created = [bot["created_at"] for bot in bots if bot.get("created_at")]
+            last = [last_messages[bot_id] for bot_id in ids if last_messages.get(bot_id)]
+            stats[user_id] = {
+                "chatbots_count": len(bots),
+                # Older documents store created_at as an ISO string
+                "first_chatbot_at": min(created, key=str) if created else None,
+                "messages_count": sum(counts.get("messages", {}).get(bot_id, 0) for bot_id in ids),
+                "conversations_count": sum(counts.get("conversations", {}).get(bot_id, 0) for bot_id in ids),
+                "sources_count": sum(counts.get("sources", {}).get(bot_id, 0) for bot_id in ids),
+                "last_message_at": max(last) if last else None,
+            }
+        return stats
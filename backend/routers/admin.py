@@ -3,14 +3,18 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-import json
-import csv
-import io
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import Response
 import psutil
 import os
 from uuid import uuid4
+import asyncio
 import logging
+from auth import get_current_admin
+from services.cache_invalidation import cache_invalidation_bus
+from repositories import AdminStatsRepository
+from services.admin_metrics import admin_metrics
+from services.backup_service import backup_service
+from services.export_stream import FORMATS, conversations_with_messages, export_response, serialize
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 db_instance = None
@@ -127,7 +131,7 @@ class BulkEmail(BaseModel):
 
 
 @router.get("/stats")
-async def get_admin_stats() -> Dict[str, Any]:
+async def get_admin_stats(refresh: bool = Query(False, description="Recompute instead of serving the cached snapshot")) -> Dict[str, Any]:
     """
     Get admin dashboard statistics
     """
@@ -135,28 +139,8 @@ async def get_admin_stats() -> Dict[str, Any]:
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
             
-        # Get total users count from users collection
-        users_collection = db_instance['users']
-        total_users = await users_collection.count_documents({})
-        
-        # Get total chatbots count
-        chatbots_collection = db_instance['chatbots']
-        total_chatbots = await chatbots_collection.count_documents({})
-        
-        # Get total messages count
-        messages_collection = db_instance['messages']
-        total_messages = await messages_collection.count_documents({})
-        
-        # Get active integrations count
-        integrations_collection = db_instance['integrations']
-        active_integrations = await integrations_collection.count_documents({'enabled': True})
-        
-        return {
-            "totalUsers": total_users,
-            "activeChatbots": total_chatbots,
-            "totalMessages": total_messages,
-            "activeIntegrations": active_integrations
-        }
+        result = await admin_metrics.get(db_instance, "overview", refresh=refresh)
+        return {**result["metrics"], "snapshot": result["snapshot"]}
     except Exception as e:
         logger.error(f"Error in get_admin_stats: {str(e)}")
         return {
@@ -619,47 +603,20 @@ async def get_users_detailed():
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
             
-        chatbots_collection = db_instance['chatbots']
-        messages_collection = db_instance['messages']
-        conversations_collection = db_instance['conversations']
-        
-        # Get all unique users
-        user_ids = await chatbots_collection.distinct('user_id')
+        # Every chatbot owner with totals over their chatbots, batched
+        user_stats = await AdminStatsRepository(db_instance).get_user_stats(
+            include=("messages", "conversations")
+        )
         
         users_data = []
-        for user_id in user_ids:
-            # Count chatbots
-            chatbots_count = await chatbots_collection.count_documents({"user_id": user_id})
-            
-            # Get user's chatbots
-            user_chatbots = []
-            async for bot in chatbots_collection.find({"user_id": user_id}):
-                user_chatbots.append(bot.get('id'))
-            
-            # Count messages for user's chatbots
-            messages_count = 0
-            conversations_count = 0
-            if user_chatbots:
-                messages_count = await messages_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
-                conversations_count = await conversations_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
-            
-            # Get user's first chatbot creation date
-            first_chatbot = await chatbots_collection.find_one(
-                {"user_id": user_id},
-                sort=[("created_at", 1)]
-            )
-            
+        for user_id, stats in sorted(user_stats.items(), key=lambda item: str(item[0])):
             users_data.append({
                 "user_id": user_id,
                 "email": f"{user_id}@botsmith.co",  # Mock email
-                "chatbots_count": chatbots_count,
-                "messages_count": messages_count,
-                "conversations_count": conversations_count,
-                "created_at": first_chatbot.get('created_at') if first_chatbot else None,
+                "chatbots_count": stats["chatbots_count"],
+                "messages_count": stats["messages_count"],
+                "conversations_count": stats["conversations_count"],
+                "created_at": stats["first_chatbot_at"],
                 "plan": "Free",  # Default plan
                 "status": "active",
                 "max_chatbots": 1,
@@ -719,13 +676,15 @@ async def delete_user(user_id: str):
         
         # Delete user's chatbots
         chatbots_result = await chatbots_collection.delete_many({"user_id": user_id})
+        await cache_invalidation_bus.invalidate_chatbots(user_chatbots)
         
         # Delete the user from users collection
         user_result = await users_collection.delete_one({"id": user_id})
         
         if user_result.deleted_count == 0:
             raise HTTPException(status_code=404, detail=f"User {user_id} not found")
-        
+        await cache_invalidation_bus.invalidate_users([user_id])
+
         return {
             "success": True,
             "message": f"User {user_id} and all related data deleted successfully",
@@ -755,11 +714,6 @@ async def get_chatbots_detailed(
             raise HTTPException(status_code=500, detail="Database not initialized")
             
         chatbots_collection = db_instance['chatbots']
-        users_collection = db_instance['users']
-        sources_collection = db_instance['sources']
-        conversations_collection = db_instance['conversations']
-        messages_collection = db_instance['messages']
-        integrations_collection = db_instance['integrations']
         
         # Build filter query
         filter_query = {}
@@ -790,14 +744,20 @@ async def get_chatbots_detailed(
         cursor = chatbots_collection.find(filter_query).sort(sort_by, sort_direction).skip(skip).limit(limit)
         chatbots = await cursor.to_list(length=limit)
         
-        # Enrich with additional data
+        # Enrich with additional data: owners and statistics for the whole page at once
+        stats_repo = AdminStatsRepository(db_instance)
+        page_ids = [bot.get('id', bot.get('_id', '')) for bot in chatbots]
+        owners, chatbot_stats = await asyncio.gather(
+            stats_repo.get_owners(bot.get('user_id') for bot in chatbots),
+            stats_repo.get_chatbot_stats(page_ids)
+        )
+        
         enriched_chatbots = []
-        for bot in chatbots:
+        for bot, bot_id in zip(chatbots, page_ids):
             user_id = bot.get('user_id', '')
-            bot_id = bot.get('id', bot.get('_id', ''))
             
             # Get owner info
-            user = await users_collection.find_one({'id': user_id})
+            user = owners.get(user_id)
             owner_info = {
                 'id': user_id,
                 'name': user.get('name', 'Unknown') if user else 'Unknown',
@@ -806,18 +766,15 @@ async def get_chatbots_detailed(
             }
             
             # Get statistics
-            sources_count = await sources_collection.count_documents({'chatbot_id': bot_id})
-            conversations_count = await conversations_collection.count_documents({'chatbot_id': bot_id})
-            messages_count = await messages_collection.count_documents({'chatbot_id': bot_id})
-            integrations_count = await integrations_collection.count_documents({'chatbot_id': bot_id})
-            active_integrations = await integrations_collection.count_documents({'chatbot_id': bot_id, 'enabled': True})
+            stats = chatbot_stats[bot_id]
+            sources_count = stats['sources_count']
+            conversations_count = stats['conversations_count']
+            messages_count = stats['messages_count']
+            integrations_count = stats['integrations_count']
+            active_integrations = stats['active_integrations']
             
             # Calculate last activity
-            last_message = await messages_collection.find_one(
-                {'chatbot_id': bot_id},
-                sort=[('timestamp', -1)]
-            )
-            last_activity = last_message.get('timestamp') if last_message else bot.get('created_at')
+            last_activity = stats['last_message_at'] or bot.get('created_at')
             
             enriched_bot = {
                 'id': bot_id,
@@ -894,6 +851,7 @@ async def toggle_chatbot(chatbot_id: str):
             {"id": chatbot_id},
             {"$set": {"enabled": new_enabled, "updated_at": datetime.now().isoformat()}}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             "success": True,
@@ -915,6 +873,7 @@ async def bulk_chatbot_operations(operation: BulkOperation):
         
         if operation.operation == "delete":
             result = await chatbots_collection.delete_many({"id": {"$in": operation.ids}})
+            await cache_invalidation_bus.invalidate_chatbots(operation.ids)
             return {
                 "success": True,
                 "operation": "delete",
@@ -925,6 +884,7 @@ async def bulk_chatbot_operations(operation: BulkOperation):
                 {"id": {"$in": operation.ids}},
                 {"$set": {"enabled": True}}
             )
+            await cache_invalidation_bus.invalidate_chatbots(operation.ids)
             return {
                 "success": True,
                 "operation": "enable",
@@ -935,6 +895,7 @@ async def bulk_chatbot_operations(operation: BulkOperation):
                 {"id": {"$in": operation.ids}},
                 {"$set": {"enabled": False}}
             )
+            await cache_invalidation_bus.invalidate_chatbots(operation.ids)
             return {
                 "success": True,
                 "operation": "disable",
@@ -1080,6 +1041,7 @@ async def update_chatbot_settings(chatbot_id: str, update_data: dict):
             {'id': chatbot_id},
             {'$set': update_dict}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -1120,6 +1082,7 @@ async def delete_chatbot_and_data(chatbot_id: str):
         
         # Delete chatbot
         await chatbots_collection.delete_one({'id': chatbot_id})
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -1274,6 +1237,7 @@ async def transfer_ownership(chatbot_id: str, request: dict):
                 'updated_at': datetime.utcnow().isoformat()
             }}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -1289,25 +1253,32 @@ async def transfer_ownership(chatbot_id: str, request: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Chatbots enriched per owner lookup while streaming an export
+EXPORT_BATCH_SIZE = 500
+
+CHATBOT_EXPORT_FIELDS = [
+    'id', 'name', 'description', 'owner_name', 'owner_email', 'ai_provider', 'ai_model',
+    'enabled', 'public_access', 'created_at', 'updated_at'
+]
+
+
 @router.get("/chatbots/export")
-async def export_chatbots_data(format: str = Query("json")):
-    """Export all chatbots data"""
-    try:
-        if db_instance is None:
-            raise HTTPException(status_code=500, detail="Database not initialized")
-        
-        chatbots_collection = db_instance['chatbots']
-        users_collection = db_instance['users']
-        
-        # Get all chatbots
-        cursor = chatbots_collection.find({})
-        chatbots = await cursor.to_list(length=None)
-        
-        # Enrich with owner info
-        export_data = []
-        for bot in chatbots:
-            user = await users_collection.find_one({'id': bot.get('user_id')})
-            export_data.append({
+async def export_chatbots_data(format: str = Query("json"), gzip: bool = Query(False)):
+    """Export all chatbots data as JSON, NDJSON or CSV, streamed"""
+    if db_instance is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    
+    repository = AdminStatsRepository(db_instance)
+    
+    async def enrich(bots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # One owner lookup per batch of chatbots
+        owners = await repository.get_owners(bot.get('user_id') for bot in bots)
+        rows = []
+        for bot in bots:
+            user = owners.get(bot.get('user_id'))
+            rows.append({
                 'id': bot.get('id'),
                 'name': bot.get('name'),
                 'description': bot.get('description'),
@@ -1320,31 +1291,26 @@ async def export_chatbots_data(format: str = Query("json")):
                 'created_at': bot.get('created_at'),
                 'updated_at': bot.get('updated_at')
             })
-        
-        if format == "csv":
-            # Create CSV
-            output = io.StringIO()
-            if export_data:
-                writer = csv.DictWriter(output, fieldnames=export_data[0].keys())
-                writer.writeheader()
-                writer.writerows(export_data)
-            
-            return StreamingResponse(
-                iter([output.getvalue()]),
-                media_type="text/csv",
-                headers={"Content-Disposition": f"attachment; filename=chatbots_{datetime.utcnow().strftime('%Y%m%d')}.csv"}
-            )
-        else:
-            # Return JSON
-            from fastapi.responses import Response
-            return Response(
-                content=json.dumps(export_data, indent=2),
-                media_type="application/json",
-                headers={"Content-Disposition": f"attachment; filename=chatbots_{datetime.utcnow().strftime('%Y%m%d')}.json"}
-            )
-    except Exception as e:
-        logger.error(f"Error exporting chatbots: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return rows
+    
+    async def rows():
+        projection = {'_id': 0, **{field: 1 for field in CHATBOT_EXPORT_FIELDS}, 'user_id': 1}
+        batch = []
+        async for bot in db_instance['chatbots'].find({}, projection):
+            batch.append(bot)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                for row in await enrich(batch):
+                    yield row
+                batch = []
+        for row in await enrich(batch):
+            yield row
+    
+    return export_response(
+        serialize(rows(), format, CHATBOT_EXPORT_FIELDS),
+        format,
+        f"chatbots_{datetime.utcnow().strftime('%Y%m%d')}",
+        compress=gzip
+    )
 
 
 
@@ -1402,69 +1368,67 @@ async def get_all_conversations(
         return {"conversations": [], "total": 0}
 
 
+CONVERSATION_EXPORT_FIELDS = [
+    "conversation_id", "chatbot_id", "user_name", "user_email", "status", "created_at",
+    "role", "content", "timestamp"
+]
+
+
 @router.get("/conversations/export")
 async def export_conversations(
     format: str = "json",
-    chatbot_id: Optional[str] = None
+    chatbot_id: Optional[str] = None,
+    gzip: bool = False
 ):
-    """Export conversations to JSON or CSV"""
-    try:
-        if db_instance is None:
-            raise HTTPException(status_code=500, detail="Database not initialized")
-        
-        conversations_collection = db_instance['conversations']
-        messages_collection = db_instance['messages']
-        
-        # Get conversations
-        filter_dict = {}
-        if chatbot_id:
-            filter_dict["chatbot_id"] = chatbot_id
-        
-        export_data = []
-        async for conv in conversations_collection.find(filter_dict):
-            # Get messages for this conversation
-            messages = []
-            async for msg in messages_collection.find({"conversation_id": conv.get('id')}):
-                messages.append({
-                    "role": msg.get('role'),
-                    "content": msg.get('content'),
-                    "timestamp": msg.get('timestamp')
-                })
-            
-            export_data.append({
+    """Export conversations to JSON, NDJSON or CSV, streamed"""
+    if db_instance is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    
+    filter_dict = {}
+    if chatbot_id:
+        filter_dict["chatbot_id"] = chatbot_id
+    
+    async def rows():
+        async for conv, messages in conversations_with_messages(
+            db_instance,
+            filter_dict,
+            chatbot_ids=[chatbot_id] if chatbot_id else None,
+            message_projection={"role": 1, "content": 1, "timestamp": 1}
+        ):
+            conv_data = {
                 "conversation_id": conv.get('id'),
                 "chatbot_id": conv.get('chatbot_id'),
                 "user_name": conv.get('user_name'),
                 "user_email": conv.get('user_email'),
                 "status": conv.get('status'),
-                "created_at": conv.get('created_at'),
-                "messages": messages
-            })
-        
-        # Return based on format
-        if format == "csv":
-            # Convert to CSV format
-            csv_data = []
-            for conv in export_data:
-                for msg in conv['messages']:
-                    csv_data.append({
-                        "conversation_id": conv['conversation_id'],
-                        "chatbot_id": conv['chatbot_id'],
-                        "user_name": conv['user_name'],
-                        "user_email": conv['user_email'],
-                        "status": conv['status'],
-                        "created_at": conv['created_at'],
-                        "role": msg['role'],
-                        "content": msg['content'],
-                        "timestamp": msg['timestamp']
-                    })
-            return csv_data
-        else:
-            return export_data
-            
-    except Exception as e:
-        print(f"Error in export_conversations: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+                "created_at": conv.get('created_at')
+            }
+            if format == "csv":
+                # One row per message
+                for msg in messages:
+                    yield {
+                        **conv_data,
+                        "role": msg.get('role'),
+                        "content": msg.get('content'),
+                        "timestamp": msg.get('timestamp')
+                    }
+            else:
+                yield {
+                    **conv_data,
+                    "messages": [
+                        {"role": msg.get('role'), "content": msg.get('content'), "timestamp": msg.get('timestamp')}
+                        for msg in messages
+                    ]
+                }
+    
+    return export_response(
+        serialize(rows(), format, CONVERSATION_EXPORT_FIELDS),
+        format,
+        f"conversations_{datetime.utcnow().strftime('%Y%m%d')}",
+        compress=gzip
+    )
 
 
 # ==================== REVENUE & BILLING ====================
@@ -1700,6 +1664,8 @@ async def suspend_user(user_id: str):
             {"user_id": user_id},
             {"$set": {"enabled": False, "status": "suspended"}}
         )
+        chatbot_ids = await chatbots_collection.distinct("id", {"user_id": user_id})
+        await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         
         return {
             "success": True,
@@ -1724,6 +1690,8 @@ async def activate_user(user_id: str):
             {"user_id": user_id},
             {"$set": {"enabled": True, "status": "active"}}
         )
+        chatbot_ids = await chatbots_collection.distinct("id", {"user_id": user_id})
+        await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         
         return {
             "success": True,
@@ -1988,36 +1956,88 @@ async def get_email_templates():
 
 
 # ==================== BACKUP & EXPORT ====================
-@router.get("/backup/database")
-async def backup_database():
-    """Create database backup"""
+@router.post("/backup/database", dependencies=[Depends(get_current_admin)])
+async def backup_database(
+    incremental: bool = Query(False, description="Only back up what changed since the latest backup"),
+    format: str = Query("bson", pattern="^(bson|ndjson)$")
+):
+    """Start a database backup to compressed archive files on the server"""
+    if db_instance is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    
+    job_id = backup_service.start_job(
+        "backup",
+        backup_service.backup(db_instance, incremental=incremental, format=format)
+    )
+    return {"success": True, "job_id": job_id, "status": "running"}
+
+
+@router.get("/backups", dependencies=[Depends(get_current_admin)])
+async def list_backups():
+    """List completed backups and recent backup/restore jobs"""
+    backups = backup_service.list_backups()
+    return {
+        "backups": [
+            {key: manifest[key] for key in ("id", "type", "base", "format", "started_at", "documents", "bytes")}
+            for manifest in reversed(backups)
+        ],
+        "jobs": list(backup_service.jobs.values()),
+        "total": len(backups)
+    }
+
+
+@router.get("/backups/jobs/{job_id}", dependencies=[Depends(get_current_admin)])
+async def get_backup_job(job_id: str):
+    """Status of a backup or restore job"""
+    job = backup_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/backups/{backup_id}", dependencies=[Depends(get_current_admin)])
+async def get_backup(backup_id: str):
+    """Manifest of a backup: files, document counts and checksums"""
     try:
-        if db_instance is None:
-            raise HTTPException(status_code=500, detail="Database not initialized")
-        
-        # Get all data
-        backup_data = {}
-        
-        for collection_name in ['chatbots', 'sources', 'conversations', 'messages']:
-            collection = db_instance[collection_name]
-            data = []
-            async for doc in collection.find({}):
-                # Remove _id field for JSON serialization
-                doc.pop('_id', None)
-                data.append(doc)
-            backup_data[collection_name] = data
-        
-        backup_data['backup_timestamp'] = datetime.now().isoformat()
-        backup_data['version'] = '1.0'
-        
-        return {
-            "success": True,
-            "backup": backup_data,
-            "collections": len(backup_data) - 2,  # Minus timestamp and version
-            "total_documents": sum(len(v) for k, v in backup_data.items() if isinstance(v, list))
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return backup_service.get_manifest(backup_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/backups/{backup_id}/verify", dependencies=[Depends(get_current_admin)])
+async def verify_backup(backup_id: str, deep: bool = Query(False, description="Also decompress and count documents")):
+    """Check a backup's files against the checksums in its manifest"""
+    try:
+        return await backup_service.verify(backup_id, deep=deep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/backups/{backup_id}/restore", dependencies=[Depends(get_current_admin)])
+async def restore_backup(
+    backup_id: str,
+    collections: Optional[List[str]] = Query(None),
+    workers: int = Query(4, ge=1, le=32)
+):
+    """Start restoring a backup (and the backups it builds on) into the database"""
+    if db_instance is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    try:
+        backup_service.chain(backup_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    job_id = backup_service.start_job(
+        "restore",
+        backup_service.restore(db_instance, backup_id, collections=collections, workers=workers)
+    )
+    return {"success": True, "job_id": job_id, "status": "running"}
 
 
 # ==================== CHATBOT ADVANCED MANAGEMENT ====================
@@ -2245,40 +2265,14 @@ async def get_real_time_activity():
 
 # ==================== DATABASE MANAGEMENT ====================
 @router.get("/database/stats")
-async def get_database_stats():
+async def get_database_stats(refresh: bool = Query(False, description="Recompute instead of serving the cached snapshot")):
     """Get detailed database statistics"""
     try:
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
         
-        stats = {
-            "chatbots": await db_instance['chatbots'].count_documents({}),
-            "sources": await db_instance['sources'].count_documents({}),
-            "conversations": await db_instance['conversations'].count_documents({}),
-            "messages": await db_instance['messages'].count_documents({}),
-            "plans": await db_instance['plans'].count_documents({}) if 'plans' in await db_instance.list_collection_names() else 0
-        }
-        
-        # Get collection sizes
-        collections_info = []
-        for collection_name in ['chatbots', 'sources', 'conversations', 'messages']:
-            try:
-                coll_stats = await db_instance.command("collStats", collection_name)
-                collections_info.append({
-                    "name": collection_name,
-                    "count": coll_stats.get('count', 0),
-                    "size": coll_stats.get('size', 0),
-                    "avgObjSize": coll_stats.get('avgObjSize', 0)
-                })
-            except Exception as e:
-                print(f"Error fetching stats for {collection_name}: {str(e)}")
-                pass
-        
-        return {
-            "counts": stats,
-            "collections": collections_info,
-            "total_documents": sum(stats.values())
-        }
+        result = await admin_metrics.get(db_instance, "database", refresh=refresh)
+        return {**result["metrics"], "snapshot": result["snapshot"]}
     except Exception as e:
         print(f"Error in get_database_stats: {str(e)}")
         return {
@@ -2343,49 +2337,24 @@ async def get_users_enhanced(
             raise HTTPException(status_code=500, detail="Database not initialized")
         
         users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
-        messages_collection = db_instance['messages']
-        conversations_collection = db_instance['conversations']
-        sources_collection = db_instance['sources']
         
         # Get all users from the users collection
         all_users = await users_collection.find({}).to_list(length=1000)
         
+        # Totals over each user's chatbots, batched for all users
+        user_stats = await AdminStatsRepository(db_instance).get_user_stats(
+            [user.get('id') for user in all_users]
+        )
+        
         users_data = []
         for user in all_users:
             user_id = user.get('id')
-            
-            # Count chatbots for this user
-            chatbots_count = await chatbots_collection.count_documents({"user_id": user_id})
-            
-            # Get user's chatbot IDs
-            user_chatbots = []
-            async for bot in chatbots_collection.find({"user_id": user_id}, {"id": 1}):
-                user_chatbots.append(bot.get('id'))
-            
-            messages_count = 0
-            conversations_count = 0
-            sources_count = 0
-            last_message_time = None
-            
-            if user_chatbots:
-                messages_count = await messages_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
-                conversations_count = await conversations_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
-                sources_count = await sources_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
-                
-                # Get last message time
-                last_message = await messages_collection.find_one(
-                    {"chatbot_id": {"$in": user_chatbots}},
-                    sort=[("timestamp", -1)]
-                )
-                if last_message:
-                    last_message_time = last_message.get('timestamp')
+            stats = user_stats[user_id]
+            chatbots_count = stats["chatbots_count"]
+            messages_count = stats["messages_count"]
+            conversations_count = stats["conversations_count"]
+            sources_count = stats["sources_count"]
+            last_message_time = stats["last_message_at"]
             
             users_data.append({
                 "user_id": user_id,
@@ -2596,8 +2565,10 @@ async def bulk_user_action(action_data: dict):
         elif action == 'delete':
             # In real app, delete users and their data
             chatbots_collection = db_instance['chatbots']
+            chatbot_ids = await chatbots_collection.distinct("id", {"user_id": {"$in": user_ids}})
             for user_id in user_ids:
                 await chatbots_collection.delete_many({"user_id": user_id})
+            await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         
         return {
             "success": True,
@@ -2724,10 +2695,8 @@ async def get_user_segments():
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
         
-        chatbots_collection = db_instance['chatbots']
-        messages_collection = db_instance['messages']
-        
-        user_ids = await chatbots_collection.distinct('user_id')
+        # Chatbot and message totals of every chatbot owner, batched
+        user_stats = await AdminStatsRepository(db_instance).get_user_stats(include=("messages",))
         
         segments = {
             "power_users": [],
@@ -2736,18 +2705,9 @@ async def get_user_segments():
             "champions": []
         }
         
-        for user_id in user_ids:
-            chatbots_count = await chatbots_collection.count_documents({"user_id": user_id})
-            
-            user_chatbots = []
-            async for bot in chatbots_collection.find({"user_id": user_id}):
-                user_chatbots.append(bot.get('id'))
-            
-            messages_count = 0
-            if user_chatbots:
-                messages_count = await messages_collection.count_documents(
-                    {"chatbot_id": {"$in": user_chatbots}}
-                )
+        for user_id, stats in sorted(user_stats.items(), key=lambda item: str(item[0])):
+            chatbots_count = stats["chatbots_count"]
+            messages_count = stats["messages_count"]
             
             # Segment logic
             if messages_count > 100 or chatbots_count > 3:
@@ -7,8 +7,11 @@ import json
 import csv
 import io
 from fastapi.responses import StreamingResponse
+import asyncio
 import logging
 from uuid import uuid4
+from services.cache_invalidation import cache_invalidation_bus
+from repositories import AdminStatsRepository
 
 router = APIRouter(prefix="/admin/chatbots", tags=["Admin Chatbots"])
 db_instance = None
@@ -86,11 +89,6 @@ async def get_all_chatbots_detailed(
         
         # Get chatbots collection
         chatbots_collection = db_instance['chatbots']
-        users_collection = db_instance['users']
-        sources_collection = db_instance['sources']
-        conversations_collection = db_instance['conversations']
-        messages_collection = db_instance['messages']
-        integrations_collection = db_instance['integrations']
         
         # Count total
         total_count = await chatbots_collection.count_documents(filter_query)
@@ -102,14 +100,20 @@ async def get_all_chatbots_detailed(
         cursor = chatbots_collection.find(filter_query).sort(sort_by, sort_direction).skip(skip).limit(limit)
         chatbots = await cursor.to_list(length=limit)
         
-        # Enrich with additional data
+        # Enrich with additional data: owners and statistics for the whole page at once
+        stats_repo = AdminStatsRepository(db_instance)
+        page_ids = [bot.get('id', bot.get('_id', '')) for bot in chatbots]
+        owners, chatbot_stats = await asyncio.gather(
+            stats_repo.get_owners(bot.get('user_id') for bot in chatbots),
+            stats_repo.get_chatbot_stats(page_ids)
+        )
+        
         enriched_chatbots = []
-        for bot in chatbots:
+        for bot, bot_id in zip(chatbots, page_ids):
             user_id = bot.get('user_id', '')
-            bot_id = bot.get('id', bot.get('_id', ''))
             
             # Get owner info
-            user = await users_collection.find_one({'id': user_id})
+            user = owners.get(user_id)
             owner_info = {
                 'id': user_id,
                 'name': user.get('name', 'Unknown') if user else 'Unknown',
@@ -118,18 +122,15 @@ async def get_all_chatbots_detailed(
             }
             
             # Get statistics
-            sources_count = await sources_collection.count_documents({'chatbot_id': bot_id})
-            conversations_count = await conversations_collection.count_documents({'chatbot_id': bot_id})
-            messages_count = await messages_collection.count_documents({'chatbot_id': bot_id})
-            integrations_count = await integrations_collection.count_documents({'chatbot_id': bot_id})
-            active_integrations = await integrations_collection.count_documents({'chatbot_id': bot_id, 'enabled': True})
+            stats = chatbot_stats[bot_id]
+            sources_count = stats['sources_count']
+            conversations_count = stats['conversations_count']
+            messages_count = stats['messages_count']
+            integrations_count = stats['integrations_count']
+            active_integrations = stats['active_integrations']
             
             # Calculate last activity
-            last_message = await messages_collection.find_one(
-                {'chatbot_id': bot_id},
-                sort=[('timestamp', -1)]
-            )
-            last_activity = last_message.get('timestamp') if last_message else bot.get('created_at')
+            last_activity = stats['last_message_at'] or bot.get('created_at')
             
             enriched_bot = {
                 'id': bot_id,
@@ -333,6 +334,7 @@ async def update_chatbot(chatbot_id: str, update_data: ChatbotUpdateRequest) ->
                 'message': 'No changes made',
                 'modified': False
             }
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         # Log activity
         activity_log = {
@@ -386,6 +388,7 @@ async def toggle_chatbot(chatbot_id: str) -> Dict[str, Any]:
                 'updated_at': datetime.utcnow().isoformat()
             }}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -459,6 +462,8 @@ async def bulk_operations(request: BulkOperationRequest) -> Dict[str, Any]:
         else:
             raise HTTPException(status_code=400, detail=f"Unknown operation: {request.operation}")
         
+        await cache_invalidation_bus.invalidate_chatbots(request.ids)
+        
         return {
             'success': True,
             'operation': request.operation,
@@ -501,6 +506,7 @@ async def delete_chatbot(chatbot_id: str) -> Dict[str, Any]:
         
         # Delete chatbot
         await chatbots_collection.delete_one({'id': chatbot_id})
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -691,6 +697,7 @@ async def transfer_chatbot_ownership(
                 'updated_at': datetime.utcnow().isoformat()
             }}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         return {
             'success': True,
@@ -717,16 +724,16 @@ async def export_all_chatbots(format: str = Query("json")) -> Response:
             raise HTTPException(status_code=500, detail="Database not initialized")
         
         chatbots_collection = db_instance['chatbots']
-        users_collection = db_instance['users']
         
         # Get all chatbots
         cursor = chatbots_collection.find({})
         chatbots = await cursor.to_list(length=None)
         
-        # Enrich with owner info
+        # Enrich with owner info (one lookup for all owners)
+        owners = await AdminStatsRepository(db_instance).get_owners(bot.get('user_id') for bot in chatbots)
         export_data = []
         for bot in chatbots:
-            user = await users_collection.find_one({'id': bot.get('user_id')})
+            user = owners.get(bot.get('user_id'))
             export_data.append({
                 'id': bot.get('id'),
                 'name': bot.get('name'),
@@ -6,22 +6,13 @@ Handles system-wide settings management
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
 from datetime import datetime
 import logging
-import os
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-
-def get_database():
-    client = AsyncIOMotorClient(MONGO_URL)
-    return client[DB_NAME]
-
 # ========================================
 # MODELS
 # ========================================
@@ -7,16 +7,18 @@ from models import (
     User, AdminUserUpdate, PasswordReset, LoginHistory, LoginHistoryResponse,
     ActivityLog, ActivityLogResponse, BulkUserOperation
 )
-from passlib.context import CryptContext
+from auth import get_password_hash_async
+from services.cache_invalidation import cache_invalidation_bus
+from repositories import AdminStatsRepository
+from services.admin_metrics import admin_metrics
+from services.export_stream import export_response, json_object, ndjson_records
 import logging
 import uuid
-import json
 import io
 import csv
 
 router = APIRouter(prefix="/admin/users", tags=["admin-users"])
 db_instance = None
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 logger = logging.getLogger(__name__)
 
@@ -75,10 +77,6 @@ async def get_enhanced_users(
         if total_users == 0:
             return {"success": True, "users": [], "total": 0, "message": "No users in database", "debug": "count is zero"}
         
-        chatbots_collection = db_instance['chatbots']
-        messages_collection = db_instance['messages']
-        sources_collection = db_instance['sources']
-        
         # Build query
         query = {}
         if status:
@@ -95,32 +93,18 @@ async def get_enhanced_users(
         sort_direction = -1 if sortOrder == "desc" else 1
         users = await users_collection.find(query).sort(sortBy, sort_direction).to_list(length=1000)
         
-        # Enhance with statistics
+        # Enhance with statistics (batched for all listed users)
+        user_stats = await AdminStatsRepository(db_instance).get_user_stats(
+            [user.get('id') for user in users],
+            include=("messages", "sources")
+        )
+        
         enhanced_users = []
         for user in users:
-            user_id = user.get('id')
-            
-            # Count chatbots
-            chatbots_count = await chatbots_collection.count_documents({'user_id': user_id})
-            
-            # Get all chatbot IDs for this user first
-            user_chatbot_ids = []
-            async for bot in chatbots_collection.find({'user_id': user_id}, {'id': 1}):
-                user_chatbot_ids.append(bot['id'])
-            
-            # Count messages for all chatbots
-            messages_count = 0
-            if user_chatbot_ids:
-                messages_count = await messages_collection.count_documents({
-                    'chatbot_id': {'$in': user_chatbot_ids}
-                })
-            
-            # Count sources for all chatbots
-            sources_count = 0
-            if user_chatbot_ids:
-                sources_count = await sources_collection.count_documents({
-                    'chatbot_id': {'$in': user_chatbot_ids}
-                })
+            stats = user_stats[user.get('id')]
+            chatbots_count = stats['chatbots_count']
+            messages_count = stats['messages_count']
+            sources_count = stats['sources_count']
             
             enhanced_users.append({
                 'user_id': user.get('id'),
@@ -215,6 +199,7 @@ async def update_user(user_id: str, update_data: AdminUserUpdate):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -259,12 +244,14 @@ async def delete_user(user_id: str):
             await messages_collection.delete_many({'chatbot_id': {'$in': chatbot_ids}})
             await conversations_collection.delete_many({'chatbot_id': {'$in': chatbot_ids}})
             await chatbots_collection.delete_many({'user_id': user_id})
+            await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         
         # Delete user
         result = await users_collection.delete_one({'id': user_id})
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -296,7 +283,7 @@ async def reset_user_password(user_id: str, password_data: PasswordReset):
         users_collection = db_instance['users']
         
         # Hash new password
-        hashed_password = pwd_context.hash(password_data.new_password)
+        hashed_password = await get_password_hash_async(password_data.new_password)
         
         result = await users_collection.update_one(
             {'id': user_id},
@@ -308,6 +295,7 @@ async def reset_user_password(user_id: str, password_data: PasswordReset):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -523,6 +511,7 @@ async def bulk_user_operation(operation: BulkUserOperation):
                 }}
             )
             results["processed"] = result.modified_count
+            await cache_invalidation_bus.invalidate_users(operation.user_ids)
             
             # Log activity
             await log_activity(
@@ -544,6 +533,7 @@ async def bulk_user_operation(operation: BulkUserOperation):
                 }}
             )
             results["processed"] = result.modified_count
+            await cache_invalidation_bus.invalidate_users(operation.user_ids)
             
             # Log activity
             await log_activity(
@@ -690,7 +680,7 @@ async def create_user(user_data: dict):
         
         # Create user
         user_id = str(uuid.uuid4())
-        hashed_password = pwd_context.hash(password)
+        hashed_password = await get_password_hash_async(password)
         
         new_user = {
             'id': user_id,
@@ -775,70 +765,27 @@ async def create_user(user_data: dict):
 
 
 @router.get("/{user_id}/export-data")
-async def export_user_data(user_id: str):
+async def export_user_data(
+    user_id: str,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    gzip: bool = False
+):
     """
-    Export all user data (GDPR compliance)
+    Export all user data (GDPR compliance), streamed
     """
     try:
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
         
         users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
-        sources_collection = db_instance['sources']
-        conversations_collection = db_instance['conversations']
-        messages_collection = db_instance['messages']
         subscriptions_collection = db_instance['subscriptions']
         
         # Get user
-        user = await users_collection.find_one({'id': user_id})
+        user = await users_collection.find_one({'id': user_id}, {'_id': 0, 'password_hash': 0})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Remove sensitive data
-        user.pop('password_hash', None)
-        user.pop('_id', None)
-        
-        # Get all related data
-        chatbots = await chatbots_collection.find({'user_id': user_id}).to_list(length=1000)
-        chatbot_ids = [bot['id'] for bot in chatbots]
-        
-        sources = []
-        conversations = []
-        messages = []
-        
-        if chatbot_ids:
-            sources = await sources_collection.find({'chatbot_id': {'$in': chatbot_ids}}).to_list(length=10000)
-            conversations = await conversations_collection.find({'chatbot_id': {'$in': chatbot_ids}}).to_list(length=10000)
-            messages = await messages_collection.find({'chatbot_id': {'$in': chatbot_ids}}).to_list(length=100000)
-        
-        subscription = await subscriptions_collection.find_one({'user_id': user_id})
-        
-        # Clean MongoDB _id fields
-        for item in chatbots + sources + conversations + messages:
-            item.pop('_id', None)
-        if subscription:
-            subscription.pop('_id', None)
-        
-        # Compile all data
-        user_data = {
-            'user': user,
-            'subscription': subscription,
-            'chatbots': chatbots,
-            'sources': sources,
-            'conversations': conversations,
-            'messages': messages,
-            'export_date': datetime.now(timezone.utc).isoformat(),
-            'total_counts': {
-                'chatbots': len(chatbots),
-                'sources': len(sources),
-                'conversations': len(conversations),
-                'messages': len(messages)
-            }
-        }
-        
-        # Create JSON file
-        json_str = json.dumps(user_data, indent=2, default=str)
+        subscription = await subscriptions_collection.find_one({'user_id': user_id}, {'_id': 0})
         
         # Log activity
         await log_activity(
@@ -849,13 +796,9 @@ async def export_user_data(user_id: str):
             details=f"Exported all data for user: {user.get('email')}"
         )
         
-        return StreamingResponse(
-            io.BytesIO(json_str.encode()),
-            media_type="application/json",
-            headers={
-                "Content-Disposition": f"attachment; filename=user_{user_id}_data.json"
-            }
-        )
+        fields = _user_export_fields(user, subscription)
+        pieces = json_object(fields) if format == "json" else ndjson_records(fields)
+        return export_response(pieces, format, f"user_{user_id}_data", compress=gzip)
     
     except HTTPException:
         raise
@@ -864,6 +807,34 @@ async def export_user_data(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _user_export_fields(user: Dict[str, Any], subscription: Optional[Dict[str, Any]]):
+    """
+    Sections of a user data export, in order
+
+    Each collection is yielded as a cursor and streamed by the caller
+    before the next section is pulled, so the chatbot ids are complete
+    when the sources, conversations and messages cursors are opened, and
+    the counts are final when total_counts is yielded.
+    """
+    counts = {'chatbots': 0, 'sources': 0, 'conversations': 0, 'messages': 0}
+    chatbot_ids: List[str] = []
+    
+    async def documents(name: str, cursor):
+        async for doc in cursor:
+            counts[name] += 1
+            if name == 'chatbots':
+                chatbot_ids.append(doc['id'])
+            yield doc
+    
+    yield 'user', user
+    yield 'subscription', subscription
+    yield 'chatbots', documents('chatbots', db_instance['chatbots'].find({'user_id': user['id']}, {'_id': 0}))
+    for name in ('sources', 'conversations', 'messages'):
+        yield name, documents(name, db_instance[name].find({'chatbot_id': {'$in': chatbot_ids}}, {'_id': 0}))
+    yield 'export_date', datetime.now(timezone.utc).isoformat()
+    yield 'total_counts', counts
+
+
 @router.post("/{user_id}/suspend")
 async def suspend_user(user_id: str, suspension_data: dict):
     """
@@ -897,6 +868,7 @@ async def suspend_user(user_id: str, suspension_data: dict):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -943,6 +915,7 @@ async def unsuspend_user(user_id: str):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -987,6 +960,7 @@ async def ban_user(user_id: str, ban_data: dict):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -1029,6 +1003,7 @@ async def unban_user(user_id: str):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         # Log activity
         await log_activity(
@@ -1171,7 +1146,6 @@ async def advanced_user_search(
             raise HTTPException(status_code=500, detail="Database not initialized")
         
         users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
         
         # Build query
         query = {}
@@ -1202,9 +1176,12 @@ async def advanced_user_search(
         
         # Filter by chatbot ownership if requested
         if has_chatbots is not None:
+            chatbots_by_owner = await AdminStatsRepository(db_instance).get_chatbots_by_owner(
+                [user['id'] for user in users]
+            )
             filtered_users = []
             for user in users:
-                chatbot_count = await chatbots_collection.count_documents({'user_id': user['id']})
+                chatbot_count = len(chatbots_by_owner.get(user['id'], []))
                 if (has_chatbots and chatbot_count > 0) or (not has_chatbots and chatbot_count == 0):
                     filtered_users.append(user)
             users = filtered_users
@@ -1236,7 +1213,6 @@ async def export_all_users_csv():
             raise HTTPException(status_code=500, detail="Database not initialized")
         
         users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
         
         users = await users_collection.find({}).to_list(length=10000)
         
@@ -1252,8 +1228,11 @@ async def export_all_users_csv():
         ])
         
         # Write data
+        chatbots_by_owner = await AdminStatsRepository(db_instance).get_chatbots_by_owner(
+            [user['id'] for user in users]
+        )
         for user in users:
-            chatbot_count = await chatbots_collection.count_documents({'user_id': user['id']})
+            chatbot_count = len(chatbots_by_owner.get(user['id'], []))
             writer.writerow([
                 user.get('id', ''),
                 user.get('name', ''),
@@ -1295,7 +1274,7 @@ async def export_all_users_csv():
 
 
 @router.get("/statistics/overview")
-async def get_users_statistics():
+async def get_users_statistics(refresh: bool = Query(False, description="Recompute instead of serving the cached snapshot")):
     """
     Get comprehensive statistics about all users
     """
@@ -1303,112 +1282,11 @@ async def get_users_statistics():
         if db_instance is None:
             raise HTTPException(status_code=500, detail="Database not initialized")
         
-        users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
-        subscriptions_collection = db_instance['subscriptions']
-        
-        # Total users
-        total_users = await users_collection.count_documents({})
-        
-        # Users by status
-        active_users = await users_collection.count_documents({'status': 'active'})
-        suspended_users = await users_collection.count_documents({'status': 'suspended'})
-        banned_users = await users_collection.count_documents({'status': 'banned'})
-        
-        # Users by role
-        admin_users = await users_collection.count_documents({'role': 'admin'})
-        moderator_users = await users_collection.count_documents({'role': 'moderator'})
-        regular_users = await users_collection.count_documents({'role': 'user'})
-        
-        # Recent activity - handle both datetime objects and ISO string dates
-        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Convert to ISO strings for comparison (since dates are stored as strings)
-        today_str = today.isoformat()
-        week_ago_str = week_ago.isoformat()
-        month_ago_str = month_ago.isoformat()
-        
-        # Try both datetime and string comparison
-        new_today = await users_collection.count_documents({
-            '$or': [
-                {'created_at': {'$gte': today}},
-                {'created_at': {'$gte': today_str}}
-            ]
-        })
-        new_this_week = await users_collection.count_documents({
-            '$or': [
-                {'created_at': {'$gte': week_ago}},
-                {'created_at': {'$gte': week_ago_str}}
-            ]
-        })
-        new_this_month = await users_collection.count_documents({
-            '$or': [
-                {'created_at': {'$gte': month_ago}},
-                {'created_at': {'$gte': month_ago_str}}
-            ]
-        })
-        
-        active_today = await users_collection.count_documents({
-            '$or': [
-                {'last_login': {'$gte': today}},
-                {'last_login': {'$gte': today_str}}
-            ]
-        })
-        active_this_week = await users_collection.count_documents({
-            '$or': [
-                {'last_login': {'$gte': week_ago}},
-                {'last_login': {'$gte': week_ago_str}}
-            ]
-        })
-        
-        # Subscription stats
-        free_plan = await subscriptions_collection.count_documents({'plan_id': 'free'})
-        starter_plan = await subscriptions_collection.count_documents({'plan_id': 'starter'})
-        professional_plan = await subscriptions_collection.count_documents({'plan_id': 'professional'})
-        enterprise_plan = await subscriptions_collection.count_documents({'plan_id': 'enterprise'})
-        
-        # Total chatbots
-        total_chatbots = await chatbots_collection.count_documents({})
-        
-        # Email verification
-        verified_emails = await users_collection.count_documents({'email_verified': True})
-        unverified_emails = await users_collection.count_documents({'email_verified': False})
-        
+        result = await admin_metrics.get(db_instance, "users", refresh=refresh)
         return {
             "success": True,
-            "statistics": {
-                "total_users": total_users,
-                "by_status": {
-                    "active": active_users,
-                    "suspended": suspended_users,
-                    "banned": banned_users
-                },
-                "by_role": {
-                    "admin": admin_users,
-                    "moderator": moderator_users,
-                    "user": regular_users
-                },
-                "activity": {
-                    "new_today": new_today,
-                    "new_this_week": new_this_week,
-                    "new_this_month": new_this_month,
-                    "active_today": active_today,
-                    "active_this_week": active_this_week
-                },
-                "subscriptions": {
-                    "free": free_plan,
-                    "starter": starter_plan,
-                    "professional": professional_plan,
-                    "enterprise": enterprise_plan
-                },
-                "total_chatbots": total_chatbots,
-                "email_verification": {
-                    "verified": verified_emails,
-                    "unverified": unverified_emails
-                }
-            }
+            "statistics": result["metrics"],
+            "snapshot": result["snapshot"]
         }
     
     except Exception as e:
@@ -1691,6 +1569,8 @@ async def ultimate_update_user(user_id: str, update_data: Dict[str, Any]):
         )
         
         if result.modified_count > 0 or result.matched_count > 0:
+            await cache_invalidation_bus.invalidate_users([user_id])
+
             # CRITICAL FIX: Update subscription plan_id if changed
             if "plan_id" in update_data:
                 subscriptions_collection = db_instance['subscriptions']
@@ -9,6 +9,9 @@ from models import (
     UserNote, ImpersonationSession, ImpersonationRequest
 )
 from passlib.context import CryptContext
+from services.cache_invalidation import cache_invalidation_bus
+from repositories import AdminStatsRepository
+from services.churn_scoring import churn_scoring
 import logging
 import json
 from collections import defaultdict
@@ -86,8 +89,6 @@ async def advanced_user_search(
     
     try:
         users_collection = db_instance['users']
-        chatbots_collection = db_instance['chatbots']
-        messages_collection = db_instance['messages']
         
         # Build complex query
         query = {}
@@ -177,25 +178,17 @@ async def advanced_user_search(
         sort_direction = -1 if sortOrder == "desc" else 1
         users = await users_collection.find(query).sort(sortBy, sort_direction).skip(skip).limit(limit).to_list(length=limit)
         
-        # Enhance with statistics
+        # Enhance with statistics (batched for the whole page)
+        user_stats = await AdminStatsRepository(db_instance).get_user_stats(
+            [user.get('id') for user in users],
+            include=("messages",)
+        )
+        
         enhanced_users = []
         for user in users:
-            user_id = user.get('id')
-            
-            # Count chatbots
-            chatbots_count = await chatbots_collection.count_documents({'user_id': user_id})
-            
-            # Get chatbot IDs
-            user_chatbot_ids = []
-            async for bot in chatbots_collection.find({'user_id': user_id}, {'id': 1}):
-                user_chatbot_ids.append(bot['id'])
-            
-            # Count messages
-            messages_count = 0
-            if user_chatbot_ids:
-                messages_count = await messages_collection.count_documents({
-                    'chatbot_id': {'$in': user_chatbot_ids}
-                })
+            stats = user_stats[user.get('id')]
+            chatbots_count = stats['chatbots_count']
+            messages_count = stats['messages_count']
             
             # Filter by chatbots/messages if specified
             if chatbots_min is not None and chatbots_count < chatbots_min:
@@ -796,82 +789,66 @@ async def get_lifecycle_analytics():
 
 
 @router.post("/calculate-churn-risk")
-async def calculate_churn_risk_scores():
+async def calculate_churn_risk_scores(
+    model: Optional[str] = Query(None, description="Scoring model (default: the configured one)"),
+    wait: bool = Query(False, description="Wait for the run to finish instead of running it in the background")
+):
     """
     Calculate churn risk scores for all users based on activity
-    This is a simple algorithm - can be enhanced with ML models
+    
+    Scoring runs in pages as a background job (see services/churn_scoring.py);
+    follow it with GET /churn-risk/progress.
     """
     if db_instance is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
+    if model is not None and model not in churn_scoring.models:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model '{model}'. Available: {', '.join(churn_scoring.models)}"
+        )
     
     try:
-        users_collection = db_instance['users']
-        
-        users = await users_collection.find({}).to_list(length=10000)
-        updated_count = 0
-        
-        for user in users:
-            risk_score = 0.0
-            
-            # Factor 1: Last active date (40% weight)
-            last_active = user.get('last_active') or user.get('last_login')
-            if last_active:
-                days_inactive = (datetime.now(timezone.utc) - last_active).days
-                if days_inactive > 30:
-                    risk_score += 0.4 * min(days_inactive / 90, 1.0)
-            else:
-                risk_score += 0.4
-            
-            # Factor 2: Login frequency (30% weight)
-            login_count = user.get('login_count', 0)
-            days_since_signup = (datetime.now(timezone.utc) - user.get('created_at')).days
-            if days_since_signup > 0:
-                logins_per_week = (login_count / days_since_signup) * 7
-                if logins_per_week < 1:
-                    risk_score += 0.3 * (1 - logins_per_week)
-            
-            # Factor 3: Usage (30% weight)
-            total_spent = user.get('total_spent', 0)
-            if total_spent == 0:
-                risk_score += 0.3
-            
-            # Cap at 1.0
-            risk_score = min(risk_score, 1.0)
-            
-            # Determine lifecycle stage
-            lifecycle_stage = 'new'
-            if days_since_signup > 90:
-                if risk_score > 0.7:
-                    lifecycle_stage = 'churned'
-                elif risk_score > 0.4:
-                    lifecycle_stage = 'at_risk'
-                elif total_spent > 100 and login_count > 20:
-                    lifecycle_stage = 'engaged'
-                else:
-                    lifecycle_stage = 'active'
-            elif days_since_signup > 7:
-                lifecycle_stage = 'active'
-            
-            # Update user
-            await users_collection.update_one(
-                {'id': user['id']},
-                {'$set': {
-                    'churn_risk_score': risk_score,
-                    'lifecycle_stage': lifecycle_stage
-                }}
-            )
-            updated_count += 1
+        if wait:
+            churn_scoring.db = db_instance
+            progress = await churn_scoring.run_once(model=model, force=True)
+            if progress is None:
+                raise HTTPException(status_code=409, detail="Churn risk scoring is already running")
+            return {
+                "success": True,
+                "message": f"Churn risk scores calculated for {progress['scored']} users",
+                "progress": progress
+            }
         
+        if not await churn_scoring.trigger(db_instance, model=model):
+            raise HTTPException(status_code=409, detail="Churn risk scoring is already running")
         return {
             "success": True,
-            "message": f"Churn risk scores calculated for {updated_count} users"
+            "message": "Churn risk scoring started",
+            "progress": await churn_scoring.get_progress(db_instance)
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error calculating churn risk: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/churn-risk/progress")
+async def get_churn_risk_progress():
+    """
+    Progress of the current or last churn risk scoring run
+    """
+    if db_instance is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    
+    return {
+        "progress": await churn_scoring.get_progress(db_instance),
+        "models": list(churn_scoring.models),
+        "default_model": churn_scoring.default_model
+    }
+
+
 # ============================================================================
 # USER IMPERSONATION
 # ============================================================================
@@ -1163,6 +1140,7 @@ async def execute_bulk_operation(operation: BulkUserOperation, background_tasks:
                 {'id': {'$in': operation.user_ids}},
                 {'$set': {'role': new_role}}
             )
+            await cache_invalidation_bus.invalidate_users(operation.user_ids)
             return {"success": True, "message": f"Role updated for {result.modified_count} users"}
         
         elif operation.operation == "change_status":
@@ -1171,6 +1149,7 @@ async def execute_bulk_operation(operation: BulkUserOperation, background_tasks:
                 {'id': {'$in': operation.user_ids}},
                 {'$set': {'status': new_status}}
             )
+            await cache_invalidation_bus.invalidate_users(operation.user_ids)
             return {"success": True, "message": f"Status updated for {result.modified_count} users"}
         
         elif operation.operation == "delete":
@@ -1178,6 +1157,7 @@ async def execute_bulk_operation(operation: BulkUserOperation, background_tasks:
             for user_id in operation.user_ids:
                 # This should be done in background for large batches
                 await delete_user_data(user_id)
+            await cache_invalidation_bus.invalidate_users(operation.user_ids)
             
             return {"success": True, "message": f"{len(operation.user_ids)} users deleted"}
         
@@ -1244,9 +1224,11 @@ async def delete_user_data(user_id: str):
             await messages_collection.delete_many({'chatbot_id': {'$in': chatbot_ids}})
             await conversations_collection.delete_many({'chatbot_id': {'$in': chatbot_ids}})
             await chatbots_collection.delete_many({'user_id': user_id})
+            await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         
         # Delete user
         await users_collection.delete_one({'id': user_id})
+        await cache_invalidation_bus.invalidate_users([user_id])
         
     except Exception as e:
         logger.error(f"Error deleting user data for {user_id}: {str(e)}")
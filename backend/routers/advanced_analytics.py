@@ -3,7 +3,12 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Optional
 from datetime import datetime, timedelta, timezone
 from collections import Counter
-import re
+import asyncio
+from services.analytics_rollup import analytics_rollup
+from services.latency_sketch import latency_recorder
+from services.top_questions import top_questions
+from services.question_clustering import question_clustering
+from services.unique_visitors import HyperLogLog, unique_visitors
 from models import (
     TrendAnalytics, TrendDataPoint, TopQuestionsAnalytics, TopQuestion,
     SatisfactionAnalytics, PerformanceMetrics, RatingCreate, RatingResponse
@@ -28,32 +33,10 @@ async def get_trend_analytics(
     end_date = datetime.now(timezone.utc)
     start_date = end_date - timedelta(days=days)
     
-    # Get conversations and messages grouped by date
-    pipeline = [
-        {
-            "$match": {
-                "chatbot_id": chatbot_id,
-                "created_at": {"$gte": start_date, "$lte": end_date}
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}
-                },
-                "count": {"$sum": 1}
-            }
-        },
-        {"$sort": {"_id": 1}}
-    ]
-    
-    # Get conversation counts by date
-    conversation_results = await db_instance.conversations.aggregate(pipeline).to_list(length=None)
-    conversation_by_date = {item["_id"]: item["count"] for item in conversation_results}
-    
-    # Get message counts by date
-    message_results = await db_instance.messages.aggregate(pipeline).to_list(length=None)
-    message_by_date = {item["_id"]: item["count"] for item in message_results}
+    # Daily conversation and message counts from the analytics rollups
+    daily = await analytics_rollup.get_daily(db_instance, [chatbot_id], start_date, end_date)
+    conversation_by_date = {day: stats["conversations"] for day, stats in daily.items()}
+    message_by_date = {day: stats["messages"] for day, stats in daily.items()}
     
     # Create data points for each day
     data = []
@@ -90,61 +73,77 @@ async def get_trend_analytics(
 @router.get("/top-questions/{chatbot_id}", response_model=TopQuestionsAnalytics)
 async def get_top_questions(
     chatbot_id: str,
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    period: str = Query("all", regex="^(all|7days|30days|90days)$"),
+    group_similar: bool = False
 ):
     """Get most frequently asked questions"""
-    # Get all user messages
-    messages = await db_instance.messages.find({
-        "chatbot_id": chatbot_id,
-        "role": "user"
-    }).to_list(length=None)
+    # Heavy-hitter summaries per day, kept up to date by the top questions job
+    start_date = None
+    if period != "all":
+        start_date = datetime.now(timezone.utc) - timedelta(days=int(period.replace("days", "")))
+    summary = await top_questions.get_summary(db_instance, chatbot_id, start_date)
     
-    if not messages:
+    if not summary.total:
         return TopQuestionsAnalytics(
             chatbot_id=chatbot_id,
             top_questions=[],
             total_unique_questions=0
         )
     
-    # Extract and normalize questions
-    questions = []
-    for msg in messages:
-        content = msg.get("content", "").strip().lower()
-        # Remove punctuation and extra spaces
-        content = re.sub(r'[^\w\s]', '', content)
-        content = re.sub(r'\s+', ' ', content)
-        if content:
-            questions.append(content)
-    
-    # Count question frequency
-    question_counts = Counter(questions)
-    total_unique = len(question_counts)
-    total_questions = len(questions)
-    
-    # Get top questions
-    top_items = question_counts.most_common(limit)
-    top_questions = [
+    # Counts are the guaranteed lower bounds, so merged days never inflate them
+    if group_similar:
+        # Paraphrases share their meaningful words; group the tracked questions
+        groups = top_questions.group_paraphrases(summary.top())
+    else:
+        groups = [{"question": q, "count": count, "variants": []} for q, count, _ in summary.top(limit)]
+    
+    top_items = [
         TopQuestion(
-            question=q,
-            count=count,
-            percentage=round((count / total_questions) * 100, 2)
+            question=group["question"],
+            count=group["count"],
+            percentage=round((group["count"] / summary.total) * 100, 2),
+            variants=group["variants"]
         )
-        for q, count in top_items
+        for group in groups[:limit]
     ]
     
     return TopQuestionsAnalytics(
         chatbot_id=chatbot_id,
-        top_questions=top_questions,
-        total_unique_questions=total_unique
+        top_questions=top_items,
+        total_unique_questions=len(summary.counters),
+        total_unique_questions_exact=summary.exact
     )
 
 
+@router.get("/knowledge-gaps/{chatbot_id}")
+async def get_knowledge_gaps(chatbot_id: str):
+    """Get question themes and how well the knowledge base covers them"""
+    # Computed in the background by the question clustering job
+    result = await question_clustering.get_clusters(db_instance, chatbot_id)
+    
+    if not result:
+        return {
+            "chatbot_id": chatbot_id,
+            "status": "pending",
+            "clusters": [],
+            "low_coverage_clusters": 0
+        }
+    
+    return {
+        **result,
+        "status": "ready",
+        "low_coverage_clusters": sum(1 for cluster in result["clusters"] if cluster["low_coverage"])
+    }
+
+
 @router.get("/satisfaction/{chatbot_id}", response_model=SatisfactionAnalytics)
 async def get_satisfaction_analytics(chatbot_id: str):
     """Get satisfaction ratings analytics"""
-    ratings = await db_instance.conversation_ratings.find({"chatbot_id": chatbot_id}).to_list(length=None)
+    totals = await analytics_rollup.get_totals(db_instance, [chatbot_id])
+    total_ratings = totals["ratings"]
     
-    if not ratings:
+    if not total_ratings:
         return SatisfactionAnalytics(
             chatbot_id=chatbot_id,
             average_rating=0.0,
@@ -154,16 +153,13 @@ async def get_satisfaction_analytics(chatbot_id: str):
         )
     
     # Calculate statistics
-    total_ratings = len(ratings)
-    rating_values = [r.get("rating", 0) for r in ratings]
-    average_rating = sum(rating_values) / total_ratings
+    average_rating = totals["rating_sum"] / total_ratings
     
     # Distribution
-    rating_counts = Counter(rating_values)
-    rating_distribution = {i: rating_counts.get(i, 0) for i in range(1, 6)}
+    rating_distribution = {i: totals[f"rating_{i}"] for i in range(1, 6)}
     
     # Satisfaction percentage (4-5 stars)
-    satisfied_count = rating_counts.get(4, 0) + rating_counts.get(5, 0)
+    satisfied_count = rating_distribution[4] + rating_distribution[5]
     satisfaction_percentage = (satisfied_count / total_ratings) * 100
     
     return SatisfactionAnalytics(
@@ -178,46 +174,80 @@ async def get_satisfaction_analytics(chatbot_id: str):
 @router.get("/performance/{chatbot_id}", response_model=PerformanceMetrics)
 async def get_performance_metrics(chatbot_id: str):
     """Get chatbot performance metrics"""
-    # Get all assistant messages with timestamps
-    messages = await db_instance.messages.find({
-        "chatbot_id": chatbot_id,
-        "role": "assistant"
-    }).sort("timestamp", 1).to_list(length=None)
+    # Totals over all history: reply latency (assistant message minus the
+    # user message before it) from the rollups
+    totals, stages, measured_since = await asyncio.gather(
+        analytics_rollup.get_totals(db_instance, [chatbot_id]),
+        # Measured stage timings (retrieval, llm, persistence, total), kept as
+        # one quantile sketch per chatbot and day since they were recorded
+        latency_recorder.get_summary(db_instance, chatbot_id),
+        latency_recorder.get_first_day(db_instance, chatbot_id)
+    )
+    total = stages.get("total") or {}
+    measured = {
+        "p50_response_ms": total.get("p50_ms"),
+        "p95_response_ms": total.get("p95_ms"),
+        "p99_response_ms": total.get("p99_ms"),
+        "stages": stages,
+        "measured_responses": total.get("count", 0),
+        "measured_since": measured_since if total else None
+    }
     
-    if not messages:
+    if not totals["response_count"]:
         return PerformanceMetrics(
             chatbot_id=chatbot_id,
             avg_response_time_ms=0.0,
-            total_responses=0,
+            total_responses=totals["assistant_messages"],
             fastest_response_ms=0.0,
-            slowest_response_ms=0.0
+            slowest_response_ms=0.0,
+            **measured
         )
     
-    # Calculate response times by comparing with previous user message
-    response_times = []
-    all_msgs = await db_instance.messages.find({"chatbot_id": chatbot_id}).sort("timestamp", 1).to_list(length=None)
-    
-    for i, msg in enumerate(all_msgs):
-        if msg.get("role") == "assistant" and i > 0:
-            prev_msg = all_msgs[i-1]
-            if prev_msg.get("role") == "user":
-                time_diff = (msg["timestamp"] - prev_msg["timestamp"]).total_seconds() * 1000
-                if time_diff > 0:  # Only positive time differences
-                    response_times.append(time_diff)
-    
-    if not response_times:
-        # Fallback to simulated response times
-        response_times = [1000.0] * len(messages)
-    
     return PerformanceMetrics(
         chatbot_id=chatbot_id,
-        avg_response_time_ms=round(sum(response_times) / len(response_times), 2),
-        total_responses=len(messages),
-        fastest_response_ms=round(min(response_times), 2),
-        slowest_response_ms=round(max(response_times), 2)
+        avg_response_time_ms=round(totals["response_ms_sum"] / totals["response_count"], 2),
+        total_responses=totals["assistant_messages"],
+        fastest_response_ms=round(totals["response_ms_min"], 2),
+        slowest_response_ms=round(totals["response_ms_max"], 2),
+        **measured
     )
 
 
+@router.get("/latency/{chatbot_id}")
+async def get_latency_breakdown(
+    chatbot_id: str,
+    period: str = Query("7days", regex="^(7days|30days|90days)$")
+):
+    """Get p50/p95/p99 per chat stage and the daily trend of the total"""
+    days = int(period.replace("days", ""))
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=days)
+    
+    stages = await latency_recorder.get_summary(db_instance, chatbot_id, start_date, end_date)
+    daily = await latency_recorder.get_daily_quantiles(db_instance, chatbot_id, start_date, end_date)
+    
+    data = []
+    current_date = start_date
+    while current_date <= end_date:
+        date_str = current_date.strftime("%Y-%m-%d")
+        summary = daily.get(date_str, {})
+        data.append({
+            "date": date_str,
+            "count": summary.get("count", 0),
+            "p50_ms": summary.get("p50_ms", 0.0),
+            "p95_ms": summary.get("p95_ms", 0.0),
+            "p99_ms": summary.get("p99_ms", 0.0)
+        })
+        current_date += timedelta(days=1)
+    
+    return {
+        "chatbot_id": chatbot_id,
+        "period": period,
+        "stages": stages,
+        "data": data
+    }
+
+
 @router.post("/rate/{conversation_id}", response_model=RatingResponse)
 async def rate_conversation(conversation_id: str, rating_data: RatingCreate):
     """Rate a conversation"""
@@ -229,6 +259,12 @@ async def rate_conversation(conversation_id: str, rating_data: RatingCreate):
     # Check if already rated
     existing_rating = await db_instance.conversation_ratings.find_one({"conversation_id": conversation_id})
     if existing_rating:
+        # The old rating is counted in the rollup of its hour; take it out
+        if existing_rating.get("created_at") and existing_rating.get("rating"):
+            await analytics_rollup.adjust_rating(
+                db_instance, existing_rating["chatbot_id"], existing_rating["created_at"], existing_rating["rating"]
+            )
+        
         # Update existing rating
         await db_instance.conversation_ratings.update_one(
             {"conversation_id": conversation_id},
@@ -267,25 +303,8 @@ async def get_response_time_trend(
     end_date = datetime.now(timezone.utc)
     start_date = end_date - timedelta(days=days)
     
-    # Get all messages in the date range
-    messages = await db_instance.messages.find({
-        "chatbot_id": chatbot_id,
-        "timestamp": {"$gte": start_date, "$lte": end_date}
-    }).sort("timestamp", 1).to_list(length=None)
-    
-    # Group response times by date
-    response_times_by_date = {}
-    
-    for i, msg in enumerate(messages):
-        if msg.get("role") == "assistant" and i > 0:
-            prev_msg = messages[i-1]
-            if prev_msg.get("role") == "user":
-                time_diff = (msg["timestamp"] - prev_msg["timestamp"]).total_seconds() * 1000
-                if time_diff > 0:
-                    date_str = msg["timestamp"].strftime("%Y-%m-%d")
-                    if date_str not in response_times_by_date:
-                        response_times_by_date[date_str] = []
-                    response_times_by_date[date_str].append(time_diff)
+    # Reply latency per day from the analytics rollups
+    daily = await analytics_rollup.get_daily(db_instance, [chatbot_id], start_date, end_date)
     
     # Calculate average for each date
     data = []
@@ -293,8 +312,8 @@ async def get_response_time_trend(
     
     while current_date <= end_date:
         date_str = current_date.strftime("%Y-%m-%d")
-        times = response_times_by_date.get(date_str, [])
-        avg_time = sum(times) / len(times) if times else 0
+        stats = daily.get(date_str)
+        avg_time = stats["response_ms_sum"] / stats["response_count"] if stats and stats["response_count"] else 0
         
         data.append({
             "date": date_str,
@@ -310,25 +329,57 @@ async def get_response_time_trend(
     }
 
 
+@router.get("/unique-visitors/{chatbot_id}")
+async def get_unique_visitors(
+    chatbot_id: str,
+    period: str = Query("7days", regex="^(7days|30days|90days)$")
+):
+    """Get estimated unique sessions and users, over the period and per day"""
+    days = int(period.replace("days", ""))
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=days)
+    
+    # One HyperLogLog sketch per day; merging them counts a returning visitor once
+    daily = await unique_visitors.get_sketches(db_instance, [chatbot_id], start_date, end_date)
+    totals = {"sessions": HyperLogLog(), "users": HyperLogLog()}
+    
+    data = []
+    current_date = start_date
+    while current_date <= end_date:
+        date_str = current_date.strftime("%Y-%m-%d")
+        sketches = daily.get(date_str, {})
+        for kind, sketch in sketches.items():
+            totals[kind].merge(sketch)
+        data.append({
+            "date": date_str,
+            "unique_sessions": sketches["sessions"].estimate() if "sessions" in sketches else 0,
+            "unique_users": sketches["users"].estimate() if "users" in sketches else 0
+        })
+        current_date += timedelta(days=1)
+    
+    return {
+        "chatbot_id": chatbot_id,
+        "period": period,
+        "unique_sessions": totals["sessions"].estimate(),
+        "unique_users": totals["users"].estimate(),
+        "standard_error": round(totals["sessions"].standard_error, 4),
+        "data": data
+    }
+
+
 @router.get("/hourly-activity/{chatbot_id}")
 async def get_hourly_activity(chatbot_id: str):
     """Get message distribution by hour of day"""
-    # Get all messages
-    messages = await db_instance.messages.find({
-        "chatbot_id": chatbot_id
-    }).to_list(length=None)
+    # Messages per hour of day (UTC) over the whole history, from the daily rollups
+    totals = await analytics_rollup.get_totals(db_instance, [chatbot_id])
     
-    if not messages:
+    if not totals["messages"]:
         return {
             "chatbot_id": chatbot_id,
             "hourly_data": [{"hour": i, "messages": 0} for i in range(24)]
         }
     
-    # Count messages by hour
-    hourly_counts = Counter()
-    for msg in messages:
-        hour = msg["timestamp"].hour
-        hourly_counts[hour] += 1
+    hourly_counts = Counter({hour: count for hour, count in enumerate(totals["messages_by_hour"]) if count})
     
     # Create data for all 24 hours
     hourly_data = [
@@ -343,5 +394,5 @@ async def get_hourly_activity(chatbot_id: str):
         "chatbot_id": chatbot_id,
         "hourly_data": hourly_data,
         "peak_hour": max(hourly_counts.items(), key=lambda x: x[1])[0] if hourly_counts else 0,
-        "total_messages": len(messages)
+        "total_messages": totals["messages"]
     }
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from models import DashboardAnalytics, ChatbotAnalytics
-from auth import get_current_user, get_current_user, User
-from datetime import datetime, timedelta, date
-from collections import defaultdict
+from auth import get_current_principal, Principal
+from datetime import datetime, timedelta, timezone
+from services.analytics_rollup import analytics_rollup
+from services.unique_visitors import unique_visitors
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,7 +20,7 @@ def init_router(db: AsyncIOMotorDatabase):
 
 
 @router.get("/dashboard", response_model=DashboardAnalytics)
-async def get_dashboard_analytics(current_user: User = Depends(get_current_user)):
+async def get_dashboard_analytics(current_user: Principal = Depends(get_current_principal)):
     """Get dashboard analytics for the current user"""
     try:
         # Get all user's chatbots
@@ -32,27 +33,29 @@ async def get_dashboard_analytics(current_user: User = Depends(get_current_user)
         # Count active chatbots
         active_chatbots = sum(1 for chatbot in chatbots if chatbot.get("status") == "active")
         
-        # Count total conversations
-        total_conversations = await db_instance.conversations.count_documents(
-            {"chatbot_id": {"$in": chatbot_ids}}
-        )
-        
-        # Count total messages
-        total_messages = await db_instance.messages.count_documents(
-            {"chatbot_id": {"$in": chatbot_ids}}
-        )
+        # Total conversations and messages, from the analytics rollups
+        totals = await analytics_rollup.get_totals(db_instance, chatbot_ids) if chatbot_ids else {}
+        total_conversations = totals.get("conversations", 0)
+        total_messages = totals.get("messages", 0)
         
         # Count total leads
         total_leads = await db_instance.leads.count_documents(
             {"user_id": current_user.id}
         )
         
+        # Unique sessions across all chatbots (sketches merge without double counting)
+        unique = {}
+        if chatbot_ids:
+            now = datetime.now(timezone.utc)
+            unique = await unique_visitors.count(db_instance, chatbot_ids, now - timedelta(days=30), now)
+        
         return DashboardAnalytics(
             total_conversations=total_conversations,
             total_messages=total_messages,
             active_chatbots=active_chatbots,
             total_chatbots=len(chatbots),
-            total_leads=total_leads
+            total_leads=total_leads,
+            unique_visitors_30d=unique.get("sessions", 0)
         )
     except Exception as e:
         logger.error(f"Error fetching dashboard analytics: {str(e)}")
@@ -66,7 +69,7 @@ async def get_dashboard_analytics(current_user: User = Depends(get_current_user)
 async def get_chatbot_analytics(
     chatbot_id: str,
     days: int = 30,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get analytics for a specific chatbot"""
     try:
@@ -82,56 +85,22 @@ async def get_chatbot_analytics(
                 detail="Chatbot not found"
             )
         
-        # Calculate date range
-        end_date = datetime.now()
+        # Calculate date range (UTC days, read from the analytics rollups)
+        end_date = datetime.now(timezone.utc)
         start_date = end_date - timedelta(days=days)
         
-        # Get conversations
-        conversations = await db_instance.conversations.find({
-            "chatbot_id": chatbot_id,
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(length=None)
-        
-        # Get messages
-        messages = await db_instance.messages.find({
-            "chatbot_id": chatbot_id,
-            "timestamp": {"$gte": start_date, "$lte": end_date}
-        }).to_list(length=None)
-        
-        # Group by date
-        conversations_by_date = defaultdict(int)
-        messages_by_date = defaultdict(int)
-        
-        for conv in conversations:
-            conv_date = conv["created_at"].date().isoformat()
-            conversations_by_date[conv_date] += 1
-        
-        for msg in messages:
-            msg_date = msg["timestamp"].date().isoformat()
-            messages_by_date[msg_date] += 1
-        
-        # Generate date range
-        date_range = []
-        current_date = start_date.date()
-        while current_date <= end_date.date():
-            date_range.append(current_date)
-            current_date += timedelta(days=1)
-        
-        # Fill in missing dates with 0
-        for d in date_range:
-            d_str = d.isoformat()
-            if d_str not in conversations_by_date:
-                conversations_by_date[d_str] = 0
-            if d_str not in messages_by_date:
-                messages_by_date[d_str] = 0
+        daily = await analytics_rollup.get_daily(db_instance, [chatbot_id], start_date, end_date)
+        total_conversations = sum(stats["conversations"] for stats in daily.values())
+        total_messages = sum(stats["messages"] for stats in daily.values())
+        unique = await unique_visitors.count(db_instance, [chatbot_id], start_date, end_date)
         
         return ChatbotAnalytics(
-            chatbot_id=chatbot_id,
-            total_conversations=len(conversations),
-            total_messages=len(messages),
-            date_range=date_range,
-            conversations_by_date=dict(conversations_by_date),
-            messages_by_date=dict(messages_by_date)
+            total_messages=total_messages,
+            total_conversations=total_conversations,
+            avg_messages_per_conversation=round(total_messages / total_conversations, 2) if total_conversations else 0.0,
+            date_range=f"{start_date.date().isoformat()} to {end_date.date().isoformat()}",
+            unique_sessions=unique["sessions"],
+            unique_users=unique["users"]
         )
     except HTTPException:
         raise
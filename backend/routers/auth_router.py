@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from models import UserCreate, UserLogin, UserResponse, Token, User
-from auth import get_password_hash, verify_password, create_access_token, get_current_user_email
+from auth import get_password_hash_async, verify_password_and_update, create_access_token, get_current_user_email
+from services.cache_invalidation import cache_invalidation_bus
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -31,7 +32,7 @@ async def register(user_data: UserCreate):
     user_dict.pop('password')
     user = User(
         **user_dict,
-        password_hash=get_password_hash(user_data.password)
+        password_hash=await get_password_hash_async(user_data.password)
     )
     
     # Store in database
@@ -88,21 +89,24 @@ async def login(user_data: UserLogin):
                     {"email": user_data.email},
                     {"$set": {"status": "active", "suspension_until": None, "suspension_reason": None}}
                 )
+                await cache_invalidation_bus.invalidate_users([user_doc['id']])
     
     # Verify password
-    if not verify_password(user_data.password, user_doc['password_hash']):
+    valid, new_hash = await verify_password_and_update(user_data.password, user_doc['password_hash'])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    # Update last login
+    # Update last login (and upgrade the hash if the bcrypt cost changed)
+    login_update = {"last_login": datetime.now(timezone.utc).isoformat()}
+    if new_hash:
+        login_update["password_hash"] = new_hash
     await users_collection.update_one(
         {"email": user_data.email},
         {
-            "$set": {
-                "last_login": datetime.now(timezone.utc).isoformat()
-            },
+            "$set": login_update,
             "$inc": {"login_count": 1}
         }
     )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
 from datetime import datetime, timezone
@@ -7,10 +7,14 @@ from models import (
     ConversationResponse, MessageResponse
 )
 from services.chat_service import ChatService
-from services.rag_service import RAGService
+from services.rag_service import get_rag_service
 from services.plan_service import plan_service
 from services.notification_service import NotificationService
 from services.cache_service import cache_service
+from services.cache_invalidation import CHATBOT_CACHE_TTL_SECONDS
+from services.latency_sketch import StageTimer, latency_recorder, store_message_timings
+from services.unique_visitors import unique_visitors
+from repositories import ChatbotRepository
 import logging
 import asyncio
 
@@ -21,31 +25,32 @@ db_instance = None
 chat_service = None
 rag_service = None
 notification_service = None
+chatbot_repo = None
 
 
 def init_router(db: AsyncIOMotorDatabase):
     """Initialize router with database instance"""
-    global db_instance, chat_service, rag_service, notification_service
+    global db_instance, chat_service, rag_service, notification_service, chatbot_repo
     db_instance = db
+    chatbot_repo = ChatbotRepository(db)
     chat_service = ChatService()
-    rag_service = RAGService()
+    rag_service = get_rag_service()
     notification_service = NotificationService(db)
 
 
 @router.post("", response_model=ChatResponse)
-async def send_message(chat_request: ChatRequest):
+async def send_message(chat_request: ChatRequest, background_tasks: BackgroundTasks):
     """Send a message to a chatbot (public endpoint) - OPTIMIZED"""
+    timer = StageTimer()
     try:
         # OPTIMIZATION 0: Try to get chatbot from cache first
-        cache_key = f"chatbot:{chat_request.chatbot_id}"
-        chatbot = cache_service.get(cache_key)
-        
-        if not chatbot:
-            # Cache miss - fetch from database
-            chatbot = await db_instance.chatbots.find_one({"id": chat_request.chatbot_id})
-            if chatbot:
-                # Cache for 5 minutes
-                cache_service.set(cache_key, chatbot, ttl_seconds=300)
+        # (concurrent misses share one database read)
+        chatbot = await cache_service.get_or_load(
+            f"chatbot:{chat_request.chatbot_id}",
+            lambda: chatbot_repo.get_chat_runtime(chat_request.chatbot_id),
+            ttl_seconds=CHATBOT_CACHE_TTL_SECONDS,
+            namespaces=[f"chatbot:{chat_request.chatbot_id}"]
+        )
         
         # OPTIMIZATION 1: Parallel fetch of conversation (chatbot already fetched/cached)
         conversation = await db_instance.conversations.find_one({
@@ -86,23 +91,21 @@ async def send_message(chat_request: ChatRequest):
             )
             await db_instance.conversations.insert_one(conversation.model_dump())
             
-            # Send notification for new conversation (non-blocking)
-            asyncio.create_task(
-                notification_service.create_notification(
-                    user_id=user_id,
-                    notification_type="new_conversation",
-                    title="New Conversation Started",
-                    message=f"A new conversation was started with your chatbot '{chatbot.get('name', 'Unknown')}'",
-                    priority="medium",
-                    metadata={
-                        "chatbot_id": chat_request.chatbot_id,
-                        "chatbot_name": chatbot.get("name"),
-                        "conversation_id": conversation.id,
-                        "user_name": chat_request.user_name,
-                        "user_email": chat_request.user_email
-                    },
-                    action_url=f"/chatbot-builder/{chat_request.chatbot_id}?tab=analytics"
-                )
+            # Queue notification for new conversation (inserted and delivered in batches)
+            await notification_service.create_notification(
+                user_id=user_id,
+                notification_type="new_conversation",
+                title="New Conversation Started",
+                message=f"A new conversation was started with your chatbot '{chatbot.get('name', 'Unknown')}'",
+                priority="medium",
+                metadata={
+                    "chatbot_id": chat_request.chatbot_id,
+                    "chatbot_name": chatbot.get("name"),
+                    "conversation_id": conversation.id,
+                    "user_name": chat_request.user_name,
+                    "user_email": chat_request.user_email
+                },
+                action_url=f"/chatbot-builder/{chat_request.chatbot_id}?tab=analytics"
             )
         else:
             conversation = Conversation(**conversation)
@@ -123,8 +126,11 @@ async def send_message(chat_request: ChatRequest):
             min_similarity=0.5  # Increased from 0.7 for better balance
         )
         
-        # Wait for both operations
-        _, rag_result = await asyncio.gather(save_message_task, rag_task)
+        # Wait for both operations (each timed on its own)
+        _, rag_result = await asyncio.gather(
+            timer.run("persistence", save_message_task),
+            timer.run("retrieval", rag_task)
+        )
         
         context = rag_result.get("context") if rag_result.get("has_context") else None
         citation_footer = rag_result.get("citation_footer")
@@ -133,7 +139,7 @@ async def send_message(chat_request: ChatRequest):
         
         # Generate AI response with RAG context
         try:
-            ai_response, citations = await chat_service.generate_response(
+            ai_response, citations = await timer.run("llm", chat_service.generate_response(
                 message=chat_request.message,
                 session_id=chat_request.session_id,
                 system_message=chatbot.get("instructions", "You are a helpful assistant."),
@@ -141,7 +147,7 @@ async def send_message(chat_request: ChatRequest):
                 provider=chatbot.get("provider", "openai"),
                 context=context,
                 citation_footer=citation_footer
-            )
+            ))
             
             # Citations removed - users don't need to see source references
             # The AI still uses the knowledge base context, but citations are hidden
@@ -155,10 +161,12 @@ async def send_message(chat_request: ChatRequest):
             conversation_id=conversation.id,
             chatbot_id=chat_request.chatbot_id,
             role="assistant",
-            content=ai_response
+            content=ai_response,
+            timings=timer.as_milliseconds()
         )
         
-        save_assistant_task = db_instance.messages.insert_one(assistant_message.model_dump())
+        assistant_doc = assistant_message.model_dump()
+        save_assistant_task = db_instance.messages.insert_one(assistant_doc)
         update_conversation_task = db_instance.conversations.update_one(
             {"id": conversation.id},
             {
@@ -178,12 +186,16 @@ async def send_message(chat_request: ChatRequest):
         increment_usage_task = plan_service.increment_usage(user_id, "messages", amount=2)
         
         # Execute all updates in parallel
-        await asyncio.gather(
+        await timer.run("persistence", asyncio.gather(
             save_assistant_task,
             update_conversation_task,
             update_chatbot_task,
             increment_usage_task
-        )
+        ))
+        timings = timer.finish()
+        latency_recorder.record(chat_request.chatbot_id, timings)
+        background_tasks.add_task(store_message_timings, db_instance, assistant_doc["_id"], timings)
+        unique_visitors.record(chat_request.chatbot_id, chat_request.session_id, chat_request.user_email)
         
         return ChatResponse(
             message=ai_response,
@@ -5,9 +5,9 @@ from datetime import datetime, timezone
 from models import (
     Chatbot, ChatbotCreate, ChatbotUpdate, ChatbotResponse
 )
-from auth import get_current_user, User
+from auth import get_current_principal, Principal
 from services.plan_service import plan_service
-from services.cache_service import cache_service
+from services.cache_invalidation import cache_invalidation_bus
 import logging
 import os
 import uuid
@@ -29,7 +29,7 @@ def init_router(db: AsyncIOMotorDatabase):
 @router.post("", response_model=ChatbotResponse, status_code=status.HTTP_201_CREATED)
 async def create_chatbot(
     chatbot_data: ChatbotCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Create a new chatbot"""
     try:
@@ -73,7 +73,7 @@ async def create_chatbot(
 
 
 @router.get("", response_model=List[ChatbotResponse])
-async def get_chatbots(current_user: User = Depends(get_current_user)):
+async def get_chatbots(current_user: Principal = Depends(get_current_principal)):
     """Get all chatbots for the current user"""
     try:
         chatbots = await db_instance.chatbots.find(
@@ -104,7 +104,7 @@ async def get_chatbots(current_user: User = Depends(get_current_user)):
 @router.get("/{chatbot_id}", response_model=ChatbotResponse)
 async def get_chatbot(
     chatbot_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get a specific chatbot"""
     try:
@@ -144,7 +144,7 @@ async def get_chatbot(
 async def update_chatbot(
     chatbot_id: str,
     chatbot_data: ChatbotUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Update a chatbot"""
     try:
@@ -177,9 +177,8 @@ async def update_chatbot(
                 {"$set": update_data}
             )
             
-            # Invalidate cache for this chatbot
-            cache_service.delete(f"chatbot:{chatbot_id}")
-            cache_service.delete(f"public_chatbot:{chatbot_id}")
+            # Invalidate every cached view of this chatbot on all workers
+            await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         # Fetch updated chatbot
         updated_chatbot = await db_instance.chatbots.find_one({"id": chatbot_id})
@@ -202,7 +201,7 @@ async def update_chatbot(
 @router.patch("/{chatbot_id}/toggle", response_model=ChatbotResponse)
 async def toggle_chatbot(
     chatbot_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Toggle chatbot active/inactive status"""
     try:
@@ -225,6 +224,7 @@ async def toggle_chatbot(
             {"id": chatbot_id},
             {"$set": {"status": new_status, "updated_at": datetime.now(timezone.utc)}}
         )
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         # Fetch updated chatbot
         updated_chatbot = await db_instance.chatbots.find_one({"id": chatbot_id})
@@ -242,7 +242,7 @@ async def toggle_chatbot(
 @router.delete("/{chatbot_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_chatbot(
     chatbot_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Delete a chatbot"""
     try:
@@ -263,6 +263,7 @@ async def delete_chatbot(
         await db_instance.sources.delete_many({"chatbot_id": chatbot_id})
         await db_instance.conversations.delete_many({"chatbot_id": chatbot_id})
         await db_instance.messages.delete_many({"chatbot_id": chatbot_id})
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         # Decrement usage count
         await plan_service.decrement_usage(current_user.id, "chatbots")
@@ -283,7 +284,7 @@ async def upload_branding_image(
     chatbot_id: str,
     file: UploadFile = File(...),
     image_type: str = "logo",  # "logo" or "avatar"
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Upload logo or avatar image for chatbot branding"""
     try:
@@ -339,7 +340,7 @@ async def upload_branding_image(
         )
         
         # Clear cache
-        cache_service.delete(f"chatbot_{chatbot_id}")
+        await cache_invalidation_bus.invalidate_chatbots([chatbot_id])
         
         logger.info(f"Successfully uploaded {image_type} for chatbot {chatbot_id}")
         
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from repositories import ChatbotRepository
 from datetime import datetime
 import logging
 import uuid
@@ -15,11 +16,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/discord", tags=["discord"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
+chatbot_repo = ChatbotRepository(db)
 
 # Chat service
 chat_service = ChatService()
@@ -74,7 +73,7 @@ async def process_discord_message(
         discord_service = get_discord_service(bot_token)
         
         # Get chatbot to check user limits
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot not found: {chatbot_id}")
             return
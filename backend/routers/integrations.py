@@ -1,22 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from database import get_database
 from models import (
     Integration, IntegrationCreate, IntegrationUpdate, IntegrationResponse,
     IntegrationLog, IntegrationLogResponse, TestConnectionRequest
 )
-from auth import get_current_user, get_current_user
+from auth import get_current_principal, Principal
 import httpx
 
 router = APIRouter(prefix="/integrations", tags=["integrations"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
 
 
 async def log_integration_event(
@@ -183,7 +179,7 @@ async def test_integration_connection(integration_type: str, credentials: dict)
 
 
 @router.get("/{chatbot_id}", response_model=List[IntegrationResponse])
-async def get_integrations(chatbot_id: str, current_user: dict = Depends(get_current_user)):
+async def get_integrations(chatbot_id: str, current_user: Principal = Depends(get_current_principal)):
     """Get all integrations for a chatbot"""
     try:
         # Verify chatbot belongs to user
@@ -223,7 +219,7 @@ async def get_integrations(chatbot_id: str, current_user: dict = Depends(get_cur
 async def create_or_update_integration(
     chatbot_id: str,
     integration_data: IntegrationCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Create or update an integration"""
     try:
@@ -314,7 +310,7 @@ async def create_or_update_integration(
 async def toggle_integration(
     chatbot_id: str,
     integration_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Enable or disable an integration"""
     try:
@@ -362,7 +358,7 @@ async def toggle_integration(
 async def test_integration(
     chatbot_id: str,
     integration_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Test an integration connection"""
     try:
@@ -426,7 +422,7 @@ async def test_integration(
 async def delete_integration(
     chatbot_id: str,
     integration_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Delete an integration"""
     try:
@@ -469,7 +465,7 @@ async def delete_integration(
 async def get_integration_logs(
     chatbot_id: str,
     limit: int = 50,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get integration activity logs"""
     try:
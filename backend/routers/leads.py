@@ -1,8 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from typing import List, Optional
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from database import get_database
 import uuid
 from models import User, Lead, LeadResponse, LeadCreate, LeadUpdate, LeadStatsResponse
 from services.plan_service import plan_service
@@ -10,11 +9,8 @@ from auth import get_current_user
 
 router = APIRouter()
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
 leads_collection = db.leads
 
 
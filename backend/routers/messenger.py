@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from repositories import ChatbotRepository
 from datetime import datetime, timezone
 import os
 import logging
@@ -7,16 +8,14 @@ from typing import Dict, Any
 
 from services.messenger_service import MessengerService
 from services.chat_service import ChatService
-from services.rag_service import RAGService
-from auth import get_current_user
+from services.rag_service import get_rag_service
+from auth import get_current_principal, Principal
 
 router = APIRouter(prefix="/messenger", tags=["messenger"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
+chatbot_repo = ChatbotRepository(db)
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +38,7 @@ async def messenger_webhook_verify(
         logger.info(f"Mode: {mode}, Token: {token}, Challenge: {challenge}")
         
         # Get chatbot and integration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot {chatbot_id} not found")
             raise HTTPException(status_code=404, detail="Chatbot not found")
@@ -141,7 +140,7 @@ async def process_messenger_message(chatbot_id: str, messaging_event: Dict[str,
         logger.info(f"Processing Messenger message from {sender_id}: {message_text}")
         
         # Get chatbot configuration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot {chatbot_id} not found")
             return
@@ -255,7 +254,7 @@ async def process_messenger_message(chatbot_id: str, messaging_event: Dict[str,
             })
         
         # Get relevant context from knowledge base
-        rag_service = RAGService()
+        rag_service = get_rag_service()
         rag_result = await rag_service.retrieve_relevant_context(
             query=message_text,
             chatbot_id=chatbot_id,
@@ -342,7 +341,7 @@ async def process_messenger_message(chatbot_id: str, messaging_event: Dict[str,
 @router.post("/{chatbot_id}/setup-webhook")
 async def setup_messenger_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get Messenger webhook setup instructions
@@ -417,7 +416,7 @@ async def setup_messenger_webhook(
 @router.get("/{chatbot_id}/webhook-info")
 async def get_messenger_webhook_info(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get Messenger webhook configuration info
@@ -458,7 +457,7 @@ async def get_messenger_webhook_info(
 @router.delete("/{chatbot_id}/webhook")
 async def remove_messenger_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Remove Messenger webhook configuration
@@ -503,7 +502,7 @@ async def send_test_message(
     chatbot_id: str,
     recipient_id: str,
     message: str = "Hello! This is a test message from your chatbot.",
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Send a test message via Messenger
@@ -5,7 +5,8 @@ Handles MS Teams webhook messages and bot operations
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Depends
 from typing import Dict, Any
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from repositories import ChatbotRepository
 import os
 import logging
 
@@ -13,16 +14,14 @@ from models import MSTeamsMessage, MSTeamsWebhookSetup
 from services.msteams_service import MSTeamsService
 from services.chat_service import ChatService
 from services.vector_store import VectorStore
-from auth import get_current_user
+from auth import get_current_principal, Principal
 
 router = APIRouter(prefix="/msteams", tags=["msteams"])
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
+chatbot_repo = ChatbotRepository(db)
 
 
 async def process_msteams_message(
@@ -35,7 +34,7 @@ async def process_msteams_message(
     """Process MS Teams message and generate response"""
     try:
         # Get chatbot configuration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot {chatbot_id} not found")
             return
@@ -266,7 +265,7 @@ async def msteams_webhook(
 @router.post("/{chatbot_id}/setup-webhook")
 async def setup_msteams_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Generate MS Teams webhook URL and return setup instructions
@@ -336,7 +335,7 @@ Note: Make sure your Bot App ID and App Password are correctly configured in the
 @router.get("/{chatbot_id}/webhook-info")
 async def get_msteams_webhook_info(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get MS Teams webhook configuration and setup status"""
     try:
@@ -370,7 +369,7 @@ async def get_msteams_webhook_info(
 @router.delete("/{chatbot_id}/webhook")
 async def delete_msteams_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Remove MS Teams webhook configuration"""
     try:
@@ -395,7 +394,7 @@ async def send_test_message(
     chatbot_id: str,
     service_url: str,
     conversation_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Send a test message to MS Teams (for testing purposes)"""
     try:
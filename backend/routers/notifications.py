@@ -1,25 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from auth import get_current_user
-from models import User
+from auth import get_current_principal, Principal
 from models_notifications import (
     NotificationResponse,
     NotificationPreferences,
     NotificationPreferencesUpdate,
     PushSubscription
 )
-from services.notification_service import NotificationService
+from services.notification_service import NotificationService, encode_cursor
+from services.notification_counters import notification_counters
 from pydantic import BaseModel
+import hashlib
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 db_instance = None
+notification_service: Optional[NotificationService] = None
 
 
 def init_router(db: AsyncIOMotorDatabase):
     """Initialize router with database instance"""
-    global db_instance
+    global db_instance, notification_service
     db_instance = db
+    notification_service = NotificationService(db)
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """True if the client already holds this version (If-None-Match)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
 
 
 class PushSubscriptionRequest(BaseModel):
@@ -30,39 +41,65 @@ class PushSubscriptionRequest(BaseModel):
 
 @router.get("/", response_model=List[NotificationResponse])
 async def get_notifications(
+    request: Request,
+    response: Response,
     limit: int = Query(50, ge=1, le=100),
     skip: int = Query(0, ge=0),
     unread_only: bool = Query(False),
-    current_user: User = Depends(get_current_user)
+    before: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Get user's notifications"""
-    notification_service = NotificationService(db_instance)
-    notifications = await notification_service.get_user_notifications(
-        user_id=current_user.id,
-        limit=limit,
-        skip=skip,
-        unread_only=unread_only
-    )
+    """
+    Get user's notifications
+
+    Paginate with `before` (keyset, stable while new notifications arrive);
+    `skip` is kept for older clients. Responses carry an ETag, and a poll
+    with a matching If-None-Match gets 304 without touching the database.
+    """
+    state = await notification_service.get_unread_state(current_user.id)
+    view = hashlib.sha1(f"{limit}|{skip}|{unread_only}|{before or ''}".encode()).hexdigest()[:12]
+    etag = notification_counters.etag(state, view)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        notifications = await notification_service.get_user_notifications(
+            user_id=current_user.id,
+            limit=limit,
+            skip=skip,
+            unread_only=unread_only,
+            before=before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response.headers["ETag"] = etag
+    if len(notifications) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(notifications[-1])
     return notifications
 
 
 @router.get("/unread-count")
 async def get_unread_count(
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Get count of unread notifications"""
-    notification_service = NotificationService(db_instance)
-    count = await notification_service.get_unread_count(current_user.id)
-    return {"count": count}
+    """Get count of unread notifications (304 if unchanged since If-None-Match)"""
+    state = await notification_service.get_unread_state(current_user.id)
+    etag = notification_counters.etag(state)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {"count": state["unread"]}
 
 
 @router.put("/{notification_id}/read")
 async def mark_notification_as_read(
     notification_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Mark a notification as read"""
-    notification_service = NotificationService(db_instance)
     success = await notification_service.mark_as_read(notification_id, current_user.id)
     
     if not success:
@@ -73,10 +110,9 @@ async def mark_notification_as_read(
 
 @router.put("/read-all")
 async def mark_all_notifications_as_read(
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Mark all notifications as read"""
-    notification_service = NotificationService(db_instance)
     count = await notification_service.mark_all_as_read(current_user.id)
     return {"message": f"Marked {count} notifications as read"}
 
@@ -84,10 +120,9 @@ async def mark_all_notifications_as_read(
 @router.delete("/{notification_id}")
 async def delete_notification(
     notification_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Delete a notification"""
-    notification_service = NotificationService(db_instance)
     success = await notification_service.delete_notification(notification_id, current_user.id)
     
     if not success:
@@ -98,10 +133,9 @@ async def delete_notification(
 
 @router.get("/preferences")
 async def get_notification_preferences(
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get user's notification preferences"""
-    notification_service = NotificationService(db_instance)
     prefs = await notification_service.get_user_preferences(current_user.id)
     
     # Default preferences
@@ -135,11 +169,9 @@ async def get_notification_preferences(
 @router.put("/preferences")
 async def update_notification_preferences(
     preferences: NotificationPreferencesUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Update user's notification preferences"""
-    notification_service = NotificationService(db_instance)
-    
     # Convert to dict and remove None values
     prefs_dict = {k: v for k, v in preferences.dict().items() if v is not None}
     
@@ -179,11 +211,9 @@ async def update_notification_preferences(
 @router.post("/push-subscription")
 async def save_push_subscription(
     subscription: PushSubscriptionRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Save browser push notification subscription"""
-    notification_service = NotificationService(db_instance)
-    
     result = await notification_service.save_push_subscription(
         user_id=current_user.id,
         endpoint=subscription.endpoint,
@@ -196,11 +226,9 @@ async def save_push_subscription(
 
 @router.post("/test")
 async def create_test_notification(
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Create a test notification (for development)"""
-    notification_service = NotificationService(db_instance)
-    
     notification = await notification_service.create_notification(
         user_id=current_user.id,
         notification_type="new_conversation",
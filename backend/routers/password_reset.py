@@ -3,19 +3,17 @@ from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 from typing import Optional
 import secrets
-import hashlib
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from auth import get_password_hash_async
+from database import get_database
+from services.cache_invalidation import cache_invalidation_bus
 from dotenv import load_dotenv
 
 load_dotenv()
 
 router = APIRouter(prefix="/auth", tags=["password-reset"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client['chatbase_db']
+# MongoDB connection (shared client)
+db = get_database()
 users_collection = db['users']
 reset_tokens_collection = db['password_reset_tokens']
 
@@ -34,11 +32,6 @@ def generate_reset_token():
     return secrets.token_urlsafe(32)
 
 
-def hash_password(password: str) -> str:
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
 @router.post("/forgot-password")
 async def forgot_password(request: ForgotPasswordRequest):
     """
@@ -123,14 +116,14 @@ async def reset_password(request: ResetPasswordRequest):
         )
     
     # Hash the new password
-    hashed_password = hash_password(request.new_password)
+    hashed_password = await get_password_hash_async(request.new_password)
     
     # Update user's password
     update_result = await users_collection.update_one(
         {"email": reset_token_doc["email"]},
         {
             "$set": {
-                "password": hashed_password,
+                "password_hash": hashed_password,
                 "password_updated_at": datetime.utcnow()
             }
         }
@@ -142,6 +135,11 @@ async def reset_password(request: ResetPasswordRequest):
             detail="User not found"
         )
     
+    # Drop cached sessions of this user on every worker
+    user = await users_collection.find_one({"email": reset_token_doc["email"]}, {"_id": 0, "id": 1})
+    if user:
+        await cache_invalidation_bus.invalidate_users([user["id"]])
+    
     # Mark token as used
     await reset_tokens_collection.update_one(
         {"token": request.token},
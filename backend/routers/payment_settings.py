@@ -2,7 +2,6 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field
 from typing import Optional, Dict
 from datetime import datetime
-import os
 import httpx
 import logging
 
@@ -10,14 +9,10 @@ router = APIRouter(prefix="/admin/payment-settings", tags=["Admin Payment Settin
 
 logger = logging.getLogger(__name__)
 
-# MongoDB collection
-from motor.motor_asyncio import AsyncIOMotorClient
+# MongoDB collection (shared client)
+from database import get_database
 
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'chatbase_db')
-
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+db = get_database()
 payment_settings_collection = db['payment_settings']
 
 
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
-from models import User, Plan, PlanUpgradeRequest
+from models import Plan, PlanUpgradeRequest
 from services.plan_service import plan_service
-from auth import get_current_user
+from auth import get_current_principal, Principal
 
 router = APIRouter(prefix="/plans", tags=["plans"])
 
@@ -17,7 +17,7 @@ async def get_plans():
     return plans
 
 @router.get("/current")
-async def get_current_subscription(current_user: User = Depends(get_current_user)):
+async def get_current_subscription(current_user: Principal = Depends(get_current_principal)):
     """Get current user's subscription details"""
     subscription = await plan_service.get_user_subscription(current_user.id)
     plan = await plan_service.get_plan_by_id(subscription["plan_id"])
@@ -36,7 +36,7 @@ async def get_current_subscription(current_user: User = Depends(get_current_user
 @router.post("/upgrade")
 async def upgrade_plan(
     upgrade_request: PlanUpgradeRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Upgrade user to a new plan"""
     # Verify plan exists
@@ -57,7 +57,7 @@ async def upgrade_plan(
     }
 
 @router.get("/usage")
-async def get_usage_stats(current_user: User = Depends(get_current_user)):
+async def get_usage_stats(current_user: Principal = Depends(get_current_principal)):
     """Get detailed usage statistics"""
     stats = await plan_service.get_usage_stats(current_user.id)
     return stats
@@ -65,20 +65,20 @@ async def get_usage_stats(current_user: User = Depends(get_current_user)):
 @router.get("/check-limit/{limit_type}")
 async def check_limit(
     limit_type: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Check if user has reached a specific limit"""
     result = await plan_service.check_limit(current_user.id, limit_type)
     return result
 
 @router.get("/subscription-status")
-async def check_subscription_status(current_user: User = Depends(get_current_user)):
+async def check_subscription_status(current_user: Principal = Depends(get_current_principal)):
     """Check if subscription is expired or expiring soon"""
     status = await plan_service.check_subscription_status(current_user.id)
     return status
 
 @router.post("/renew")
-async def renew_subscription(current_user: User = Depends(get_current_user)):
+async def renew_subscription(current_user: Principal = Depends(get_current_principal)):
     """Renew current subscription for another month"""
     try:
         updated_subscription = await plan_service.renew_subscription(current_user.id)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
 from datetime import datetime, timezone
@@ -7,9 +7,13 @@ from models import (
     EmbedConfig, EmbedCodeResponse, ConversationResponse, MessageResponse
 )
 from services.chat_service import ChatService
-from services.rag_service import RAGService
+from services.rag_service import get_rag_service
 from services.cache_service import cache_service
-import json
+from services.cache_invalidation import CHATBOT_CACHE_TTL_SECONDS
+from services.latency_sketch import StageTimer, latency_recorder, store_message_timings
+from services.unique_visitors import unique_visitors
+from services.export_stream import FORMATS, conversations_with_messages, export_response, serialize
+from repositories import ChatbotRepository
 import logging
 import asyncio
 
@@ -18,12 +22,14 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/public", tags=["public-chat"])
 db_instance = None
 rag_service = None
+chatbot_repo = None
 
 def init_router(db: AsyncIOMotorDatabase):
     """Initialize router with database instance"""
-    global db_instance, rag_service
+    global db_instance, rag_service, chatbot_repo
     db_instance = db
-    rag_service = RAGService()
+    chatbot_repo = ChatbotRepository(db)
+    rag_service = get_rag_service()
 
 @router.get("/chatbot/{chatbot_id}", response_model=PublicChatbotInfo)
 async def get_public_chatbot(chatbot_id: str):
@@ -35,8 +41,8 @@ async def get_public_chatbot(chatbot_id: str):
     if cached_info:
         return cached_info
     
-    # Cache miss - fetch from database
-    chatbot = await db_instance.chatbots.find_one({"id": chatbot_id})
+    # Cache miss - fetch only the widget fields from database
+    chatbot = await chatbot_repo.get_public_profile(chatbot_id)
     if not chatbot:
         raise HTTPException(status_code=404, detail="Chatbot not found")
     
@@ -60,24 +66,24 @@ async def get_public_chatbot(chatbot_id: str):
         auto_expand=chatbot.get("auto_expand", False)
     )
     
-    # Cache for 5 minutes
-    cache_service.set(cache_key, info, ttl_seconds=300)
+    # Cached until the chatbot is updated (invalidated through the bus)
+    cache_service.set(cache_key, info, ttl_seconds=CHATBOT_CACHE_TTL_SECONDS, namespaces=[f"chatbot:{chatbot_id}"])
     
     return info
 
 
 @router.post("/chat/{chatbot_id}", response_model=ChatResponse)
-async def public_chat(chatbot_id: str, request: PublicChatRequest):
+async def public_chat(chatbot_id: str, request: PublicChatRequest, background_tasks: BackgroundTasks):
     """Send a message to a public chatbot (no authentication required) - OPTIMIZED"""
+    timer = StageTimer()
     # Try to get chatbot from cache first
-    cache_key = f"chatbot:{chatbot_id}"
-    chatbot = cache_service.get(cache_key)
-    
-    if not chatbot:
-        # Cache miss - fetch from database
-        chatbot = await db_instance.chatbots.find_one({"id": chatbot_id})
-        if chatbot:
-            cache_service.set(cache_key, chatbot, ttl_seconds=300)
+    # (concurrent misses share one database read)
+    chatbot = await cache_service.get_or_load(
+        f"chatbot:{chatbot_id}",
+        lambda: chatbot_repo.get_chat_runtime(chatbot_id),
+        ttl_seconds=CHATBOT_CACHE_TTL_SECONDS,
+        namespaces=[f"chatbot:{chatbot_id}"]
+    )
     
     if not chatbot:
         raise HTTPException(status_code=404, detail="Chatbot not found")
@@ -144,8 +150,11 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
         min_similarity=0.5  # Adjusted for better balance
     )
     
-    # Wait for both operations
-    _, rag_result = await asyncio.gather(save_message_task, rag_task)
+    # Wait for both operations (each timed on its own)
+    _, rag_result = await asyncio.gather(
+        timer.run("persistence", save_message_task),
+        timer.run("retrieval", rag_task)
+    )
     
     context = rag_result.get("context") if rag_result.get("has_context") else None
     citation_footer = rag_result.get("citation_footer")
@@ -153,7 +162,7 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
     # Get AI response
     chat_service = ChatService()
     try:
-        ai_response, citations = await chat_service.generate_response(
+        ai_response, citations = await timer.run("llm", chat_service.generate_response(
             message=request.message,
             session_id=request.session_id,
             system_message=chatbot.get("instructions", "You are a helpful assistant."),
@@ -161,7 +170,7 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
             provider=chatbot.get("provider", "openai"),
             context=context,
             citation_footer=citation_footer
-        )
+        ))
         
         # Citations removed - widget users don't need to see source references
         # The AI still uses the knowledge base context, but citations are hidden
@@ -177,6 +186,7 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
         "chatbot_id": chatbot_id,
         "role": "assistant",
         "content": ai_response,
+        "timings": timer.as_milliseconds(),
         "created_at": datetime.now(timezone.utc),
         "timestamp": datetime.now(timezone.utc)  # Keep for backwards compatibility
     }
@@ -191,7 +201,7 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
     )
     
     # Execute both in parallel
-    await asyncio.gather(save_ai_message_task, update_conversation_task)
+    await timer.run("persistence", asyncio.gather(save_ai_message_task, update_conversation_task))
     
     # Update chatbot counts
     await db_instance.chatbots.update_one(
@@ -207,6 +217,10 @@ async def public_chat(chatbot_id: str, request: PublicChatRequest):
     if user_id:
         from services.plan_service import plan_service
         await plan_service.increment_usage(user_id, "messages", 2)
+    timings = timer.finish()
+    latency_recorder.record(chatbot_id, timings)
+    background_tasks.add_task(store_message_timings, db_instance, ai_message["_id"], timings)
+    unique_visitors.record(chatbot_id, request.session_id, request.user_email)
     
     # Send webhook notification if enabled
     if chatbot.get("webhook_enabled") and chatbot.get("webhook_url"):
@@ -264,77 +278,61 @@ async def get_embed_code(chatbot_id: str, theme: str = "light", position: str =
     )
 
 
+CONVERSATION_CSV_FIELDS = [
+    "conversation_id", "user_name", "user_email", "status", "rating",
+    "created_at", "updated_at", "role", "content", "timestamp"
+]
+CONVERSATION_CSV_HEADER = [
+    "Conversation ID", "User Name", "User Email", "Status", "Rating",
+    "Created At", "Updated At", "Role", "Message", "Timestamp"
+]
+
+
 @router.get("/conversations/{chatbot_id}/export")
-async def export_conversations(chatbot_id: str, format: str = "json"):
-    """Export all conversations for a chatbot"""
-    chatbot = await db_instance.chatbots.find_one({"id": chatbot_id})
+async def export_conversations(chatbot_id: str, format: str = "json", gzip: bool = False):
+    """Export all conversations for a chatbot as JSON, NDJSON or CSV, streamed"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    chatbot = await db_instance.chatbots.find_one({"id": chatbot_id}, {"_id": 1})
     if not chatbot:
         raise HTTPException(status_code=404, detail="Chatbot not found")
     
-    # Get all conversations
-    conversations = await db_instance.conversations.find({"chatbot_id": chatbot_id}).to_list(length=None)
-    
-    # Get messages for each conversation
-    export_data = []
-    for conv in conversations:
-        messages = await db_instance.messages.find({"conversation_id": conv["id"]}).sort("timestamp", 1).to_list(length=None)
-        
-        conv_data = {
-            "conversation_id": conv["id"],
-            "user_name": conv.get("user_name"),
-            "user_email": conv.get("user_email"),
-            "status": conv.get("status", "active"),
-            "rating": conv.get("rating"),
-            "created_at": conv["created_at"].isoformat(),
-            "updated_at": conv.get("updated_at", conv["created_at"]).isoformat(),
-            "message_count": len(messages),
-            "messages": [
-                {
-                    "role": msg["role"],
-                    "content": msg["content"],
-                    "timestamp": msg["timestamp"].isoformat()
+    async def rows():
+        async for conv, messages in conversations_with_messages(
+            db_instance,
+            {"chatbot_id": chatbot_id},
+            chatbot_ids=[chatbot_id],
+            message_projection={"role": 1, "content": 1, "timestamp": 1}
+        ):
+            conv_data = {
+                "conversation_id": conv["id"],
+                "user_name": conv.get("user_name"),
+                "user_email": conv.get("user_email"),
+                "status": conv.get("status", "active"),
+                "rating": conv.get("rating"),
+                "created_at": conv["created_at"],
+                "updated_at": conv.get("updated_at", conv["created_at"]),
+            }
+            if format == "csv":
+                # One row per message
+                for msg in messages:
+                    yield {**conv_data, "role": msg["role"], "content": msg["content"], "timestamp": msg["timestamp"]}
+            else:
+                yield {
+                    **conv_data,
+                    "message_count": len(messages),
+                    "messages": [
+                        {"role": msg["role"], "content": msg["content"], "timestamp": msg["timestamp"]}
+                        for msg in messages
+                    ]
                 }
-                for msg in messages
-            ]
-        }
-        export_data.append(conv_data)
     
-    if format == "csv":
-        # Convert to CSV format
-        import csv
-        from io import StringIO
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["Conversation ID", "User Name", "User Email", "Status", "Rating", "Created At", "Updated At", "Role", "Message", "Timestamp"])
-        
-        for conv in export_data:
-            for msg in conv["messages"]:
-                writer.writerow([
-                    conv["conversation_id"],
-                    conv["user_name"] or "",
-                    conv["user_email"] or "",
-                    conv["status"],
-                    conv["rating"] or "",
-                    conv["created_at"],
-                    conv["updated_at"],
-                    msg["role"],
-                    msg["content"],
-                    msg["timestamp"]
-                ])
-        
-        return Response(
-            content=output.getvalue(),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename=chatbot_{chatbot_id}_export.csv"}
-        )
-    else:
-        # Return JSON
-        return Response(
-            content=json.dumps(export_data, indent=2),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename=chatbot_{chatbot_id}_export.json"}
-        )
+    return export_response(
+        serialize(rows(), format, CONVERSATION_CSV_FIELDS, CONVERSATION_CSV_HEADER),
+        format,
+        f"chatbot_{chatbot_id}_export",
+        compress=gzip
+    )
 
 
 async def send_webhook_notification(webhook_url: str, chatbot_id: str, conversation_id: str, 
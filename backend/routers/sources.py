@@ -3,11 +3,12 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List, Optional
 from datetime import datetime, timezone
 from models import Source, SourceCreate, SourceResponse
-from auth import get_current_user, get_current_user, User
+from auth import get_current_principal, Principal
 from services.document_processor import DocumentProcessor
 from services.website_scraper import WebsiteScraper
-from services.rag_service import RAGService
+from services.rag_service import get_rag_service
 from services.plan_service import plan_service
+from repositories import ChatbotRepository, SourceRepository
 import logging
 import asyncio
 
@@ -16,21 +17,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/sources", tags=["sources"])
 db_instance = None
 rag_service = None
+chatbot_repo = None
+source_repo = None
 
 
 def init_router(db: AsyncIOMotorDatabase):
     """Initialize router with database instance"""
-    global db_instance, rag_service
+    global db_instance, rag_service, chatbot_repo, source_repo
     db_instance = db
-    rag_service = RAGService()
+    chatbot_repo = ChatbotRepository(db)
+    source_repo = SourceRepository(db)
+    rag_service = get_rag_service()
 
 
 async def verify_chatbot_ownership(chatbot_id: str, user_id: str):
     """Verify that the chatbot belongs to the user"""
-    chatbot = await db_instance.chatbots.find_one({
-        "id": chatbot_id,
-        "user_id": user_id
-    })
+    chatbot = await chatbot_repo.get_owned(chatbot_id, user_id)
     if not chatbot:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -42,16 +44,14 @@ async def verify_chatbot_ownership(chatbot_id: str, user_id: str):
 @router.get("/chatbot/{chatbot_id}", response_model=List[SourceResponse])
 async def get_sources(
     chatbot_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get all sources for a chatbot"""
     try:
         # Verify ownership
         await verify_chatbot_ownership(chatbot_id, current_user.id)
         
-        sources = await db_instance.sources.find(
-            {"chatbot_id": chatbot_id}
-        ).to_list(length=None)
+        sources = await source_repo.list_for_chatbot(chatbot_id)
         
         return [SourceResponse(**source) for source in sources]
     except HTTPException:
@@ -68,7 +68,7 @@ async def get_sources(
 async def upload_file_source(
     chatbot_id: str,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Upload a file as a training source (max 100MB)"""
     try:
@@ -176,7 +176,7 @@ async def upload_file_source(
 async def add_website_source(
     chatbot_id: str,
     url: str = Form(...),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Add a website as a training source"""
     try:
@@ -273,7 +273,7 @@ async def add_text_source(
     chatbot_id: str,
     name: str = Form(...),
     content: str = Form(...),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Add text content as a training source"""
     try:
@@ -350,7 +350,7 @@ async def add_text_source(
 @router.delete("/{source_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_source(
     source_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Delete a source"""
     try:
@@ -5,16 +5,14 @@ from datetime import datetime, timedelta
 import uuid
 import secrets
 import hashlib
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from database import get_database
+from services.admin_metrics import admin_metrics
 from bson import ObjectId
 
 router = APIRouter()
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client['chatbase_db']
+# MongoDB connection (shared client)
+db = get_database()
 
 # Models
 class APIKeyCreate(BaseModel):
@@ -678,44 +676,10 @@ async def clear_all_errors(resolved_only: bool = Query(True)):
 
 # Statistics Endpoint
 @router.get("/tech-stats")
-async def get_tech_stats():
+async def get_tech_stats(refresh: bool = Query(False, description="Recompute instead of serving the cached snapshot")):
     """Get overall technical statistics"""
     try:
-        # API Keys stats
-        total_api_keys = await db.api_keys.count_documents({})
-        active_api_keys = await db.api_keys.count_documents({"status": "active"})
-        
-        # Webhooks stats
-        total_webhooks = await db.webhooks.count_documents({})
-        active_webhooks = await db.webhooks.count_documents({"status": "active"})
-        
-        # System logs stats
-        total_logs = await db.system_logs.count_documents({})
-        error_logs = await db.system_logs.count_documents({"level": "error"})
-        warning_logs = await db.system_logs.count_documents({"level": "warning"})
-        
-        # Error tracking stats
-        total_errors = await db.error_tracking.count_documents({})
-        unresolved_errors = await db.error_tracking.count_documents({"resolved": False})
-        
-        return {
-            "api_keys": {
-                "total": total_api_keys,
-                "active": active_api_keys
-            },
-            "webhooks": {
-                "total": total_webhooks,
-                "active": active_webhooks
-            },
-            "system_logs": {
-                "total": total_logs,
-                "errors": error_logs,
-                "warnings": warning_logs
-            },
-            "error_tracking": {
-                "total": total_errors,
-                "unresolved": unresolved_errors
-            }
-        }
+        result = await admin_metrics.get(db, "tech", refresh=refresh)
+        return {**result["metrics"], "snapshot": result["snapshot"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch tech stats: {str(e)}")
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Request, Header, BackgroundTasks
 from typing import Optional
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from repositories import ChatbotRepository, SourceRepository
 import os
 import logging
 import uuid
@@ -14,11 +15,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/telegram", tags=["telegram"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
+chatbot_repo = ChatbotRepository(db)
+source_repo = SourceRepository(db)
 
 # Store active Telegram services per chatbot
 telegram_services = {}
@@ -51,7 +51,7 @@ async def process_telegram_message(
     """Process incoming Telegram message and generate AI response"""
     try:
         # Get chatbot configuration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot not found: {chatbot_id}")
             return
@@ -131,13 +131,8 @@ async def process_telegram_message(
         await db.messages.insert_one(user_message)
         
         # Get knowledge base context
-        sources = await db.sources.find({
-            "chatbot_id": chatbot_id,
-            "status": "completed"
-        }).to_list(length=None)
-        
         context = ""
-        if sources:
+        if await source_repo.has_completed_sources(chatbot_id):
             from services.vector_store import VectorStore
             vector_store = VectorStore()
             relevant_chunks = await vector_store.search(
@@ -282,7 +277,7 @@ async def telegram_webhook(
             
             # Handle /start command
             if message_text.startswith("/start"):
-                chatbot = await db.chatbots.find_one({"id": chatbot_id})
+                chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
                 welcome_message = chatbot.get('welcome_message', 'Hello! How can I help you today?')
                 
                 bot_token = integration['credentials'].get('bot_token')
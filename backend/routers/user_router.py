@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from models import UserResponse, UserUpdate, PasswordChange, User
-from auth import get_current_user, verify_password, get_password_hash
+from auth import get_current_user, verify_password_async, get_password_hash_async
+from services.cache_invalidation import cache_invalidation_bus
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/user", tags=["User Management"])
@@ -69,6 +70,7 @@ async def update_profile(user_update: UserUpdate, current_user: User = Depends(g
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
+    await cache_invalidation_bus.invalidate_users([current_user.id])
     
     # Get updated user
     user_doc = await users_collection.find_one({"email": user_update.email or email})
@@ -111,14 +113,14 @@ async def change_password(password_data: PasswordChange, current_user: User = De
     # For demo/mock users, skip password verification
     if email != "demo-user-123@botsmith.com":
         # Verify current password for real users
-        if not verify_password(password_data.current_password, user_doc['password_hash']):
+        if not await verify_password_async(password_data.current_password, user_doc['password_hash']):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
             )
     
     # Update password
-    new_password_hash = get_password_hash(password_data.new_password)
+    new_password_hash = await get_password_hash_async(password_data.new_password)
     await users_collection.update_one(
         {"email": email},
         {"$set": {
@@ -126,6 +128,7 @@ async def change_password(password_data: PasswordChange, current_user: User = De
             "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await cache_invalidation_bus.invalidate_users([current_user.id])
     
     return {"message": "Password changed successfully"}
 
@@ -141,7 +144,9 @@ async def delete_account(current_user: User = Depends(get_current_user)):
     
     try:
         # Delete associated chatbots
+        chatbot_ids = await db.chatbots.distinct("id", {"user_id": user_id})
         chatbots_result = await db.chatbots.delete_many({"user_id": user_id})
+        await cache_invalidation_bus.invalidate_chatbots(chatbot_ids)
         print(f"Deleted {chatbots_result.deleted_count} chatbots")
         
         # Delete associated sources
@@ -164,6 +169,7 @@ async def delete_account(current_user: User = Depends(get_current_user)):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
+        await cache_invalidation_bus.invalidate_users([user_id])
         
         return {
             "message": "Account and all associated data deleted successfully",
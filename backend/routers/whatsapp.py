@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, Depends
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from repositories import ChatbotRepository
 from datetime import datetime, timezone
 import os
 import logging
@@ -9,16 +10,14 @@ from typing import Dict, Any
 
 from services.whatsapp_service import WhatsAppService
 from services.chat_service import ChatService
-from services.rag_service import RAGService
-from auth import get_current_user
+from services.rag_service import get_rag_service
+from auth import get_current_principal, Principal
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# MongoDB connection (shared client)
+db = get_database()
+chatbot_repo = ChatbotRepository(db)
 
 logger = logging.getLogger(__name__)
 
@@ -42,7 +41,7 @@ async def whatsapp_webhook_verify(
         logger.info(f"Mode: {mode}, Token: {token}, Challenge: {challenge}")
         
         # Get chatbot and integration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot {chatbot_id} not found")
             raise HTTPException(status_code=404, detail="Chatbot not found")
@@ -152,7 +151,7 @@ async def process_whatsapp_message(chatbot_id: str, message: Dict[str, Any], val
         logger.info(f"Processing WhatsApp message from {from_number}: {text_body}")
         
         # Get chatbot configuration
-        chatbot = await db.chatbots.find_one({"id": chatbot_id})
+        chatbot = await chatbot_repo.get_chat_runtime(chatbot_id)
         if not chatbot:
             logger.error(f"Chatbot {chatbot_id} not found")
             return
@@ -263,7 +262,7 @@ async def process_whatsapp_message(chatbot_id: str, message: Dict[str, Any], val
             })
         
         # Get relevant context from knowledge base
-        rag_service = RAGService()
+        rag_service = get_rag_service()
         rag_result = await rag_service.retrieve_relevant_context(
             query=text_body,
             chatbot_id=chatbot_id,
@@ -347,7 +346,7 @@ async def process_whatsapp_message(chatbot_id: str, message: Dict[str, Any], val
 @router.post("/{chatbot_id}/setup-webhook")
 async def setup_whatsapp_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get WhatsApp webhook setup instructions
@@ -417,7 +416,7 @@ async def setup_whatsapp_webhook(
 @router.get("/{chatbot_id}/webhook-info")
 async def get_whatsapp_webhook_info(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get WhatsApp webhook configuration info
@@ -458,7 +457,7 @@ async def get_whatsapp_webhook_info(
 @router.delete("/{chatbot_id}/webhook")
 async def remove_whatsapp_webhook(
     chatbot_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Remove WhatsApp webhook configuration
@@ -503,7 +502,7 @@ async def send_test_message(
     chatbot_id: str,
     recipient_phone: str,
     message: str = "Hello! This is a test message from your chatbot.",
-    current_user: dict = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Send a test message via WhatsApp
@@ -1,32 +1,37 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
+import resource
 from pathlib import Path
 from routers import auth_router, user_router, chatbots, sources, chat, analytics, plans, advanced_analytics, public_chat, lemonsqueezy, admin, admin_users, admin_users_enhanced, admin_chatbots, notifications, integrations, password_reset, telegram, slack, discord, msteams, instagram, admin_leads, leads, tech_management, whatsapp, messenger, payment_settings, admin_settings
 import auth
+from database import get_database, get_client, close_client, get_pool_stats
 from services.plan_service import plan_service
-from typing import Dict
-import json
+from services.notification_hub import notification_hub
 
 # Import security middleware
 from middleware.security import (
+    SecurityPipeline,
     SecurityHeadersMiddleware,
     RateLimitMiddleware,
     InputValidationMiddleware,
     APIKeyProtectionMiddleware
 )
+from middleware.rate_limiter import MongoRateLimitBackend
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (single shared client per worker)
+client = get_client()
+db = get_database()
 
 # Initialize auth module with database
 auth.init_auth(db)
@@ -47,30 +52,9 @@ admin_users_enhanced.init_router(db)
 admin_chatbots.init_router(db)
 notifications.init_router(db)
 
-# WebSocket connection manager for real-time notifications
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"WebSocket connected for user: {user_id}")
-    
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"WebSocket disconnected for user: {user_id}")
-    
-    async def send_notification(self, user_id: str, notification: dict):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(notification))
-            except Exception as e:
-                logger.error(f"Error sending notification to {user_id}: {e}")
-                self.disconnect(user_id)
-
-manager = ConnectionManager()
+# Filled in by startup_event; served at /api/health/startup
+startup_report = {"import_ms": round((time.perf_counter() - _import_started) * 1000, 1)}
+deferred_startup_task = None
 
 # Create the main app without a prefix
 # Set max upload size to 100MB
@@ -94,6 +78,16 @@ api_router = APIRouter(prefix="/api")
 async def root():
     return {"message": "BotSmith API", "status": "running"}
 
+# MongoDB connection pool metrics for this worker
+@api_router.get("/health/db-pool", dependencies=[Depends(auth.get_current_admin)])
+async def db_pool_stats():
+    return get_pool_stats()
+
+# Startup phase timings and memory of this worker
+@api_router.get("/health/startup")
+async def startup_stats():
+    return startup_report
+
 # Include all routers
 api_router.include_router(auth_router.router)
 api_router.include_router(user_router.router)
@@ -136,19 +130,23 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-# Security headers middleware
-app.add_middleware(SecurityHeadersMiddleware)
-
-# Rate limiting middleware (200 requests/min, 5000 requests/hour)
-app.add_middleware(RateLimitMiddleware, requests_per_minute=200, requests_per_hour=5000)
-
-# Input validation middleware
-app.add_middleware(InputValidationMiddleware)
-
-# API key protection middleware
-app.add_middleware(APIKeyProtectionMiddleware)
+# Security middleware: one pure-ASGI layer running, in order, API key
+# exposure scanning, input validation, rate limiting and security headers
+# Rate limiting: 200 requests/min, 5000 requests/hour per IP
+# RATE_LIMIT_BACKEND=mongo shares counters between workers; default is per-worker memory
+rate_limit_backend = MongoRateLimitBackend(db) if os.environ.get('RATE_LIMIT_BACKEND') == 'mongo' else None
+app.add_middleware(
+    SecurityPipeline,
+    stages=[
+        APIKeyProtectionMiddleware(),
+        InputValidationMiddleware(),
+        RateLimitMiddleware(requests_per_minute=200, requests_per_hour=5000, backend=rate_limit_backend),
+        SecurityHeadersMiddleware(),
+    ]
+)
 
 # Configure logging
 logging.basicConfig(
@@ -157,30 +155,171 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _warm_up_heavy_modules():
+    """Import the LLM client stack and load the tokenizer (runs in a thread)"""
+    import importlib
+    from services.chunking_service import get_tokenizer
+    importlib.import_module("emergentintegrations.llm.chat")
+    get_tokenizer()
+
+
+async def deferred_startup():
+    """Work that does not need to finish before the worker serves requests"""
+    try:
+        from services.index_service import index_service
+        index_report = await index_service.get_index_report(db)
+        if index_report["missing"]:
+            logger.warning(f"Missing indexes: {index_report['missing']}")
+        if index_report["unused"]:
+            logger.info(f"Indexes with no recorded usage: {index_report['unused']}")
+    except Exception as e:
+        logger.warning(f"Failed to build index report: {str(e)}")
+
+    # Load heavy dependencies off the event loop so the first chat does not pay for them
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(_warm_up_heavy_modules)
+        startup_report["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    except Exception as e:
+        logger.warning(f"Failed to warm up chat dependencies: {str(e)}")
+
+    # Start Discord bots for enabled integrations
+    try:
+        logger.info("Starting Discord bots...")
+        from services.discord_bot_manager import discord_bot_manager
+        result = await discord_bot_manager.restart_all_bots()
+        if result.get("success"):
+            logger.info(f"Discord bots started: {result.get('count', 0)} bots")
+        else:
+            logger.warning(f"Discord bot startup issue: {result.get('error')}")
+    except Exception as e:
+        logger.warning(f"Failed to start Discord bots: {str(e)}")
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize plans and Discord bots on startup"""
-    logger.info("Initializing plans...")
-    await plan_service.initialize_plans()
-    logger.info("Plans initialized successfully")
+    """
+    Bring up what requests depend on, then hand the rest to deferred_startup()
+
+    Phase durations, import time and peak memory are kept in startup_report.
+    """
+    global deferred_startup_task
+    phases = {}
+    phase_started = time.perf_counter()
+
+    def mark(phase: str):
+        nonlocal phase_started
+        now = time.perf_counter()
+        phases[phase] = round((now - phase_started) * 1000, 1)
+        phase_started = now
+
+    # Ensure hot-path indexes exist (idempotent, built in the background)
+    try:
+        from services.index_service import index_service
+        index_result = await index_service.ensure_indexes(db)
+        created = sum(len(names) for names in index_result["created"].values())
+        logger.info(f"Indexes ensured ({created} created)")
+        if index_result["failed"]:
+            logger.warning(f"Index creation failed for: {index_result['failed']}")
+    except Exception as e:
+        logger.warning(f"Failed to ensure indexes: {str(e)}")
+    mark("indexes")
+
+    # Start listening for cache invalidations from other workers
+    try:
+        from services.cache_invalidation import cache_invalidation_bus
+        await cache_invalidation_bus.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start cache invalidation bus: {str(e)}")
+    mark("cache_invalidation_bus")
+
+    # Real-time notifications reach sockets on every worker through the broker
+    # (NOTIFICATION_BROKER=memory keeps delivery within this worker)
+    try:
+        from services.notification_hub import MongoNotificationBroker, InMemoryNotificationBroker
+        if os.environ.get('NOTIFICATION_BROKER', 'mongo') == 'memory':
+            await notification_hub.start(InMemoryNotificationBroker())
+        else:
+            await notification_hub.start(MongoNotificationBroker(db))
+    except Exception as e:
+        logger.warning(f"Failed to start notification hub: {str(e)}")
+
+    # Batch notification inserts and channel sends in the background
+    from services.notification_pipeline import notification_pipeline
+    await notification_pipeline.start(db)
+
+    # Fold repeated notifications into digests (NOTIFICATION_DIGEST_WINDOWS)
+    from services.notification_digest import notification_digester
+    await notification_digester.start(db)
+    mark("notifications")
+
+    # Roll closed hours of chat activity up for the analytics endpoints
+    try:
+        from services.analytics_rollup import analytics_rollup
+        await analytics_rollup.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start analytics rollup job: {str(e)}")
+
+    # Fold per-stage chat timings into daily quantile sketches
+    try:
+        from services.latency_sketch import latency_recorder
+        await latency_recorder.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start latency recorder: {str(e)}")
+
+    # Count unique sessions and users per chatbot and day
+    try:
+        from services.unique_visitors import unique_visitors
+        await unique_visitors.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start unique visitor counter: {str(e)}")
+
+    # Keep per-day heavy-hitter summaries of user questions
+    try:
+        from services.top_questions import top_questions
+        await top_questions.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start top questions job: {str(e)}")
+
+    # Cluster user questions into themes and check their knowledge base coverage
+    try:
+        from services.question_clustering import question_clustering
+        await question_clustering.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start question clustering job: {str(e)}")
+
+    # Keep the admin dashboard counts precomputed
+    try:
+        from services.admin_metrics import admin_metrics
+        await admin_metrics.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start admin metrics job: {str(e)}")
+
+    # Re-score churn risk for all users daily
+    try:
+        from services.churn_scoring import churn_scoring
+        await churn_scoring.start(db)
+    except Exception as e:
+        logger.warning(f"Failed to start churn scoring job: {str(e)}")
+
+    changed = await plan_service.initialize_plans()
+    logger.info(f"Plans up to date ({changed} written)")
+    mark("plans")
     
     # Create default admin user if no users exist
     try:
-        logger.info("Checking for existing users...")
-        from datetime import datetime, timezone
-        from auth import get_password_hash
-        from models import User
-        
         users_collection = db.users
-        user_count = await users_collection.count_documents({})
-        
-        if user_count == 0:
+        if await users_collection.find_one({}, {"_id": 1}) is None:
+            from datetime import datetime, timezone
+            from auth import get_password_hash_async
+            from models import User
+
             logger.info("No users found. Creating default admin user...")
             default_admin = User(
                 id="admin-001",
                 name="Admin User",
                 email="admin@botsmith.com",
-                password_hash=get_password_hash("admin123"),
+                password_hash=await get_password_hash_async("admin123"),
                 role="admin",
                 status="active",
                 created_at=datetime.now(timezone.utc),
@@ -200,25 +339,26 @@ async def startup_event():
             logger.info("   Email: admin@botsmith.com")
             logger.info("   Password: admin123")
             logger.info("   ⚠️  IMPORTANT: Please change the password after first login!")
-        else:
-            logger.info(f"Found {user_count} existing users. Skipping default user creation.")
     except Exception as e:
         logger.error(f"Failed to create default admin user: {str(e)}")
-    
-    # Start Discord bots for enabled integrations
-    try:
-        logger.info("Starting Discord bots...")
-        from services.discord_bot_manager import discord_bot_manager
-        result = await discord_bot_manager.restart_all_bots()
-        if result.get("success"):
-            logger.info(f"Discord bots started: {result.get('count', 0)} bots")
-        else:
-            logger.warning(f"Discord bot startup issue: {result.get('error')}")
-    except Exception as e:
-        logger.warning(f"Failed to start Discord bots: {str(e)}")
+    mark("default_admin")
+
+    deferred_startup_task = asyncio.create_task(deferred_startup())
+
+    startup_report["phases_ms"] = phases
+    startup_report["startup_ms"] = round(sum(phases.values()), 1)
+    # ru_maxrss is in kilobytes on Linux
+    startup_report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    logger.info(
+        f"Worker ready: imports {startup_report['import_ms']} ms, startup {startup_report['startup_ms']} ms "
+        f"{phases}, peak RSS {startup_report['max_rss_mb']} MB"
+    )
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if deferred_startup_task is not None and not deferred_startup_task.done():
+        deferred_startup_task.cancel()
+    
     # Stop all Discord bots
     try:
         from services.discord_bot_manager import discord_bot_manager
@@ -227,21 +367,94 @@ async def shutdown_db_client():
     except Exception as e:
         logger.warning(f"Error stopping Discord bots: {str(e)}")
     
-    client.close()
+    try:
+        from services.analytics_rollup import analytics_rollup
+        await analytics_rollup.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping analytics rollup job: {str(e)}")
+    
+    try:
+        from services.latency_sketch import latency_recorder
+        await latency_recorder.stop()
+    except Exception as e:
+        logger.warning(f"Error flushing latency sketches: {str(e)}")
+    
+    try:
+        from services.unique_visitors import unique_visitors
+        await unique_visitors.stop()
+    except Exception as e:
+        logger.warning(f"Error flushing unique visitor sketches: {str(e)}")
+    
+    try:
+        from services.top_questions import top_questions
+        await top_questions.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping top questions job: {str(e)}")
+    
+    try:
+        from services.question_clustering import question_clustering
+        await question_clustering.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping question clustering job: {str(e)}")
+    
+    try:
+        from services.admin_metrics import admin_metrics
+        await admin_metrics.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping admin metrics job: {str(e)}")
+    
+    try:
+        from services.churn_scoring import churn_scoring
+        await churn_scoring.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping churn scoring job: {str(e)}")
+    
+    try:
+        from services.cache_invalidation import cache_invalidation_bus
+        await cache_invalidation_bus.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping cache invalidation bus: {str(e)}")
+    
+    try:
+        from services.notification_digest import notification_digester
+        await notification_digester.stop()
+    except Exception as e:
+        logger.warning(f"Error writing notification digests: {str(e)}")
+    
+    try:
+        from services.notification_pipeline import notification_pipeline
+        await notification_pipeline.stop()
+    except Exception as e:
+        logger.warning(f"Error flushing notification pipeline: {str(e)}")
+    
+    try:
+        await notification_hub.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping notification hub: {str(e)}")
+    
+    from services.password_hasher import password_hasher
+    password_hasher.shutdown()
+    
+    close_client()
 
 
 # WebSocket endpoint for real-time notifications
 @app.websocket("/ws/notifications/{user_id}")
 async def websocket_notifications(websocket: WebSocket, user_id: str):
-    await manager.connect(user_id, websocket)
+    connection = await notification_hub.connect(user_id, websocket)
     try:
         while True:
             # Keep connection alive and listen for any messages
-            data = await websocket.receive_text()
+            text = await websocket.receive_text()
+            notification_hub.touch(connection)
+            if text == "pong":
+                # Answer to a heartbeat ping
+                continue
             # Echo back to confirm connection is alive
-            await websocket.send_text(json.dumps({"type": "ping", "message": "Connection alive"}))
+            await notification_hub.send(user_id, connection, {"type": "ping", "message": "Connection alive"})
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(user_id)
\ No newline at end of file
+    finally:
+        notification_hub.disconnect(user_id, connection)
\ No newline at end of file
@@ -0,0 +1,271 @@
+from typing import Any, Awaitable, Callable, Dict
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from services.leased_job import LeasedJob, utcnow
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Plans counted in the user statistics
+PLAN_IDS = ("free", "starter", "professional", "enterprise")
+
+
+async def facet_counts(collection: AsyncIOMotorCollection, queries: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Count several filters over a collection in one aggregation
+
+    Args:
+        collection: Collection to count
+        queries: {name: filter}
+
+    Returns:
+        {name: matching documents}
+    """
+    pipeline = [{"$facet": {name: [{"$match": query}, {"$count": "n"}] for name, query in queries.items()}}]
+    docs = await collection.aggregate(pipeline).to_list(length=1)
+    facets = docs[0] if docs else {}
+    return {name: facets[name][0]["n"] if facets.get(name) else 0 for name in queries}
+
+
+def _since_facets(field: str, starts: Dict[str, datetime]) -> Dict[str, Dict[str, Any]]:
+    # Dates are stored both as datetimes and as ISO strings
+    return {
+        name: {"$or": [{field: {"$gte": start}}, {field: {"$gte": start.isoformat()}}]}
+        for name, start in starts.items()
+    }
+
+
+async def compute_overview(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    users, chatbots, messages, integrations = await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.chatbots.estimated_document_count(),
+        db.messages.estimated_document_count(),
+        db.integrations.count_documents({"enabled": True})
+    )
+    return {
+        "totalUsers": users,
+        "activeChatbots": chatbots,
+        "totalMessages": messages,
+        "activeIntegrations": integrations
+    }
+
+
+async def compute_database(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    names = ["chatbots", "sources", "conversations", "messages"]
+    has_plans = "plans" in await db.list_collection_names()
+    counted = names + (["plans"] if has_plans else [])
+    counts, coll_stats = await asyncio.gather(
+        asyncio.gather(*(db[name].estimated_document_count() for name in counted)),
+        asyncio.gather(*(db.command("collStats", name) for name in names), return_exceptions=True)
+    )
+    stats = dict(zip(counted, counts))
+    stats.setdefault("plans", 0)
+
+    collections_info = []
+    for name, result in zip(names, coll_stats):
+        if isinstance(result, Exception):
+            logger.warning(f"Error fetching stats for {name}: {str(result)}")
+            continue
+        collections_info.append({
+            "name": name,
+            "count": result.get("count", 0),
+            "size": result.get("size", 0),
+            "avgObjSize": result.get("avgObjSize", 0)
+        })
+
+    return {
+        "counts": stats,
+        "collections": collections_info,
+        "total_documents": sum(stats.values())
+    }
+
+
+async def compute_tech(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    (
+        api_keys_total, api_keys, webhooks_total, webhooks,
+        logs_total, logs, errors_total, errors
+    ) = await asyncio.gather(
+        db.api_keys.estimated_document_count(),
+        facet_counts(db.api_keys, {"active": {"status": "active"}}),
+        db.webhooks.estimated_document_count(),
+        facet_counts(db.webhooks, {"active": {"status": "active"}}),
+        db.system_logs.estimated_document_count(),
+        facet_counts(db.system_logs, {"errors": {"level": "error"}, "warnings": {"level": "warning"}}),
+        db.error_tracking.estimated_document_count(),
+        facet_counts(db.error_tracking, {"unresolved": {"resolved": False}})
+    )
+    return {
+        "api_keys": {"total": api_keys_total, **api_keys},
+        "webhooks": {"total": webhooks_total, **webhooks},
+        "system_logs": {"total": logs_total, **logs},
+        "error_tracking": {"total": errors_total, **errors}
+    }
+
+
+async def compute_users(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+
+    user_queries = {
+        "active": {"status": "active"},
+        "suspended": {"status": "suspended"},
+        "banned": {"status": "banned"},
+        "admin": {"role": "admin"},
+        "moderator": {"role": "moderator"},
+        "user": {"role": "user"},
+        "verified": {"email_verified": True},
+        "unverified": {"email_verified": False},
+        **_since_facets("created_at", {
+            "new_today": today, "new_this_week": week_ago, "new_this_month": month_ago
+        }),
+        **_since_facets("last_login", {"active_today": today, "active_this_week": week_ago})
+    }
+    plans_pipeline = [
+        {"$match": {"plan_id": {"$in": list(PLAN_IDS)}}},
+        {"$group": {"_id": "$plan_id", "n": {"$sum": 1}}}
+    ]
+    total_users, users, plans, total_chatbots = await asyncio.gather(
+        db.users.estimated_document_count(),
+        facet_counts(db.users, user_queries),
+        db.subscriptions.aggregate(plans_pipeline).to_list(length=None),
+        db.chatbots.estimated_document_count()
+    )
+    by_plan = {doc["_id"]: doc["n"] for doc in plans}
+
+    return {
+        "total_users": total_users,
+        "by_status": {key: users[key] for key in ("active", "suspended", "banned")},
+        "by_role": {key: users[key] for key in ("admin", "moderator", "user")},
+        "activity": {
+            key: users[key]
+            for key in ("new_today", "new_this_week", "new_this_month", "active_today", "active_this_week")
+        },
+        "subscriptions": {plan_id: by_plan.get(plan_id, 0) for plan_id in PLAN_IDS},
+        "total_chatbots": total_chatbots,
+        "email_verification": {key: users[key] for key in ("verified", "unverified")}
+    }
+
+
+class AdminMetricsService(LeasedJob):
+    """
+    Precomputed counts for the admin dashboards.
+
+    The admin stats pages used to run a dozen sequential count_documents()
+    over the largest collections on every view. Each page now has a named
+    group of metrics, computed with concurrent queries - collection
+    metadata counts for plain totals, one $facet aggregation per collection
+    for filtered counts - and stored as a snapshot document in
+    `admin_metrics`. A leased job refreshes all groups on a schedule so
+    only one worker does the counting; endpoints read the snapshot and
+    report its age, and can ask for a fresh one on demand.
+    """
+
+    COLLECTION = "admin_metrics"
+    STATE = "admin_metrics_state"
+    STATE_ID = "refresh"
+    NAME = "Admin metrics refresh"
+
+    def __init__(self, interval_seconds: float = 60.0, max_age_seconds: float = 600.0):
+        """
+        Args:
+            interval_seconds: How often the job recomputes the snapshots
+            max_age_seconds: Snapshots older than this are recomputed when read
+        """
+        # The lease outlives one interval, so the worker that holds it keeps
+        # the job from run to run
+        super().__init__(interval_seconds, max(interval_seconds * 2, 120))
+        self.max_age = max_age_seconds
+        self.groups: Dict[str, Callable[[AsyncIOMotorDatabase], Awaitable[Dict[str, Any]]]] = {
+            "overview": compute_overview,
+            "database": compute_database,
+            "tech": compute_tech,
+            "users": compute_users,
+        }
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.runs = 0
+        self.refreshes = 0
+
+    async def run_once(self) -> int:
+        """
+        Recompute every group
+
+        Returns:
+            Number of groups refreshed (0 if another worker holds the job)
+        """
+        if await self._acquire_lease(utcnow()) is None:
+            return 0
+
+        results = await asyncio.gather(
+            *(self.refresh(self.db, group) for group in self.groups),
+            return_exceptions=True
+        )
+        refreshed = 0
+        for group, result in zip(self.groups, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to refresh admin metrics '{group}': {str(result)}")
+            else:
+                refreshed += 1
+        self.runs += 1
+        return refreshed
+
+    async def refresh(self, db: AsyncIOMotorDatabase, group: str) -> Dict[str, Any]:
+        """Compute a group now and store it as the current snapshot"""
+        lock = self._locks.setdefault(group, asyncio.Lock())
+        waited = lock.locked()
+        async with lock:
+            if waited:
+                # Another request of this worker just refreshed the group
+                snapshot = await db[self.COLLECTION].find_one({"_id": group})
+                if snapshot is not None:
+                    return snapshot
+            started = time.perf_counter()
+            metrics = await self.groups[group](db)
+            snapshot = {
+                "_id": group,
+                "metrics": metrics,
+                "generated_at": utcnow(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+            await db[self.COLLECTION].replace_one({"_id": group}, snapshot, upsert=True)
+            self.refreshes += 1
+            return snapshot
+
+    async def get(self, db: AsyncIOMotorDatabase, group: str, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Current snapshot of a group
+
+        Args:
+            db: Database instance
+            group: One of self.groups
+            refresh: Recompute instead of reading the stored snapshot
+
+        Returns:
+            {"metrics": {...}, "snapshot": {"generated_at", "age_seconds", "duration_ms"}}
+        """
+        snapshot = None if refresh else await db[self.COLLECTION].find_one({"_id": group})
+        if snapshot is None or (utcnow() - snapshot["generated_at"]).total_seconds() > self.max_age:
+            snapshot = await self.refresh(db, group)
+
+        generated_at = snapshot["generated_at"]
+        return {
+            "metrics": snapshot["metrics"],
+            "snapshot": {
+                "generated_at": generated_at.replace(tzinfo=timezone.utc).isoformat(),
+                "age_seconds": round(max((utcnow() - generated_at).total_seconds(), 0.0), 1),
+                "duration_ms": snapshot.get("duration_ms")
+            }
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "refreshes": self.refreshes
+        }
+
+
+# Global service; server.py starts it with the database on startup
+admin_metrics = AdminMetricsService()
@@ -0,0 +1,399 @@
+from typing import Any, Dict, Iterable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from datetime import datetime, timedelta, timezone
+from services.leased_job import LeasedJob, utcnow
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Counters that add up across hours and days
+SUM_FIELDS = [
+    "messages", "user_messages", "assistant_messages", "conversations",
+    "response_count", "response_ms_sum",
+    "ratings", "rating_sum", "rating_1", "rating_2", "rating_3", "rating_4", "rating_5",
+]
+
+# A user message this long before a range still counts as the prompt of the
+# first reply inside it
+RESPONSE_LOOKBACK = timedelta(minutes=10)
+
+# Documents of an hour that just closed may still be in flight (their
+# timestamp is set before the insert), so the job waits this long before
+# rolling the hour up
+ROLLUP_LAG = timedelta(seconds=30)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _truncate(field: str, unit: str) -> Dict[str, Any]:
+    parts = {"year": {"$year": field}, "month": {"$month": field}, "day": {"$dayOfMonth": field}}
+    if unit == "hour":
+        parts["hour"] = {"$hour": field}
+    return {"$dateFromParts": parts}
+
+
+def _bucket_id(unit: str) -> Dict[str, Any]:
+    date_format = "%Y-%m-%dT%H" if unit == "hour" else "%Y-%m-%d"
+    return {"$concat": ["$_id.chatbot_id", "|", {"$dateToString": {"format": date_format, "date": f"$_id.{unit}"}}]}
+
+
+def empty_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = {field: 0 for field in SUM_FIELDS}
+    stats["response_ms_min"] = None
+    stats["response_ms_max"] = None
+    stats["messages_by_hour"] = [0] * 24
+    return stats
+
+
+def add_stats(total: Dict[str, Any], bucket: Dict[str, Any]):
+    """Add an hourly or daily bucket into total (in place)"""
+    for field in SUM_FIELDS:
+        total[field] += bucket.get(field) or 0
+    for field, pick in (("response_ms_min", min), ("response_ms_max", max)):
+        value = bucket.get(field)
+        if value is not None:
+            total[field] = value if total[field] is None else pick(total[field], value)
+    if "messages_by_hour" in bucket:
+        for hour, count in enumerate(bucket["messages_by_hour"]):
+            total["messages_by_hour"][hour] += count or 0
+    elif "hour" in bucket:
+        total["messages_by_hour"][bucket["hour"].hour] += bucket.get("messages") or 0
+
+
+class AnalyticsRollupService(LeasedJob):
+    """
+    Per-chatbot hourly and daily analytics rollups.
+
+    A background job rolls closed hours of `messages`, `conversations` and
+    `conversation_ratings` up into `analytics_hourly` with aggregation
+    pipelines ending in $merge (counts by role, reply latency from each
+    assistant message to the user message before it, ratings), then
+    rebuilds the touched days of `analytics_daily` from the hourly buckets.
+    `analytics_rollup_state.rolled_up_to` marks the end of rolled-up time.
+    Every hour is recomputed as a whole, so reruns are idempotent, and a
+    lease keeps concurrent workers from doing the same work.
+
+    Readers combine daily buckets for whole days, hourly buckets for the
+    rest of the rolled-up time and a live aggregation for the open hour,
+    so a dashboard costs O(days) instead of O(messages) and is still exact.
+    """
+
+    HOURLY = "analytics_hourly"
+    DAILY = "analytics_daily"
+    STATE = "analytics_rollup_state"
+    STATE_ID = "hourly"
+    NAME = "Analytics rollup"
+
+    def __init__(
+        self,
+        interval_seconds: float = 300.0,
+        chunk_hours: int = 24 * 7,
+        lease_seconds: int = 1800
+    ):
+        """
+        Args:
+            interval_seconds: Pause between catch-up runs
+            chunk_hours: Hours rolled up per aggregation during a catch-up
+                (the first run starts at the oldest message)
+            lease_seconds: How long a worker may hold the job before
+                another one takes over
+        """
+        super().__init__(interval_seconds, lease_seconds)
+        self.chunk = timedelta(hours=chunk_hours)
+        self.runs = 0
+        self.hours_rolled_up = 0
+
+    # ------------------------------------------------------------------
+    # Pipelines
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _finish_hourly(fields: Iterable[str]) -> List[Dict[str, Any]]:
+        return [{
+            "$project": {
+                "_id": _bucket_id("hour"),
+                "chatbot_id": "$_id.chatbot_id",
+                "hour": "$_id.hour",
+                **{field: 1 for field in fields}
+            }
+        }]
+
+    def _message_pipeline(self, start: datetime, end: datetime, chatbot_ids: Optional[List[str]] = None) -> List[Dict]:
+        match: Dict[str, Any] = {"timestamp": {"$gte": start - RESPONSE_LOOKBACK, "$lt": end}}
+        match["chatbot_id"] = {"$in": chatbot_ids} if chatbot_ids is not None else {"$type": "string"}
+        is_reply = {"$gt": ["$response_ms", 0]}
+        fields = {
+            "messages": {"$sum": 1},
+            "user_messages": {"$sum": {"$cond": [{"$eq": ["$role", "user"]}, 1, 0]}},
+            "assistant_messages": {"$sum": {"$cond": [{"$eq": ["$role", "assistant"]}, 1, 0]}},
+            "response_count": {"$sum": {"$cond": [is_reply, 1, 0]}},
+            "response_ms_sum": {"$sum": {"$cond": [is_reply, "$response_ms", 0]}},
+            "response_ms_min": {"$min": {"$cond": [is_reply, "$response_ms", None]}},
+            "response_ms_max": {"$max": {"$cond": [is_reply, "$response_ms", None]}},
+        }
+        return [
+            {"$match": match},
+            {"$project": {"_id": 0, "chatbot_id": 1, "conversation_id": 1, "role": 1, "timestamp": 1}},
+            {"$setWindowFields": {
+                "partitionBy": "$conversation_id",
+                "sortBy": {"timestamp": 1},
+                "output": {
+                    "prev_role": {"$shift": {"output": "$role", "by": -1}},
+                    "prev_timestamp": {"$shift": {"output": "$timestamp", "by": -1}},
+                }
+            }},
+            {"$match": {"timestamp": {"$gte": start}}},
+            {"$set": {"response_ms": {"$cond": [
+                {"$and": [{"$eq": ["$role", "assistant"]}, {"$eq": ["$prev_role", "user"]}]},
+                {"$subtract": ["$timestamp", "$prev_timestamp"]},
+                None
+            ]}}},
+            {"$group": {"_id": {"chatbot_id": "$chatbot_id", "hour": _truncate("$timestamp", "hour")}, **fields}},
+            *self._finish_hourly(fields),
+        ]
+
+    def _conversation_pipeline(self, start: datetime, end: datetime, chatbot_ids: Optional[List[str]] = None) -> List[Dict]:
+        match: Dict[str, Any] = {"created_at": {"$gte": start, "$lt": end}}
+        match["chatbot_id"] = {"$in": chatbot_ids} if chatbot_ids is not None else {"$type": "string"}
+        return [
+            {"$match": match},
+            {"$group": {"_id": {"chatbot_id": "$chatbot_id", "hour": _truncate("$created_at", "hour")}, "conversations": {"$sum": 1}}},
+            *self._finish_hourly(["conversations"]),
+        ]
+
+    def _rating_pipeline(self, start: datetime, end: datetime, chatbot_ids: Optional[List[str]] = None) -> List[Dict]:
+        match: Dict[str, Any] = {"created_at": {"$gte": start, "$lt": end}}
+        match["chatbot_id"] = {"$in": chatbot_ids} if chatbot_ids is not None else {"$type": "string"}
+        fields = {
+            "ratings": {"$sum": 1},
+            "rating_sum": {"$sum": "$rating"},
+            **{f"rating_{value}": {"$sum": {"$cond": [{"$eq": ["$rating", value]}, 1, 0]}} for value in range(1, 6)}
+        }
+        return [
+            {"$match": match},
+            {"$group": {"_id": {"chatbot_id": "$chatbot_id", "hour": _truncate("$created_at", "hour")}, **fields}},
+            *self._finish_hourly(fields),
+        ]
+
+    def _daily_pipeline(self, start: datetime, end: datetime) -> List[Dict]:
+        messages_in_hour = {
+            f"h{hour:02d}": {"$sum": {"$cond": [{"$eq": [{"$hour": "$hour"}, hour]}, {"$ifNull": ["$messages", 0]}, 0]}}
+            for hour in range(24)
+        }
+        return [
+            {"$match": {"hour": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {"chatbot_id": "$chatbot_id", "day": _truncate("$hour", "day")},
+                **{field: {"$sum": f"${field}"} for field in SUM_FIELDS},
+                "response_ms_min": {"$min": "$response_ms_min"},
+                "response_ms_max": {"$max": "$response_ms_max"},
+                **messages_in_hour
+            }},
+            {"$project": {
+                "_id": _bucket_id("day"),
+                "chatbot_id": "$_id.chatbot_id",
+                "day": "$_id.day",
+                **{field: 1 for field in SUM_FIELDS},
+                "response_ms_min": 1,
+                "response_ms_max": 1,
+                "messages_by_hour": [f"$h{hour:02d}" for hour in range(24)]
+            }},
+            {"$merge": {"into": self.DAILY, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+
+    # ------------------------------------------------------------------
+    # Catch-up job
+    # ------------------------------------------------------------------
+
+    async def run_once(self) -> int:
+        """
+        Roll every closed hour since the last run up (in chunks)
+
+        Returns:
+            Number of hours rolled up (0 if another worker holds the job)
+        """
+        now = utcnow()
+        state = await self._acquire_lease(now)
+        if state is None:
+            return 0
+
+        target = _floor_hour(now - ROLLUP_LAG)
+        rolled_up_to = state.get("rolled_up_to") or await self._oldest_activity(self.db, target)
+        hours = 0
+        try:
+            while rolled_up_to < target:
+                chunk_end = min(target, rolled_up_to + self.chunk)
+                await self._rollup_range(rolled_up_to, chunk_end)
+                if not await self._renew_lease({"rolled_up_to": chunk_end}):
+                    break
+                hours += int((chunk_end - rolled_up_to).total_seconds() // 3600)
+                rolled_up_to = chunk_end
+        finally:
+            await self._release_lease()
+
+        self.runs += 1
+        self.hours_rolled_up += hours
+        if hours:
+            logger.info(f"Analytics rolled up to {rolled_up_to.isoformat()} ({hours} hours)")
+        return hours
+
+    async def _oldest_activity(
+        self,
+        db: AsyncIOMotorDatabase,
+        default: datetime,
+        chatbot_ids: Optional[List[str]] = None
+    ) -> datetime:
+        """Day of the oldest message, conversation or rating (uses the time indexes)"""
+        sources = [("messages", "timestamp"), ("conversations", "created_at")]
+        if chatbot_ids is None:
+            # A rating never predates its conversation, so per chatbot the
+            # (chatbot_id, created_at) index of conversations is enough
+            sources.append(("conversation_ratings", "created_at"))
+        oldest = default
+        for collection, field in sources:
+            query: Dict[str, Any] = {field: {"$type": "date"}}
+            if chatbot_ids is not None:
+                query["chatbot_id"] = {"$in": chatbot_ids}
+            doc = await db[collection].find_one(query, {"_id": 0, field: 1}, sort=[(field, 1)])
+            if doc:
+                oldest = min(oldest, doc[field])
+        return _floor_day(oldest)
+
+    async def _rollup_range(self, start: datetime, end: datetime):
+        merge = {"$merge": {"into": self.HOURLY, "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+        await self.db.messages.aggregate(self._message_pipeline(start, end) + [merge], allowDiskUse=True).to_list(None)
+        await self.db.conversations.aggregate(self._conversation_pipeline(start, end) + [merge]).to_list(None)
+        await self.db.conversation_ratings.aggregate(self._rating_pipeline(start, end) + [merge]).to_list(None)
+
+        # Rebuild every day the range touched from its hourly buckets
+        day_start = _floor_day(start)
+        day_end = _floor_day(end - timedelta(microseconds=1)) + timedelta(days=1)
+        await self.db[self.HOURLY].aggregate(self._daily_pipeline(day_start, day_end)).to_list(None)
+
+    async def adjust_rating(self, db: AsyncIOMotorDatabase, chatbot_id: str, rated_at: datetime, rating: int):
+        """
+        Take a replaced rating back out of the rollups
+
+        Ratings are rolled up by their created_at, so when a rating is
+        changed the old value would otherwise stay counted in its hour.
+        Nothing to do if that hour has not been rolled up yet.
+        """
+        rolled_up_to = await self.get_rolled_up_to(db)
+        rated_at = _naive_utc(rated_at)
+        if rolled_up_to is None or rated_at >= rolled_up_to:
+            return
+        update = {"$inc": {"ratings": -1, "rating_sum": -rating, f"rating_{rating}": -1}}
+        hour = _floor_hour(rated_at)
+        await db[self.HOURLY].update_one({"_id": f"{chatbot_id}|{hour.strftime('%Y-%m-%dT%H')}"}, update)
+        await db[self.DAILY].update_one({"_id": f"{chatbot_id}|{hour.strftime('%Y-%m-%d')}"}, update)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    async def get_rolled_up_to(self, db: AsyncIOMotorDatabase) -> Optional[datetime]:
+        state = await db[self.STATE].find_one({"_id": self.STATE_ID}, {"rolled_up_to": 1})
+        return state.get("rolled_up_to") if state else None
+
+    async def _live_buckets(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_ids: List[str],
+        start: datetime,
+        end: datetime
+    ) -> List[Dict[str, Any]]:
+        results = await asyncio.gather(
+            db.messages.aggregate(self._message_pipeline(start, end, chatbot_ids), allowDiskUse=True).to_list(None),
+            db.conversations.aggregate(self._conversation_pipeline(start, end, chatbot_ids)).to_list(None),
+            db.conversation_ratings.aggregate(self._rating_pipeline(start, end, chatbot_ids)).to_list(None),
+        )
+        return [bucket for buckets in results for bucket in buckets]
+
+    async def get_daily(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_ids: List[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Analytics of the given chatbots per UTC day
+
+        Args:
+            start: First day to include (whole day); None for all history
+            end: End of the range (defaults to now)
+
+        Returns:
+            {"YYYY-MM-DD": stats} for days with any activity, where stats
+            has the SUM_FIELDS counters, response_ms_min/max and
+            messages_by_hour
+        """
+        end = _naive_utc(end) if end else utcnow()
+        start = _floor_day(_naive_utc(start)) if start else None
+        rolled_up_to = await self.get_rolled_up_to(db)
+        if rolled_up_to is None:
+            # Nothing rolled up yet: aggregate the requested range live,
+            # starting at these chatbots' first activity for all history
+            rolled_up_to = start or await self._oldest_activity(db, end, chatbot_ids)
+        rolled_up_to = min(rolled_up_to, end)
+        whole_days_end = _floor_day(rolled_up_to)
+
+        buckets: List[Dict[str, Any]] = []
+        days = {"chatbot_id": {"$in": chatbot_ids}, "day": {"$lt": whole_days_end}}
+        if start:
+            days["day"]["$gte"] = start
+        buckets += await db[self.DAILY].find(days, {"_id": 0}).to_list(None)
+
+        hours = {
+            "chatbot_id": {"$in": chatbot_ids},
+            "hour": {"$gte": max(start, whole_days_end) if start else whole_days_end, "$lt": rolled_up_to}
+        }
+        buckets += await db[self.HOURLY].find(hours, {"_id": 0}).to_list(None)
+
+        live_start = max(start, rolled_up_to) if start else rolled_up_to
+        if live_start < end:
+            buckets += await self._live_buckets(db, chatbot_ids, live_start, end)
+
+        by_day: Dict[str, Dict[str, Any]] = {}
+        for bucket in buckets:
+            moment = bucket.get("day") or bucket["hour"]
+            stats = by_day.setdefault(moment.date().isoformat(), empty_stats())
+            add_stats(stats, bucket)
+        return by_day
+
+    async def get_totals(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_ids: List[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Analytics of the given chatbots summed over the range (all history by default)"""
+        totals = empty_stats()
+        for stats in (await self.get_daily(db, chatbot_ids, start, end)).values():
+            add_stats(totals, stats)
+        return totals
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "hours_rolled_up": self.hours_rolled_up
+        }
+
+
+# Global rollup service; server.py starts the catch-up job on startup
+analytics_rollup = AnalyticsRollupService()
@@ -0,0 +1,539 @@
+"""
+Chunked, compressed database backups with incremental checkpoints.
+
+A backup is a directory under BACKUP_DIR (default: backend/backups) with one
+or more gzip files per collection and a manifest.json listing every file with
+its document count, size and SHA-256. The manifest is written last, so a
+directory without one is an interrupted backup and is ignored.
+
+Usage:
+    cd backend && python -m services.backup_service backup [--incremental] [--format ndjson]
+    cd backend && python -m services.backup_service restore <backup_id> [--workers 8]
+    cd backend && python -m services.backup_service verify <backup_id> [--deep]
+    cd backend && python -m services.backup_service list
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from bson import ObjectId, decode_file_iter, json_util
+from bson.json_util import CANONICAL_JSON_OPTIONS
+from bson.raw_bson import RawBSONDocument
+import argparse
+import asyncio
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = Path(os.environ.get("BACKUP_DIR", Path(__file__).resolve().parent.parent / "backups"))
+
+COLLECTIONS = ("chatbots", "sources", "conversations", "messages")
+
+# Field an incremental backup selects changed documents by, and how far
+# before the previous backup it starts. Messages are append-only; sources
+# have no updated_at but get their content and status from background
+# processing shortly after they are created.
+CHECKPOINTS = {
+    "chatbots": ("updated_at", timedelta(minutes=5)),
+    "conversations": ("updated_at", timedelta(minutes=5)),
+    "sources": ("_id", timedelta(hours=1)),
+    "messages": ("_id", timedelta(minutes=5)),
+}
+DEFAULT_CHECKPOINT = ("_id", timedelta(minutes=5))
+
+# Some routers store updated_at as an ISO string, partly in local time
+# (datetime.now().isoformat()); string checkpoints go back this much further
+ISO_STRING_SLACK = timedelta(days=1)
+
+FORMATS = ("bson", "ndjson")
+
+# Uncompressed bytes per archive file
+CHUNK_BYTES = 64 * 1024 * 1024
+
+MANIFEST = "manifest.json"
+BACKUP_ID = re.compile(r"^[0-9A-Za-z_-]+$")
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, like the datetimes Motor returns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class _HashingFile:
+    """File wrapper that hashes and counts what is written through it"""
+
+    def __init__(self, path: Path):
+        self.file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ChunkWriter:
+    """
+    Writes the records of one collection to numbered gzip files
+
+    A new file is started every `chunk_bytes` of uncompressed data so
+    restores can work on several files at once. Blocking: call it from a
+    thread.
+    """
+
+    def __init__(self, directory: Path, collection: str, format: str, chunk_bytes: int = CHUNK_BYTES):
+        self.directory = directory
+        self.collection = collection
+        self.format = format
+        self.chunk_bytes = chunk_bytes
+        self.files: List[Dict[str, Any]] = []
+        self._raw: Optional[_HashingFile] = None
+        self._gzip: Optional[gzip.GzipFile] = None
+        self._name = ""
+        self._size = 0
+        self._documents = 0
+
+    def write(self, records: List[bytes]):
+        for record in records:
+            if self._gzip is None:
+                self._open()
+            self._gzip.write(record)
+            self._size += len(record)
+            self._documents += 1
+            if self._size >= self.chunk_bytes:
+                self._close()
+
+    def close(self) -> List[Dict[str, Any]]:
+        if self._gzip is not None:
+            self._close()
+        return self.files
+
+    def _open(self):
+        self._name = f"{self.collection}.{len(self.files) + 1:05d}.{self.format}.gz"
+        self._raw = _HashingFile(self.directory / self._name)
+        self._gzip = gzip.GzipFile(filename="", mode="wb", fileobj=self._raw, compresslevel=6, mtime=0)
+        self._size = 0
+        self._documents = 0
+
+    def _close(self):
+        self._gzip.close()
+        self._raw.close()
+        self.files.append({
+            "name": self._name,
+            "documents": self._documents,
+            "uncompressed_bytes": self._size,
+            "bytes": self._raw.bytes,
+            "sha256": self._raw.sha256.hexdigest()
+        })
+        self._gzip = None
+        self._raw = None
+
+
+def _read_records(path: Path, format: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rb") as handle:
+        if format == "bson":
+            yield from decode_file_iter(handle)
+        else:
+            for line in handle:
+                yield json_util.loads(line)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _count_records(path: Path, format: str) -> int:
+    return sum(1 for _ in _read_records(path, format))
+
+
+class BackupService:
+    """
+    Streams collections to compressed archive files and restores them.
+
+    Backups read each collection with one cursor and hand batches of raw
+    BSON (or canonical extended JSON lines) to a thread that compresses
+    them, so memory stays at one batch per collection whatever the size
+    of the database; collections are backed up concurrently.
+
+    An incremental backup only copies documents whose checkpoint field
+    (see CHECKPOINTS) is at or after the start of the previous backup,
+    minus an overlap for writes that were in flight. Restores apply the
+    chain from the last full backup onwards, upserting by _id with
+    several files in flight. Deleted documents are not tracked: restore
+    from a recent full backup to drop them.
+    """
+
+    def __init__(self, backup_dir: Path = BACKUP_DIR, chunk_bytes: int = CHUNK_BYTES, batch_size: int = 1000):
+        """
+        Args:
+            backup_dir: Directory the backups are kept in
+            chunk_bytes: Uncompressed bytes per archive file
+            batch_size: Documents per compression batch and per restore bulk_write
+        """
+        self.backup_dir = Path(backup_dir)
+        self.chunk_bytes = chunk_bytes
+        self.batch_size = batch_size
+        # Backups and restores started through start_job(), by job id
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    # ---- Manifests ----
+
+    def _directory(self, backup_id: str) -> Path:
+        if not BACKUP_ID.match(backup_id or ""):
+            raise ValueError(f"Invalid backup id: {backup_id}")
+        return self.backup_dir / backup_id
+
+    def get_manifest(self, backup_id: str) -> Dict[str, Any]:
+        path = self._directory(backup_id) / MANIFEST
+        if not path.exists():
+            raise FileNotFoundError(f"Backup {backup_id} not found")
+        return json.loads(path.read_text())
+
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """Completed backups, oldest first"""
+        if not self.backup_dir.exists():
+            return []
+        manifests = []
+        for path in self.backup_dir.glob(f"*/{MANIFEST}"):
+            try:
+                manifests.append(json.loads(path.read_text()))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable backup manifest {path}: {str(e)}")
+        return sorted(manifests, key=lambda manifest: manifest["started_at"])
+
+    def chain(self, backup_id: str) -> List[Dict[str, Any]]:
+        """Manifests to restore for a backup: its full backup, then each incremental up to it"""
+        chain = [self.get_manifest(backup_id)]
+        while chain[-1]["type"] != "full":
+            chain.append(self.get_manifest(chain[-1]["base"]))
+        return list(reversed(chain))
+
+    # ---- Backup ----
+
+    async def backup(
+        self,
+        db: AsyncIOMotorDatabase,
+        collections: Sequence[str] = COLLECTIONS,
+        incremental: bool = False,
+        format: str = "bson",
+        backup_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Back up collections to a new archive directory
+
+        Args:
+            db: Database instance
+            collections: Collections to back up
+            incremental: Only copy what changed since the latest backup
+                (a full backup is made if there is none)
+            format: "bson" (raw documents) or "ndjson" (canonical extended JSON)
+            backup_id: Name of the backup (default: generated)
+
+        Returns:
+            The manifest
+        """
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        previous = self.list_backups() if incremental else []
+        base = previous[-1] if previous else None
+        started = _utcnow()
+        backup_id = backup_id or f"{started:%Y%m%dT%H%M%S}-{'incr' if base else 'full'}-{uuid.uuid4().hex[:6]}"
+        directory = self._directory(backup_id)
+        directory.mkdir(parents=True, exist_ok=False)
+
+        queries = {}
+        for name in collections:
+            field, overlap = CHECKPOINTS.get(name, DEFAULT_CHECKPOINT)
+            since = None
+            if base and name in base["collections"]:
+                since = datetime.fromisoformat(base["started_at"]) - overlap
+            queries[name] = (field, since)
+
+        results = await asyncio.gather(*(
+            self._backup_collection(db, directory, name, field, since, format)
+            for name, (field, since) in queries.items()
+        ))
+
+        manifest = {
+            "id": backup_id,
+            "type": "incremental" if base else "full",
+            "base": base["id"] if base else None,
+            "format": format,
+            "database": db.name,
+            "started_at": started.isoformat(),
+            "finished_at": _utcnow().isoformat(),
+            "duration_seconds": round((_utcnow() - started).total_seconds(), 3),
+            "collections": dict(zip(queries, results)),
+        }
+        manifest["documents"] = sum(entry["documents"] for entry in results)
+        manifest["bytes"] = sum(entry["bytes"] for entry in results)
+
+        # Written last and renamed into place: a backup without a manifest is incomplete
+        temporary = directory / f"{MANIFEST}.tmp"
+        temporary.write_text(json.dumps(manifest, indent=2))
+        temporary.replace(directory / MANIFEST)
+        logger.info(
+            f"Backup {backup_id}: {manifest['documents']} documents, "
+            f"{manifest['bytes'] / 1024 / 1024:.1f} MB in {manifest['duration_seconds']}s"
+        )
+        return manifest
+
+    async def _backup_collection(
+        self,
+        db: AsyncIOMotorDatabase,
+        directory: Path,
+        name: str,
+        field: str,
+        since: Optional[datetime],
+        format: str
+    ) -> Dict[str, Any]:
+        query: Dict[str, Any] = {}
+        if since is not None and field == "_id":
+            query[field] = {"$gte": ObjectId.from_datetime(since)}
+        elif since is not None:
+            # Dates are stored both as datetimes and as ISO strings, and
+            # $gte only compares values of the same BSON type
+            query["$or"] = [
+                {field: {"$gte": since}},
+                {field: {"$gte": (since - ISO_STRING_SLACK).isoformat()}}
+            ]
+
+        collection = db[name]
+        if format == "bson":
+            # Raw documents are written as they came off the wire, without decoding
+            collection = collection.with_options(
+                codec_options=collection.codec_options.with_options(document_class=RawBSONDocument)
+            )
+        writer = ChunkWriter(directory, name, format, self.chunk_bytes)
+
+        batch: List[bytes] = []
+        async for doc in collection.find(query).batch_size(self.batch_size):
+            if format == "bson":
+                batch.append(doc.raw)
+            else:
+                batch.append((json_util.dumps(doc, json_options=CANONICAL_JSON_OPTIONS) + "\n").encode("utf-8"))
+            if len(batch) >= self.batch_size:
+                await asyncio.to_thread(writer.write, batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(writer.write, batch)
+        files = await asyncio.to_thread(writer.close)
+
+        return {
+            "checkpoint_field": field,
+            "since": since.isoformat() if since else None,
+            "documents": sum(entry["documents"] for entry in files),
+            "bytes": sum(entry["bytes"] for entry in files),
+            "files": files
+        }
+
+    # ---- Verify ----
+
+    async def verify(self, backup_id: str, deep: bool = False) -> Dict[str, Any]:
+        """
+        Check the files of a backup against its manifest
+
+        Args:
+            backup_id: Backup to check
+            deep: Also decompress every file and count its documents
+
+        Returns:
+            {"backup_id", "ok", "files", "errors": [...]}
+        """
+        manifest = self.get_manifest(backup_id)
+        directory = self._directory(backup_id)
+        errors = []
+        checked = 0
+        for name, entry in manifest["collections"].items():
+            for file in entry["files"]:
+                path = directory / file["name"]
+                checked += 1
+                if not path.exists():
+                    errors.append(f"{file['name']}: missing")
+                    continue
+                digest = await asyncio.to_thread(_file_sha256, path)
+                if digest != file["sha256"]:
+                    errors.append(f"{file['name']}: checksum mismatch")
+                    continue
+                if deep:
+                    try:
+                        documents = await asyncio.to_thread(_count_records, path, manifest["format"])
+                    except Exception as e:
+                        errors.append(f"{file['name']}: unreadable ({str(e)})")
+                        continue
+                    if documents != file["documents"]:
+                        errors.append(f"{file['name']}: {documents} documents, expected {file['documents']}")
+        return {"backup_id": backup_id, "ok": not errors, "files": checked, "errors": errors}
+
+    # ---- Restore ----
+
+    async def restore(
+        self,
+        db: AsyncIOMotorDatabase,
+        backup_id: str,
+        collections: Optional[Sequence[str]] = None,
+        workers: int = 4
+    ) -> Dict[str, Any]:
+        """
+        Restore a backup (with the full and incremental backups it builds on)
+
+        Every file is checked against its checksum first. Documents are
+        upserted by _id, so restoring into a live database overwrites the
+        backed up documents and leaves newer ones alone.
+
+        Args:
+            db: Database to restore into
+            backup_id: Last backup to apply
+            collections: Only restore these (default: all in the backup)
+            workers: Files restored at the same time
+
+        Returns:
+            {"backup_id", "applied": [backup ids], "documents": {collection: n}, "duration_seconds"}
+        """
+        started = time.perf_counter()
+        chain = self.chain(backup_id)
+        for manifest in chain:
+            result = await self.verify(manifest["id"])
+            if not result["ok"]:
+                raise ValueError(f"Backup {manifest['id']} failed verification: {'; '.join(result['errors'])}")
+
+        restored: Dict[str, int] = {}
+        semaphore = asyncio.Semaphore(workers)
+
+        async def restore_file(manifest: Dict[str, Any], name: str, file: Dict[str, Any]):
+            async with semaphore:
+                count = await self._restore_file(db, self._directory(manifest["id"]) / file["name"], name, manifest["format"])
+            restored[name] = restored.get(name, 0) + count
+
+        # Backups are applied in order, so later versions of a document win;
+        # the files of one backup hold distinct documents and go in parallel
+        for manifest in chain:
+            await asyncio.gather(*(
+                restore_file(manifest, name, file)
+                for name, entry in manifest["collections"].items()
+                if collections is None or name in collections
+                for file in entry["files"]
+            ))
+
+        return {
+            "backup_id": backup_id,
+            "applied": [manifest["id"] for manifest in chain],
+            "documents": restored,
+            "duration_seconds": round(time.perf_counter() - started, 3)
+        }
+
+    async def _restore_file(self, db: AsyncIOMotorDatabase, path: Path, name: str, format: str) -> int:
+        records = _read_records(path, format)
+        restored = 0
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(records, self.batch_size)))
+                if not batch:
+                    break
+                await db[name].bulk_write(
+                    [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch],
+                    ordered=False
+                )
+                restored += len(batch)
+        finally:
+            records.close()
+        return restored
+
+    # ---- Background jobs ----
+
+    def start_job(self, kind: str, coroutine) -> str:
+        """Run a backup or restore in the background; its status is in self.jobs"""
+        job_id = uuid.uuid4().hex[:12]
+        self.jobs[job_id] = {"id": job_id, "kind": kind, "status": "running", "started_at": _utcnow().isoformat()}
+        self._tasks[job_id] = asyncio.create_task(self._run_job(job_id, coroutine))
+        return job_id
+
+    async def _run_job(self, job_id: str, coroutine):
+        job = self.jobs[job_id]
+        try:
+            job["result"] = await coroutine
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Backup job {job_id} ({job['kind']}) failed: {str(e)}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = _utcnow().isoformat()
+            self._tasks.pop(job_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backup_dir": str(self.backup_dir),
+            "backups": len(self.list_backups()),
+            "running_jobs": len(self._tasks)
+        }
+
+
+# Global service used by the admin endpoints
+backup_service = BackupService()
+
+
+async def _main():
+    from database import get_database
+
+    parser = argparse.ArgumentParser(description="Back up and restore the database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup = commands.add_parser("backup", help="Write a new backup")
+    backup.add_argument("--incremental", action="store_true", help="Only what changed since the latest backup")
+    backup.add_argument("--format", choices=FORMATS, default="bson")
+    backup.add_argument("--collections", nargs="+", default=list(COLLECTIONS))
+    restore = commands.add_parser("restore", help="Restore a backup and the backups it builds on")
+    restore.add_argument("backup_id")
+    restore.add_argument("--workers", type=int, default=4, help="Files restored at the same time")
+    restore.add_argument("--collections", nargs="+")
+    verify = commands.add_parser("verify", help="Check a backup's files against their checksums")
+    verify.add_argument("backup_id")
+    verify.add_argument("--deep", action="store_true", help="Also decompress and count documents")
+    commands.add_parser("list", help="List completed backups")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for manifest in backup_service.list_backups():
+            print(f"{manifest['id']}  {manifest['type']:<11} {manifest['documents']:>10} docs  "
+                  f"{manifest['bytes'] / 1024 / 1024:>9.1f} MB  base={manifest['base']}")
+        return
+    if args.command == "verify":
+        result = await backup_service.verify(args.backup_id, deep=args.deep)
+        print(json.dumps(result, indent=2))
+        raise SystemExit(0 if result["ok"] else 1)
+
+    db = get_database()
+    if args.command == "backup":
+        manifest = await backup_service.backup(
+            db, collections=args.collections, incremental=args.incremental, format=args.format
+        )
+        print(f"{manifest['id']}: {manifest['documents']} documents in {manifest['duration_seconds']}s")
+    else:
+        result = await backup_service.restore(db, args.backup_id, collections=args.collections, workers=args.workers)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
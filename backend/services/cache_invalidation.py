@@ -0,0 +1,192 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+from services.cache_service import cache_service, CacheService
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Chatbot settings are invalidated explicitly through the bus on every write,
+# so the TTL only bounds staleness if a broadcast is ever missed.
+CHATBOT_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+
+async def tail_capped(
+    collection: AsyncIOMotorCollection,
+    handle: Callable[[Dict[str, Any]], Awaitable[None]],
+    retry_delay: float = 1.0,
+    name: str = "Capped collection"
+):
+    """
+    Follow a capped collection, calling handle() for every new document
+
+    Documents are read in natural (insertion) order. _id is not used to
+    resume: every worker generates ObjectIds on its own client, so their
+    order need not match the order the documents were inserted in. When
+    the cursor has to be reopened the collection is read again from the
+    start and everything up to the last document handled is skipped; if
+    that one has already been overwritten, everything left is handled.
+    Runs until cancelled.
+    """
+    # Start after the newest existing document; older ones are already applied
+    last_id = None
+    latest = await collection.find_one({}, sort=[("$natural", -1)], projection={"_id": 1})
+    if latest:
+        last_id = latest["_id"]
+
+    while True:
+        try:
+            skipping = last_id is not None and await collection.find_one(
+                {"_id": last_id}, projection={"_id": 1}
+            ) is not None
+            cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                async for doc in cursor:
+                    if skipping:
+                        skipping = doc["_id"] != last_id
+                        continue
+                    last_id = doc["_id"]
+                    await handle(doc)
+                await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{name} tailer error: {str(e)}")
+
+        # Cursor died (e.g. empty collection) - reopen after a short pause
+        await asyncio.sleep(retry_delay)
+
+
+class CacheInvalidationBus:
+    """
+    Broadcasts cache invalidations to every worker through a capped collection.
+
+    publish() drops the namespaces from the local caches straight away and
+    appends one document to `cache_invalidations`. Each worker tails that
+    collection with a tailable-await cursor and drops the same namespaces
+    from its own caches. Caches other than the one given to the constructor
+    can be attached with register_cache(). A capped collection is used instead of a change
+    stream so this also works against a standalone mongod.
+    """
+
+    COLLECTION = "cache_invalidations"
+
+    def __init__(
+        self,
+        cache: CacheService,
+        capped_size_bytes: int = 1024 * 1024,
+        capped_max_docs: int = 10000,
+        retry_delay_seconds: float = 1.0
+    ):
+        self.cache = cache
+        self.caches = [cache]
+        self.capped_size_bytes = capped_size_bytes
+        self.capped_max_docs = capped_max_docs
+        self.retry_delay = retry_delay_seconds
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+
+    def register_cache(self, cache: CacheService):
+        """Apply invalidations to another local cache as well"""
+        if cache not in self.caches:
+            self.caches.append(cache)
+
+    def _invalidate_locally(self, namespaces: Iterable[str]):
+        for namespace in namespaces:
+            for cache in self.caches:
+                cache.invalidate_namespace(namespace)
+
+    async def _ensure_collection(self):
+        try:
+            await self.db.create_collection(
+                self.COLLECTION,
+                capped=True,
+                size=self.capped_size_bytes,
+                max=self.capped_max_docs
+            )
+        except (CollectionInvalid, OperationFailure):
+            # Already exists
+            pass
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Create the capped collection if needed and start tailing it"""
+        if self._task is not None:
+            return
+        self.db = db
+        await self._ensure_collection()
+        self._task = asyncio.create_task(self._tail())
+        logger.info(f"Cache invalidation bus started (worker {self.worker_id})")
+
+    async def stop(self):
+        """Stop tailing"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def publish(self, namespaces: Iterable[str]):
+        """
+        Invalidate namespaces locally and on every other worker
+
+        Args:
+            namespaces: Cache namespaces, e.g. ["chatbot:<id>"]
+        """
+        namespaces = [ns for ns in namespaces if ns]
+        if not namespaces:
+            return
+
+        self._invalidate_locally(namespaces)
+
+        if self.db is None:
+            return
+
+        try:
+            await self.db[self.COLLECTION].insert_one({
+                "namespaces": namespaces,
+                "origin": self.worker_id,
+                "created_at": datetime.now(timezone.utc)
+            })
+            self.published += 1
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation for {namespaces}: {str(e)}")
+
+    async def invalidate_chatbots(self, chatbot_ids: Iterable[str]):
+        """Invalidate every cached view of the given chatbots"""
+        await self.publish([f"chatbot:{chatbot_id}" for chatbot_id in chatbot_ids])
+
+    async def invalidate_users(self, user_ids: Iterable[str]):
+        """Invalidate every cached view of the given users (e.g. auth principals)"""
+        await self.publish([f"user:{user_id}" for user_id in user_ids])
+
+    async def _tail(self):
+        await tail_capped(self.db[self.COLLECTION], self._apply, self.retry_delay, "Cache invalidation")
+
+    async def _apply(self, doc):
+        if doc.get("origin") == self.worker_id:
+            return
+        self._invalidate_locally(doc.get("namespaces", []))
+        self.received += 1
+
+    def get_stats(self):
+        return {
+            "worker_id": self.worker_id,
+            "running": self._task is not None and not self._task.done(),
+            "published": self.published,
+            "received": self.received
+        }
+
+
+# Global invalidation bus bound to the global cache
+cache_invalidation_bus = CacheInvalidationBus(cache_service)
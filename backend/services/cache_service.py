@@ -1,111 +1,385 @@
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable, Set, Tuple, Union
+from collections import OrderedDict
+import asyncio
 import logging
+import sys
+import time
 
 logger = logging.getLogger(__name__)
 
 
+def _estimate_size(value: Any, _depth: int = 0) -> int:
+    """Rough memory footprint of a cached value in bytes (bounded recursion)"""
+    size = sys.getsizeof(value, 64)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k, _depth + 1) + _estimate_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += _estimate_size(item, _depth + 1)
+    elif hasattr(value, "__dict__"):
+        size += _estimate_size(vars(value), _depth + 1)
+    return size
+
+
+class SharedCacheBackend:
+    """
+    Interface for an optional second cache tier shared between workers
+    (e.g. Redis or memcached). Implementations are responsible for their own
+    serialization; values handed to set() are the same objects stored locally.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+
+class InMemorySharedBackend(SharedCacheBackend):
+    """Process-local stand-in for a shared backend (tests and single-worker setups)"""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._data.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: float):
+        self._data[key] = (value, time.monotonic() + ttl_seconds)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+
 class CacheService:
     """
-    Simple in-memory cache service with TTL (Time To Live)
+    Bounded in-memory LRU cache with TTL (Time To Live)
     Used for caching frequently accessed data like chatbot settings
+
+    - Entries are evicted least-recently-used first once max_entries or
+      max_bytes is exceeded
+    - Expiry uses time.monotonic(), so wall-clock changes do not matter
+    - get_or_load() collapses concurrent misses for the same key into one
+      loader call and can serve a stale value while refreshing it
+    - Keys can be tagged with namespaces (e.g. "chatbot:<id>") and
+      invalidated together; a load that was running when its key or one of
+      its namespaces was invalidated returns its value but does not cache it
+    - An optional SharedCacheBackend acts as a second tier behind the local one
     """
-    
-    def __init__(self, default_ttl_seconds: int = 300):
+
+    def __init__(
+        self,
+        default_ttl_seconds: int = 300,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        stale_ttl_seconds: int = 0,
+        shared_backend: Optional[SharedCacheBackend] = None
+    ):
         """
         Initialize cache service
-        
+
         Args:
             default_ttl_seconds: Default time to live for cache entries (5 minutes)
+            max_entries: Maximum number of entries kept locally
+            max_bytes: Approximate memory budget for cached values
+            stale_ttl_seconds: How long an expired entry may still be served by
+                get_or_load() while it is refreshed in the background
+            shared_backend: Optional second tier shared between workers
         """
-        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._namespaces: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Invalidation generation, and the generation each key or namespace
+        # was last invalidated at; only kept while loads are in flight
+        self._generation = 0
+        self._invalidated: Dict[Tuple[str, str], int] = {}
         self.default_ttl = default_ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl_seconds
+        self.shared_backend = shared_backend
+        self.total_bytes = 0
         self.hits = 0
         self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.loads = 0
         logger.info(f"Cache service initialized with {default_ttl_seconds}s TTL")
-    
+
+    def _remove(self, key: str):
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry["size"]
+        for namespace in entry["namespaces"]:
+            keys = self._namespaces.get(namespace)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._namespaces[namespace]
+
+    def _evict(self):
+        while self._cache and (len(self._cache) > self.max_entries or self.total_bytes > self.max_bytes):
+            oldest_key = next(iter(self._cache))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _lookup(self, key: str, allow_stale: bool = False):
+        """Return (entry, is_stale) or (None, False); drops entries past their stale window"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None, False
+        now = time.monotonic()
+        if now < entry["expires_at"]:
+            self._cache.move_to_end(key)
+            return entry, False
+        if allow_stale and now < entry["stale_until"]:
+            return entry, True
+        if now >= entry["stale_until"]:
+            self._remove(key)
+        return None, False
+
     def get(self, key: str) -> Optional[Any]:
         """
         Get value from cache
-        
+
         Args:
             key: Cache key
-            
+
         Returns:
             Cached value or None if not found or expired
         """
-        if key not in self._cache:
+        entry, _ = self._lookup(key)
+        if entry is None:
             self.misses += 1
             return None
-        
-        entry = self._cache[key]
-        
-        # Check if expired
-        if datetime.now() > entry["expires_at"]:
-            del self._cache[key]
-            self.misses += 1
-            return None
-        
+
         self.hits += 1
         return entry["value"]
-    
-    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None):
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl_seconds: Optional[int] = None,
+        namespaces: Optional[Iterable[str]] = None
+    ):
         """
         Set value in cache
-        
+
         Args:
             key: Cache key
             value: Value to cache
             ttl_seconds: Optional custom TTL (uses default if not provided)
+            namespaces: Optional namespaces for grouped invalidation
         """
         ttl = ttl_seconds if ttl_seconds is not None else self.default_ttl
-        expires_at = datetime.now() + timedelta(seconds=ttl)
-        
+        now = time.monotonic()
+        namespaces = tuple(namespaces or ())
+
+        self._remove(key)
+        size = _estimate_size(value)
         self._cache[key] = {
             "value": value,
-            "expires_at": expires_at,
-            "created_at": datetime.now()
+            "expires_at": now + ttl,
+            "stale_until": now + ttl + self.stale_ttl,
+            "created_at": now,
+            "size": size,
+            "namespaces": namespaces
         }
-    
+        self.total_bytes += size
+        for namespace in namespaces:
+            self._namespaces.setdefault(namespace, set()).add(key)
+        self._evict()
+
+    def _mark_invalidated(self, kind: str, name: str):
+        if self._inflight:
+            self._generation += 1
+            self._invalidated[(kind, name)] = self._generation
+
+    def _invalidated_since(self, generation: int, key: str, namespaces: Iterable[str]) -> bool:
+        if not self._invalidated:
+            return False
+        if max(self._invalidated.get(("key", key), 0), self._invalidated.get(("all", ""), 0)) > generation:
+            return True
+        return any(self._invalidated.get(("namespace", ns), 0) > generation for ns in namespaces)
+
     def delete(self, key: str):
-        """Delete a key from cache"""
-        if key in self._cache:
-            del self._cache[key]
-    
+        """Delete a key from the local cache"""
+        self._mark_invalidated("key", key)
+        self._remove(key)
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        """
+        Delete every local key tagged with a namespace
+
+        Returns:
+            Number of keys removed
+        """
+        self._mark_invalidated("namespace", namespace)
+        keys = list(self._namespaces.get(namespace, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    async def delete_everywhere(self, key: str):
+        """Delete a key from the local cache and the shared tier"""
+        self.delete(key)
+        if self.shared_backend is not None:
+            try:
+                await self.shared_backend.delete(key)
+            except Exception as e:
+                logger.warning(f"Shared cache delete failed for {key}: {str(e)}")
+
+    async def _load(self, key, loader, ttl, namespaces):
+        generation = self._generation
+        value = None
+        if self.shared_backend is not None:
+            try:
+                value = await self.shared_backend.get(key)
+            except Exception as e:
+                logger.warning(f"Shared cache get failed for {key}: {str(e)}")
+
+        loaded = value is None
+        if loaded:
+            self.loads += 1
+            value = await loader()
+        if value is None:
+            return None
+
+        if callable(namespaces):
+            namespaces = tuple(namespaces(value))
+        if self._invalidated_since(generation, key, namespaces):
+            # Invalidated while loading: the value may predate the write
+            return value
+
+        self.set(key, value, ttl_seconds=ttl, namespaces=namespaces)
+        if loaded and self.shared_backend is not None:
+            try:
+                await self.shared_backend.set(key, value, ttl)
+            except Exception as e:
+                logger.warning(f"Shared cache set failed for {key}: {str(e)}")
+        return value
+
+    def _start_load(self, key, loader, ttl, namespaces) -> asyncio.Future:
+        future = self._inflight.get(key)
+        if future is not None:
+            return future
+
+        future = asyncio.ensure_future(self._load(key, loader, ttl, namespaces))
+        self._inflight[key] = future
+
+        def _done(f):
+            if self._inflight.get(key) is f:
+                del self._inflight[key]
+            if not self._inflight:
+                self._invalidated.clear()
+            if not f.cancelled() and f.exception() is not None:
+                logger.warning(f"Cache loader failed for {key}: {str(f.exception())}")
+
+        future.add_done_callback(_done)
+        return future
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[int] = None,
+        namespaces: Optional[Union[Iterable[str], Callable[[Any], Iterable[str]]]] = None
+    ) -> Optional[Any]:
+        """
+        Get value from cache, calling loader on a miss
+
+        Concurrent misses for the same key share a single loader call. If the
+        entry has expired but is still inside the stale window, the stale
+        value is returned immediately and refreshed in the background.
+        None results are not cached.
+
+        Args:
+            key: Cache key
+            loader: Coroutine function producing the value
+            ttl_seconds: Optional custom TTL (uses default if not provided)
+            namespaces: Optional namespaces for grouped invalidation, or a
+                function of the loaded value returning them
+        """
+        ttl = ttl_seconds if ttl_seconds is not None else self.default_ttl
+        if not callable(namespaces):
+            namespaces = tuple(namespaces or ())
+
+        entry, is_stale = self._lookup(key, allow_stale=True)
+        if entry is not None:
+            if is_stale:
+                self.stale_hits += 1
+                self._start_load(key, loader, ttl, namespaces)
+            else:
+                self.hits += 1
+            return entry["value"]
+
+        self.misses += 1
+        # shield() so a cancelled caller does not cancel the load for the others
+        return await asyncio.shield(self._start_load(key, loader, ttl, namespaces))
+
     def clear(self):
         """Clear all cache entries"""
         self._cache.clear()
+        self._namespaces.clear()
+        self._mark_invalidated("all", "")
+        self.total_bytes = 0
         self.hits = 0
         self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.loads = 0
         logger.info("Cache cleared")
-    
+
     def clear_expired(self):
-        """Remove all expired entries"""
-        now = datetime.now()
+        """Remove all entries past their stale window"""
+        now = time.monotonic()
         expired_keys = [
             key for key, entry in self._cache.items()
-            if now > entry["expires_at"]
+            if now >= entry["stale_until"]
         ]
-        
+
         for key in expired_keys:
-            del self._cache[key]
-        
+            self._remove(key)
+
         if expired_keys:
             logger.info(f"Cleared {len(expired_keys)} expired cache entries")
-    
+
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        total_requests = self.hits + self.misses
-        hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
-        
+        total_requests = self.hits + self.misses + self.stale_hits
+        hit_rate = ((self.hits + self.stale_hits) / total_requests * 100) if total_requests > 0 else 0
+
         return {
             "size": len(self._cache),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
             "hits": self.hits,
+            "stale_hits": self.stale_hits,
             "misses": self.misses,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "inflight_loads": len(self._inflight),
             "hit_rate": round(hit_rate, 2),
-            "total_requests": total_requests
+            "total_requests": total_requests,
+            "shared_tier": self.shared_backend is not None
         }
 
 
 # Global cache instance
-cache_service = CacheService(default_ttl_seconds=300)  # 5 minutes default TTL
+cache_service = CacheService(default_ttl_seconds=300, stale_ttl_seconds=30)  # 5 minutes default TTL
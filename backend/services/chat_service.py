@@ -1,4 +1,3 @@
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 from typing import List, Dict, Optional, Tuple
 import logging
 import os
@@ -48,6 +47,10 @@ class ChatService:
                 enhanced_system += f"\n\nRelevant Knowledge Base Context:\n{context}"
                 enhanced_system += "\n\nImportant: Use the provided context to answer the question accurately and naturally. Integrate the information seamlessly without explicitly mentioning sources or reference numbers."
             
+            # Imported here so the LLM client stack loads after startup
+            # (server.py warms it up in the background)
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+
             # Initialize chat
             chat = LlmChat(
                 api_key=self.api_key,
@@ -1,10 +1,22 @@
-import tiktoken
+import functools
 import logging
 from typing import List, Dict
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(encoding_name: str = "cl100k_base"):
+    """
+    Load a tiktoken encoding once per process
+
+    tiktoken (and its encoding tables) is imported on first use rather than
+    at startup, and every ChunkingService shares the loaded encoding.
+    """
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+
 class ChunkingService:
     """Service for intelligently chunking text documents"""
     
@@ -19,9 +31,11 @@ class ChunkingService:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         
-        # Initialize tokenizer (using cl100k_base encoding for GPT-3.5/4)
+    @property
+    def tokenizer(self):
+        """Tokenizer (cl100k_base encoding for GPT-3.5/4), loaded on first use"""
         try:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+            return get_tokenizer("cl100k_base")
         except Exception as e:
             logger.error(f"Error loading tokenizer: {str(e)}")
             raise
@@ -0,0 +1,357 @@
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from datetime import datetime, timedelta, timezone
+from services.leased_job import LeasedJob, utcnow
+import asyncio
+import logging
+import math
+import numpy as np
+import os
+
+logger = logging.getLogger(__name__)
+
+# Users scored per page (one read, one numpy pass and one bulk_write)
+PAGE_SIZE = 2000
+
+# Fields of a user document the features are built from
+USER_FIELDS = ("last_active", "last_login", "created_at", "login_count", "total_spent")
+
+DAY_SECONDS = 86400.0
+
+
+def _epoch(value: Any) -> float:
+    """Seconds since the epoch of a stored date (datetime or ISO string); NaN if missing"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return math.nan
+    if not isinstance(value, datetime):
+        return math.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _number(document: Dict[str, Any], field: str) -> float:
+    """A stored count or amount: 0 if absent (like .get(field, 0)), NaN if not a number (e.g. null)"""
+    value = document.get(field, 0)
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else math.nan
+
+
+def extract_features(users: List[Dict[str, Any]], now: datetime) -> Dict[str, np.ndarray]:
+    """
+    Feature columns of a page of users
+
+    Returns:
+        {"days_inactive", "days_since_signup", "login_count", "total_spent"}:
+        float arrays, NaN where a date is missing or a count is not a number
+    """
+    now_epoch = _epoch(now)
+    last_active = np.array(
+        [_epoch(user.get("last_active") or user.get("last_login")) for user in users], dtype=np.float64
+    )
+    created = np.array([_epoch(user.get("created_at")) for user in users], dtype=np.float64)
+    return {
+        # Whole days, like timedelta.days
+        "days_inactive": np.floor((now_epoch - last_active) / DAY_SECONDS),
+        "days_since_signup": np.floor((now_epoch - created) / DAY_SECONDS),
+        "login_count": np.array([_number(user, "login_count") for user in users], dtype=np.float64),
+        "total_spent": np.array([_number(user, "total_spent") for user in users], dtype=np.float64),
+    }
+
+
+class ChurnModel:
+    """
+    A churn risk model: scores a page of users from their feature columns.
+
+    Subclasses set `name` and implement score(); register them with
+    ChurnScoringService.register_model() to make them selectable.
+    """
+
+    name = "base"
+
+    def score(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        """Risk per user, in [0, 1]"""
+        raise NotImplementedError
+
+
+class HeuristicChurnModel(ChurnModel):
+    """
+    The original weighted rules: inactivity (40%), login frequency (30%)
+    and never having paid (30%)
+    """
+
+    name = "heuristic"
+
+    def score(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        days_inactive = features["days_inactive"]
+        days_since_signup = features["days_since_signup"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Never active counts fully; otherwise only past 30 days, full at 90
+            inactivity = np.where(
+                np.isnan(days_inactive),
+                0.4,
+                np.where(days_inactive > 30, 0.4 * np.minimum(days_inactive / 90, 1.0), 0.0)
+            )
+            logins_per_week = features["login_count"] / days_since_signup * 7
+            infrequent = np.where(
+                (days_since_signup > 0) & (logins_per_week < 1),
+                0.3 * (1 - logins_per_week),
+                0.0
+            )
+        unpaid = np.where(features["total_spent"] == 0, 0.3, 0.0)
+        return np.minimum(inactivity + infrequent + unpaid, 1.0)
+
+
+class LogisticChurnModel(ChurnModel):
+    """
+    Logistic regression over the feature columns: sigmoid(bias + sum(w * x))
+
+    Coefficients come from an offline fit; missing values are replaced by
+    `fill` (e.g. a large number of inactive days) before scoring.
+    """
+
+    def __init__(
+        self,
+        weights: Dict[str, float],
+        bias: float = 0.0,
+        fill: Optional[Dict[str, float]] = None,
+        name: str = "logistic"
+    ):
+        self.name = name
+        self.weights = weights
+        self.bias = bias
+        self.fill = fill or {}
+
+    def score(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        logits = np.full(len(next(iter(features.values()))), self.bias, dtype=np.float64)
+        for feature, weight in self.weights.items():
+            logits += weight * np.nan_to_num(features[feature], nan=self.fill.get(feature, 0.0))
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+def lifecycle_stages(features: Dict[str, np.ndarray], scores: np.ndarray) -> np.ndarray:
+    """Lifecycle stage of each user from its tenure, activity and risk score"""
+    tenure = features["days_since_signup"]
+    established = tenure > 90
+    return np.select(
+        [
+            established & (scores > 0.7),
+            established & (scores > 0.4),
+            established & (features["total_spent"] > 100) & (features["login_count"] > 20),
+            established,
+            tenure > 7,
+        ],
+        ["churned", "at_risk", "engaged", "active", "active"],
+        default="new"
+    )
+
+
+class ChurnScoringService(LeasedJob):
+    """
+    Scores churn risk for every user in pages.
+
+    Users are read in _id order one page at a time (keyset pagination, so
+    a run covers any number of users and never holds more than one page);
+    features and scores are computed with numpy over the whole page, and
+    only users whose score or lifecycle stage changed are written, with
+    one unordered bulk_write per page. The next page is read while the
+    previous one is written.
+
+    The job is leased so one worker runs it at a time, and runs on its
+    own every `run_every`; progress (users scored and written, the total
+    expected) is kept in `churn_scoring_state` so any worker can report
+    it. The model used is picked by name from self.models.
+    """
+
+    STATE = "churn_scoring_state"
+    STATE_ID = "churn_scoring"
+    NAME = "Churn scoring"
+
+    def __init__(
+        self,
+        interval_hours: float = 24.0,
+        page_size: int = PAGE_SIZE,
+        default_model: Optional[str] = None
+    ):
+        """
+        Args:
+            interval_hours: How often all users are re-scored
+            page_size: Users per page
+            default_model: Model used by scheduled runs (default: CHURN_MODEL or "heuristic")
+        """
+        # The loop checks at least hourly whether a run is due
+        super().__init__(min(interval_hours * 3600, 3600), lease_seconds=600)
+        self.run_every = timedelta(hours=interval_hours)
+        self.page_size = page_size
+        self.models: Dict[str, ChurnModel] = {}
+        self.register_model(HeuristicChurnModel())
+        self.default_model = default_model or os.environ.get("CHURN_MODEL", "heuristic")
+        self._run_task: Optional[asyncio.Task] = None
+        # The lease lets the scheduled and a triggered run of this worker in together
+        self._lock = asyncio.Lock()
+        self.runs = 0
+
+    def register_model(self, model: ChurnModel):
+        self.models[model.name] = model
+
+    async def stop(self):
+        for task in (self._task, self._run_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._run_task = None
+
+    async def trigger(self, db: AsyncIOMotorDatabase, model: Optional[str] = None) -> bool:
+        """
+        Start a run now in the background
+
+        The lease is taken before the run is started, so this only returns
+        True when the run will actually happen.
+
+        Returns:
+            False if this or another worker is already running one
+        """
+        if self._lock.locked() or (self._run_task is not None and not self._run_task.done()):
+            return False
+        self.db = db
+        if await self._acquire_lease(utcnow()) is None:
+            return False
+        self._run_task = asyncio.create_task(self._run_in_background(model))
+        return True
+
+    async def _run_in_background(self, model: Optional[str]):
+        try:
+            await self.run_once(model=model, force=True)
+        except Exception as e:
+            logger.error(f"Churn scoring failed: {str(e)}")
+
+    async def run_once(self, model: Optional[str] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Score all users
+
+        Args:
+            model: Name of the model to use (default: self.default_model)
+            force: Run even if the last run is more recent than the interval
+
+        Returns:
+            Progress of the finished run, or None if it did not run
+            (another worker holds the job, or it is not due)
+        """
+        model_name = model or self.default_model
+        if model_name not in self.models:
+            raise ValueError(f"Unknown churn model: {model_name}")
+        if self._lock.locked():
+            return None
+        async with self._lock:
+            return await self._run(model_name, force)
+
+    async def _run(self, model_name: str, force: bool) -> Optional[Dict[str, Any]]:
+        now = utcnow()
+        state = await self._acquire_lease(now)
+        if state is None:
+            return None
+        finished_at = state.get("progress", {}).get("finished_at")
+        if not force and finished_at and now - finished_at < self.run_every:
+            await self._release_lease()
+            return None
+
+        progress = {
+            "status": "running",
+            "model": model_name,
+            "started_at": now,
+            "finished_at": None,
+            "total": await self.db.users.estimated_document_count(),
+            "scored": 0,
+            "updated": 0,
+            "error": None,
+        }
+        await self._save(progress)
+        try:
+            await self._score_all(self.models[model_name], now, progress)
+            progress["status"] = "completed"
+        except asyncio.CancelledError:
+            progress["status"] = "cancelled"
+            raise
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            raise
+        finally:
+            progress["finished_at"] = utcnow()
+            await self._save(progress)
+            await self._release_lease()
+
+        self.runs += 1
+        logger.info(
+            f"Churn scoring ({model_name}): {progress['scored']} users scored, {progress['updated']} updated"
+        )
+        return progress
+
+    async def _score_all(self, model: ChurnModel, now: datetime, progress: Dict[str, Any]):
+        page = await self._page(None)
+        while page:
+            operations = self._score_page(model, page, now)
+            writes = [self.db.users.bulk_write(operations, ordered=False)] if operations else []
+            results = await asyncio.gather(self._page(page[-1]["_id"]), *writes)
+            progress["scored"] += len(page)
+            progress["updated"] += len(operations)
+            if not await self._save(progress):
+                raise RuntimeError("Another worker took the churn scoring lease over")
+            page = results[0]
+
+    async def _page(self, after: Any) -> List[Dict[str, Any]]:
+        query = {"_id": {"$gt": after}} if after is not None else {}
+        projection = {field: 1 for field in USER_FIELDS + ("churn_risk_score", "lifecycle_stage")}
+        cursor = self.db.users.find(query, projection).sort("_id", 1).limit(self.page_size)
+        return await cursor.to_list(length=self.page_size)
+
+    def _score_page(self, model: ChurnModel, users: List[Dict[str, Any]], now: datetime) -> List[UpdateOne]:
+        features = extract_features(users, now)
+        scores = np.clip(np.asarray(model.score(features), dtype=np.float64), 0.0, 1.0)
+        stages = lifecycle_stages(features, scores)
+
+        previous = np.array(
+            [_number(user, "churn_risk_score") if "churn_risk_score" in user else np.nan for user in users]
+        )
+        previous_stages = np.array([user.get("lifecycle_stage") or "" for user in users])
+        changed = np.isnan(previous) | (np.abs(previous - scores) > 1e-9) | (previous_stages != stages)
+        return [
+            UpdateOne(
+                {"_id": users[i]["_id"]},
+                {"$set": {"churn_risk_score": float(scores[i]), "lifecycle_stage": str(stages[i])}}
+            )
+            for i in np.flatnonzero(changed)
+        ]
+
+    async def _save(self, progress: Dict[str, Any]) -> bool:
+        return await self._renew_lease({"progress": progress})
+
+    async def get_progress(self, db: AsyncIOMotorDatabase) -> Optional[Dict[str, Any]]:
+        """Progress of the current or last run, with the share of users done"""
+        state = await db[self.STATE].find_one({"_id": self.STATE_ID}, {"progress": 1})
+        progress = (state or {}).get("progress")
+        if not progress:
+            return None
+        total = progress.get("total") or 0
+        progress["percent"] = round(min(progress["scored"] / total, 1.0) * 100, 1) if total else None
+        return progress
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "models": list(self.models),
+            "default_model": self.default_model
+        }
+
+
+# Global service; server.py starts it with the database on startup
+churn_scoring = ChurnScoringService()
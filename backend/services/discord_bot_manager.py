@@ -1,13 +1,16 @@
-import discord
-from discord.ext import commands
 import asyncio
 import logging
-from typing import Dict, Optional
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from typing import TYPE_CHECKING, Dict, Optional
+from database import get_database
+from repositories import projection
 import uuid
 from datetime import datetime
 
+if TYPE_CHECKING:
+    # discord.py is imported when the first bot starts, not at app startup
+    import discord
+    from discord.ext import commands
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,16 +18,16 @@ class DiscordBotManager:
     """Manages Discord bot instances for different chatbots"""
     
     def __init__(self):
-        self.bots: Dict[str, commands.Bot] = {}
+        self.bots: Dict[str, "commands.Bot"] = {}
         self.bot_tasks: Dict[str, asyncio.Task] = {}
-        self.mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-        self.db_name = os.environ.get('DB_NAME', 'chatbase_db')
-        self.client = AsyncIOMotorClient(self.mongo_url)
-        self.db = self.client[self.db_name]
+        self.db = get_database()
     
     async def start_bot(self, chatbot_id: str, bot_token: str):
         """Start a Discord bot for a specific chatbot"""
         try:
+            import discord
+            from discord.ext import commands
+
             # Stop existing bot if running
             if chatbot_id in self.bots:
                 await self.stop_bot(chatbot_id)
@@ -99,7 +102,7 @@ class DiscordBotManager:
             logger.error(f"Error stopping Discord bot: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def process_message(self, bot, message: discord.Message):
+    async def process_message(self, bot, message: "discord.Message"):
         """Process incoming Discord message and generate AI response"""
         try:
             chatbot_id = bot.chatbot_id
@@ -158,7 +161,7 @@ class DiscordBotManager:
             await bot.db.messages.insert_one(user_message)
             
             # Get chatbot configuration
-            chatbot = await bot.db.chatbots.find_one({"id": chatbot_id})
+            chatbot = await bot.db.chatbots.find_one({"id": chatbot_id}, projection("chatbot.chat_runtime"))
             if not chatbot:
                 logger.error(f"Chatbot not found: {chatbot_id}")
                 return
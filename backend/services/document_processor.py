@@ -1,7 +1,4 @@
 import io
-from pypdf import PdfReader
-from docx import Document
-import openpyxl
 from typing import Optional
 import logging
 
@@ -9,12 +6,19 @@ logger = logging.getLogger(__name__)
 
 
 class DocumentProcessor:
-    """Process various document types and extract text content"""
+    """
+    Process various document types and extract text content
+
+    The parsers (pypdf, python-docx, openpyxl) are imported by the method
+    that needs them, so they are only loaded once a file of that type is
+    uploaded.
+    """
     
     @staticmethod
     def process_pdf(file_content: bytes) -> str:
         """Extract text from PDF file"""
         try:
+            from pypdf import PdfReader
             pdf_file = io.BytesIO(file_content)
             reader = PdfReader(pdf_file)
             text = ""
@@ -29,6 +33,7 @@ class DocumentProcessor:
     def process_docx(file_content: bytes) -> str:
         """Extract text from DOCX file"""
         try:
+            from docx import Document
             doc_file = io.BytesIO(file_content)
             doc = Document(doc_file)
             text = ""
@@ -52,6 +57,7 @@ class DocumentProcessor:
     def process_xlsx(file_content: bytes) -> str:
         """Extract text from XLSX file"""
         try:
+            import openpyxl
             xlsx_file = io.BytesIO(file_content)
             workbook = openpyxl.load_workbook(xlsx_file)
             text = ""
@@ -0,0 +1,230 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi.responses import StreamingResponse
+import csv
+import io
+import json
+import zlib
+
+# Output is sent in pieces of about this size
+CHUNK_BYTES = 64 * 1024
+
+# Accepted values of the `format` query parameter
+FORMATS = ("json", "ndjson", "csv")
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def to_json(doc: Any) -> str:
+    """Serialize a document; datetimes become ISO strings, ObjectIds and the like str()"""
+    return json.dumps(doc, default=_default, ensure_ascii=False)
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return to_json(value)
+    return value
+
+
+async def json_array(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """A JSON array written one element at a time"""
+    yield "["
+    first = True
+    async for row in rows:
+        yield ("\n" if first else ",\n") + to_json(row)
+        first = False
+    yield "\n]\n"
+
+
+async def ndjson(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """One JSON document per line"""
+    async for row in rows:
+        yield to_json(row) + "\n"
+
+
+async def json_object(fields: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    """
+    A JSON object written one field at a time
+
+    A field whose value is an async iterator is written as a streamed
+    array; the next field is only pulled once it is exhausted, so later
+    fields (such as totals) can depend on what was streamed before.
+    """
+    yield "{"
+    first = True
+    async for key, value in fields:
+        yield ("\n" if first else ",\n") + to_json(key) + ": "
+        first = False
+        if hasattr(value, "__aiter__"):
+            async for piece in json_array(value):
+                yield piece
+        else:
+            yield to_json(value)
+    yield "\n}\n"
+
+
+async def ndjson_records(fields: AsyncIterator[Tuple[str, Any]]) -> AsyncIterator[str]:
+    """The fields of json_object() as {"type": key, "data": ...} lines, one per array element"""
+    async for key, value in fields:
+        if hasattr(value, "__aiter__"):
+            async for item in value:
+                yield to_json({"type": key, "data": item}) + "\n"
+        else:
+            yield to_json({"type": key, "data": value}) + "\n"
+
+
+async def csv_lines(
+    rows: AsyncIterator[Dict[str, Any]],
+    fieldnames: Sequence[str],
+    header: Optional[Sequence[str]] = None
+) -> AsyncIterator[str]:
+    """A header line (default: the field names), then one CSV line per row; missing fields are left empty"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header or fieldnames)
+    async for row in rows:
+        writer.writerow([_cell(row.get(field)) for field in fieldnames])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _encode(pieces: AsyncIterator[str], compress: bool) -> AsyncIterator[bytes]:
+    # The first piece goes out at once so downloads start immediately;
+    # after that pieces are batched into CHUNK_BYTES writes
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending: List[bytes] = []
+    size = 0
+    sent = False
+    async for piece in pieces:
+        data = piece.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if not data:
+            continue
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES or not sent:
+            yield b"".join(pending)
+            pending, size, sent = [], 0, True
+    if compressor is not None:
+        pending.append(compressor.flush())
+    if pending:
+        yield b"".join(pending)
+
+
+def export_response(
+    pieces: AsyncIterator[str],
+    format: str,
+    filename: str,
+    compress: bool = False
+) -> StreamingResponse:
+    """
+    Stream serialized export pieces as a file download
+
+    Args:
+        pieces: Serialized output, e.g. from serialize() or json_object()
+        format: One of FORMATS, for the media type and file extension
+        filename: File name without extension
+        compress: Gzip the stream and download it as a .gz file
+
+    Returns:
+        StreamingResponse that starts sending before the export is complete
+    """
+    filename = f"{filename}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        _encode(pieces, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+def serialize(
+    rows: AsyncIterator[Dict[str, Any]],
+    format: str,
+    fieldnames: Optional[Sequence[str]] = None,
+    header: Optional[Sequence[str]] = None
+) -> AsyncIterator[str]:
+    """Pick the serializer for a format; CSV needs its column names"""
+    if format == "csv":
+        return csv_lines(rows, fieldnames or [], header)
+    if format == "ndjson":
+        return ndjson(rows)
+    return json_array(rows)
+
+
+async def _next(cursor) -> Optional[Dict[str, Any]]:
+    try:
+        return await cursor.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def conversations_with_messages(
+    db: AsyncIOMotorDatabase,
+    query: Dict[str, Any],
+    chatbot_ids: Optional[List[str]] = None,
+    message_projection: Optional[Dict[str, int]] = None
+) -> AsyncIterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Walk conversations with their messages, without a query per conversation
+
+    Conversations sorted by id and messages sorted by (conversation_id,
+    timestamp) are read side by side and merged, so two cursors cover the
+    whole export and only one conversation's messages are held at a time.
+
+    Args:
+        db: Database instance
+        query: Filter on conversations
+        chatbot_ids: Chatbots the conversations belong to, to narrow the
+            messages cursor (default: all messages)
+        message_projection: Message fields to read (default: all but _id)
+
+    Yields:
+        (conversation, messages in timestamp order)
+    """
+    message_query: Dict[str, Any] = {}
+    if chatbot_ids is not None:
+        message_query["chatbot_id"] = {"$in": chatbot_ids}
+    projection = {"_id": 0, **(message_projection or {})}
+    if message_projection:
+        projection["conversation_id"] = 1
+
+    conversations = db.conversations.find(query, {"_id": 0}).sort("id", 1)
+    messages = db.messages.find(message_query, projection).sort([("conversation_id", 1), ("timestamp", 1)])
+    try:
+        message = await _next(messages)
+        async for conversation in conversations:
+            conversation_id = conversation.get("id") or ""
+            # Skip messages of conversations that are not exported
+            while message is not None and (message.get("conversation_id") or "") < conversation_id:
+                message = await _next(messages)
+            batch = []
+            while message is not None and message.get("conversation_id") == conversation_id:
+                batch.append(message)
+                message = await _next(messages)
+            yield conversation, batch
+    finally:
+        # The client may disconnect mid-export
+        await messages.close()
+        await conversations.close()
@@ -0,0 +1,223 @@
+from typing import Dict, Any, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Declarative index registry: collection -> list of index specs.
+# Each spec is {"keys": [(field, direction), ...], "name": str, **options}.
+# Keep this in sync with the filters used on the hot paths (chat, public chat,
+# integrations webhooks, auth, plan checks and notifications).
+INDEX_REGISTRY: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        {"keys": [("email", ASCENDING)], "name": "email_1"},
+        {"keys": [("id", ASCENDING)], "name": "id_1"},
+    ],
+    "chatbots": [
+        {"keys": [("id", ASCENDING)], "name": "id_1"},
+        {"keys": [("user_id", ASCENDING), ("created_at", DESCENDING)], "name": "user_id_1_created_at_-1"},
+    ],
+    "conversations": [
+        {"keys": [("id", ASCENDING)], "name": "id_1"},
+        {"keys": [("chatbot_id", ASCENDING), ("session_id", ASCENDING)], "name": "chatbot_id_1_session_id_1"},
+        {"keys": [("chatbot_id", ASCENDING), ("updated_at", DESCENDING)], "name": "chatbot_id_1_updated_at_-1"},
+        {"keys": [("chatbot_id", ASCENDING), ("created_at", DESCENDING)], "name": "chatbot_id_1_created_at_-1"},
+        # Exports walk a chatbot's conversations in id order
+        {"keys": [("chatbot_id", ASCENDING), ("id", ASCENDING)], "name": "chatbot_id_1_id_1"},
+        # Analytics rollup job scans by time across all chatbots
+        {"keys": [("created_at", ASCENDING)], "name": "created_at_1"},
+    ],
+    "messages": [
+        {"keys": [("conversation_id", ASCENDING), ("timestamp", ASCENDING)], "name": "conversation_id_1_timestamp_1"},
+        {"keys": [("chatbot_id", ASCENDING), ("timestamp", ASCENDING)], "name": "chatbot_id_1_timestamp_1"},
+        # Exports merge a chatbot's messages into its conversations in that order
+        {
+            "keys": [("chatbot_id", ASCENDING), ("conversation_id", ASCENDING), ("timestamp", ASCENDING)],
+            "name": "chatbot_id_1_conversation_id_1_timestamp_1"
+        },
+        {"keys": [("timestamp", ASCENDING)], "name": "timestamp_1"},
+    ],
+    "sources": [
+        {"keys": [("id", ASCENDING)], "name": "id_1"},
+        {"keys": [("chatbot_id", ASCENDING), ("created_at", DESCENDING)], "name": "chatbot_id_1_created_at_-1"},
+    ],
+    "integrations": [
+        {
+            "keys": [("chatbot_id", ASCENDING), ("integration_type", ASCENDING), ("enabled", ASCENDING)],
+            "name": "chatbot_id_1_integration_type_1_enabled_1",
+        },
+        {"keys": [("id", ASCENDING)], "name": "id_1"},
+    ],
+    "subscriptions": [
+        {"keys": [("user_id", ASCENDING)], "name": "user_id_1"},
+    ],
+    "notifications": [
+        # Keyset pagination sorts by (created_at, _id); the read variant also
+        # serves unread counts
+        {
+            "keys": [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            "name": "user_id_1_created_at_-1__id_-1",
+        },
+        {
+            "keys": [("user_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            "name": "user_id_1_read_1_created_at_-1__id_-1",
+        },
+    ],
+    "notification_counters": [
+        {"keys": [("user_id", ASCENDING)], "name": "user_id_1", "unique": True},
+    ],
+    "notification_preferences": [
+        {"keys": [("user_id", ASCENDING)], "name": "user_id_1"},
+    ],
+    "push_subscriptions": [
+        {"keys": [("user_id", ASCENDING), ("endpoint", ASCENDING)], "name": "user_id_1_endpoint_1"},
+    ],
+    "leads": [
+        {"keys": [("user_id", ASCENDING), ("status", ASCENDING)], "name": "user_id_1_status_1"},
+    ],
+    "conversation_ratings": [
+        {"keys": [("chatbot_id", ASCENDING)], "name": "chatbot_id_1"},
+        {"keys": [("conversation_id", ASCENDING)], "name": "conversation_id_1"},
+        {"keys": [("created_at", ASCENDING)], "name": "created_at_1"},
+    ],
+    "analytics_hourly": [
+        {"keys": [("chatbot_id", ASCENDING), ("hour", ASCENDING)], "name": "chatbot_id_1_hour_1"},
+    ],
+    "analytics_daily": [
+        {"keys": [("chatbot_id", ASCENDING), ("day", ASCENDING)], "name": "chatbot_id_1_day_1"},
+    ],
+    "top_questions_daily": [
+        {"keys": [("chatbot_id", ASCENDING), ("day", ASCENDING)], "name": "chatbot_id_1_day_1"},
+    ],
+    "unique_visitors": [
+        {"keys": [("chatbot_id", ASCENDING), ("day", ASCENDING)], "name": "chatbot_id_1_day_1"},
+    ],
+    "latency_sketches": [
+        {"keys": [("chatbot_id", ASCENDING), ("day", ASCENDING)], "name": "chatbot_id_1_day_1"},
+    ],
+}
+
+
+class IndexService:
+    """
+    Applies INDEX_REGISTRY to the database and reports index health.
+    Safe to run on every startup: existing indexes with the same key pattern
+    are left untouched and new ones are built in the background.
+    """
+
+    def __init__(self, registry: Dict[str, List[Dict[str, Any]]] = None):
+        self.registry = registry if registry is not None else INDEX_REGISTRY
+
+    @staticmethod
+    def _key_signature(keys) -> Tuple:
+        """Normalize an index key pattern so registry and server specs compare equal"""
+        if isinstance(keys, dict):
+            keys = keys.items()
+        return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                     for field, direction in keys)
+
+    async def _existing_signatures(self, db: AsyncIOMotorDatabase, collection_name: str) -> Dict[Tuple, str]:
+        """Map key signature -> index name for indexes already on the collection"""
+        existing = {}
+        try:
+            async for index in db[collection_name].list_indexes():
+                existing[self._key_signature(index["key"])] = index["name"]
+        except OperationFailure:
+            # Collection does not exist yet
+            pass
+        return existing
+
+    async def ensure_indexes(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """
+        Create every registry index that does not exist yet
+
+        Args:
+            db: Database handle
+
+        Returns:
+            Dictionary with created, existing and failed index names per collection
+        """
+        report = {"created": {}, "existing": {}, "failed": {}}
+
+        # One round trip per collection, all collections at once
+        await asyncio.gather(*[
+            self._ensure_collection_indexes(db, collection_name, specs, report)
+            for collection_name, specs in self.registry.items()
+        ])
+        return report
+
+    async def _ensure_collection_indexes(
+        self,
+        db: AsyncIOMotorDatabase,
+        collection_name: str,
+        specs: List[Dict[str, Any]],
+        report: Dict[str, Any]
+    ):
+        """Create the missing registry indexes of one collection"""
+        existing = await self._existing_signatures(db, collection_name)
+        to_create = []
+
+        for spec in specs:
+            signature = self._key_signature(spec["keys"])
+            if signature in existing:
+                report["existing"].setdefault(collection_name, []).append(existing[signature])
+                continue
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            options.setdefault("background", True)
+            to_create.append(IndexModel(spec["keys"], **options))
+
+        if not to_create:
+            return
+
+        try:
+            names = await db[collection_name].create_indexes(to_create)
+            report["created"][collection_name] = names
+            logger.info(f"Created indexes on {collection_name}: {', '.join(names)}")
+        except OperationFailure as e:
+            report["failed"][collection_name] = [model.document["name"] for model in to_create]
+            logger.warning(f"Failed to create indexes on {collection_name}: {str(e)}")
+
+    async def get_index_report(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """
+        Report registry indexes missing from the database and indexes with no
+        recorded usage according to $indexStats (counters reset on mongod restart)
+
+        Args:
+            db: Database handle
+
+        Returns:
+            Dictionary with "missing" and "unused" index names per collection
+        """
+        report = {"missing": {}, "unused": {}}
+
+        for collection_name, specs in self.registry.items():
+            existing = await self._existing_signatures(db, collection_name)
+            missing = [
+                spec["name"] for spec in specs
+                if self._key_signature(spec["keys"]) not in existing
+            ]
+            if missing:
+                report["missing"][collection_name] = missing
+
+            if not existing:
+                continue
+
+            try:
+                unused = []
+                async for stats in db[collection_name].aggregate([{"$indexStats": {}}]):
+                    if stats["name"] != "_id_" and stats.get("accesses", {}).get("ops", 0) == 0:
+                        unused.append(stats["name"])
+                if unused:
+                    report["unused"][collection_name] = sorted(unused)
+            except OperationFailure as e:
+                logger.warning(f"$indexStats unavailable for {collection_name}: {str(e)}")
+
+        return report
+
+
+# Global index service instance
+index_service = IndexService()
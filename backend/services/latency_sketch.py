@@ -0,0 +1,352 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# Stages timed for every assistant reply; "total" is the whole turn
+STAGES = ("retrieval", "llm", "persistence", "total")
+
+# Quantile estimates are within 1% of the true value
+RELATIVE_ACCURACY = 0.01
+
+# Anything faster than this lands in the lowest bucket
+MIN_TRACKED_MS = 0.1
+
+
+class LatencySketch:
+    """
+    Log-bucketed latency histogram (the DDSketch layout).
+
+    A value x is counted in bucket ceil(log(x) / log(gamma)) with
+    gamma = (1 + a) / (1 - a), so every bucket spans a relative width of 2a
+    and any quantile read from it is within a (1%) of the exact one. From
+    0.1 ms to one hour that is under 900 buckets whatever the traffic, and
+    two sketches merge exactly by adding their bucket counts - which is how
+    per-day sketches are combined into a week or a quarter.
+    """
+
+    def __init__(self, buckets: Optional[Dict[Any, int]] = None, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        for key, count in (buckets or {}).items():
+            self.buckets[int(key)] = self.buckets.get(int(key), 0) + count
+
+    def key(self, value_ms: float) -> int:
+        return math.ceil(math.log(max(value_ms, MIN_TRACKED_MS)) / self._log_gamma)
+
+    def value(self, key: int) -> float:
+        """Representative value of a bucket (relative error at most a)"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value_ms: float, count: int = 1):
+        key = self.key(value_ms)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: "LatencySketch"):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q (0..1); 0.0 for an empty sketch"""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return self.value(key)
+        return self.value(max(self.buckets))
+
+    def to_document(self) -> Dict[str, int]:
+        # MongoDB field names must be strings
+        return {str(key): count for key, count in self.buckets.items()}
+
+
+class StageTimer:
+    """Times the stages of one chat turn with perf_counter"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    async def run(self, stage: str, awaitable):
+        """Await `awaitable` and record its duration as `stage`"""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.add(stage, (time.perf_counter() - started) * 1000)
+
+    def add(self, stage: str, elapsed_ms: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + elapsed_ms
+
+    def finish(self) -> Dict[str, float]:
+        """Record the total time of the turn and return all timings"""
+        self.timings["total"] = (time.perf_counter() - self.started) * 1000
+        return self.as_milliseconds()
+
+    def as_milliseconds(self) -> Dict[str, float]:
+        """Timings as stored on the assistant message ({"llm_ms": 812.4, ...})"""
+        return {f"{stage}_ms": round(elapsed, 2) for stage, elapsed in self.timings.items()}
+
+
+async def store_message_timings(db: AsyncIOMotorDatabase, message_id: Any, timings: Dict[str, float]):
+    """
+    Replace the timings saved with an assistant message by the finished ones
+
+    The message is inserted while its reply is still being persisted, so it
+    is saved with the timings so far; once the turn is done (typically as a
+    background task after the response) this adds the rest of the
+    persistence time and the total.
+    """
+    try:
+        await db.messages.update_one({"_id": message_id}, {"$set": {"timings": timings}})
+    except Exception as e:
+        logger.warning(f"Failed to store the timings of message {message_id}: {str(e)}")
+
+
+class LatencyRecorder:
+    """
+    Per-chatbot, per-day latency sketches for every chat stage.
+
+    record() only adds to in-memory sketches; every few seconds the pending
+    bucket counts of all chatbots are written with one bulk_write of $inc
+    upserts into `latency_sketches` (one document per chatbot and UTC day).
+    Reading p50/p95/p99 for a period merges one small document per day, so
+    the cost of the dashboards does not grow with the number of messages.
+    Sums, counts and extremes are kept next to the buckets for exact
+    averages and fastest/slowest replies.
+    """
+
+    COLLECTION = "latency_sketches"
+
+    def __init__(self, flush_interval_seconds: float = 10.0):
+        """
+        Args:
+            flush_interval_seconds: How often pending timings are written
+        """
+        self.flush_interval = flush_interval_seconds
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        # (chatbot_id, day) -> stage -> pending values
+        self._pending: Dict[Tuple[str, str], Dict[str, List[float]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        if self.running:
+            return
+        self.db = db
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Latency recorder started (flush every {self.flush_interval}s)")
+
+    async def stop(self):
+        """Write whatever is pending and stop"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    def record(self, chatbot_id: str, timings: Dict[str, float]):
+        """
+        Add the stage timings of one reply
+
+        Args:
+            chatbot_id: Chatbot that replied
+            timings: Milliseconds per stage, as returned by StageTimer.finish()
+        """
+        if not self.running:
+            return
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        stages = self._pending.setdefault((chatbot_id, day), {})
+        for name, elapsed in timings.items():
+            stage = name[:-3] if name.endswith("_ms") else name
+            stages.setdefault(stage, []).append(elapsed)
+        self.recorded += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write latency sketches: {str(e)}")
+
+    async def flush(self):
+        if not self._pending or self.db is None:
+            return
+        pending, self._pending = self._pending, {}
+
+        keys = list(pending)
+        operations = []
+        for chatbot_id, day in keys:
+            stages = pending[(chatbot_id, day)]
+            inc: Dict[str, float] = {}
+            minimum: Dict[str, float] = {}
+            maximum: Dict[str, float] = {}
+            for stage, values in stages.items():
+                sketch = LatencySketch()
+                for value in values:
+                    sketch.add(value)
+                for key, count in sketch.to_document().items():
+                    inc[f"stages.{stage}.buckets.{key}"] = count
+                inc[f"stages.{stage}.count"] = len(values)
+                inc[f"stages.{stage}.sum_ms"] = sum(values)
+                minimum[f"stages.{stage}.min_ms"] = min(values)
+                maximum[f"stages.{stage}.max_ms"] = max(values)
+            operations.append(UpdateOne(
+                {"_id": f"{chatbot_id}|{day}"},
+                {
+                    "$inc": inc,
+                    "$min": minimum,
+                    "$max": maximum,
+                    "$setOnInsert": {"chatbot_id": chatbot_id, "day": day}
+                },
+                upsert=True
+            ))
+
+        try:
+            await self.db[self.COLLECTION].bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # The other updates were applied; only retry the rejected ones
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            for index in failed:
+                self._requeue(keys[index], pending[keys[index]])
+            raise
+        except Exception:
+            for key in keys:
+                self._requeue(key, pending[key])
+            raise
+        self.flushes += 1
+
+    def _requeue(self, key: Tuple[str, str], stages: Dict[str, List[float]]):
+        # Put timings that were not written back in front of newer ones
+        pending = self._pending.setdefault(key, {})
+        for stage, values in stages.items():
+            pending[stage] = values + pending.get(stage, [])
+
+    async def get_summary(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Merge the daily sketches of a chatbot over a period
+
+        Args:
+            db: Database instance
+            chatbot_id: Chatbot to summarize
+            start: First day included (default: all history)
+            end: Last day included (default: today)
+
+        Returns:
+            {stage: {"count", "avg_ms", "min_ms", "max_ms", "p50_ms", "p95_ms", "p99_ms"}}
+        """
+        query: Dict[str, Any] = {"chatbot_id": chatbot_id}
+        if start or end:
+            query["day"] = {}
+            if start:
+                query["day"]["$gte"] = start.strftime("%Y-%m-%d")
+            if end:
+                query["day"]["$lte"] = end.strftime("%Y-%m-%d")
+
+        docs = await db[self.COLLECTION].find(query, {"stages": 1}).to_list(length=None)
+        return self.summarize(doc.get("stages", {}) for doc in docs)
+
+    async def get_first_day(self, db: AsyncIOMotorDatabase, chatbot_id: str) -> Optional[str]:
+        """First UTC day ("YYYY-MM-DD") with recorded timings, or None"""
+        doc = await db[self.COLLECTION].find_one({"chatbot_id": chatbot_id}, {"day": 1}, sort=[("day", 1)])
+        return doc["day"] if doc else None
+
+    async def get_daily_quantiles(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_id: str,
+        start: datetime,
+        end: datetime,
+        stage: str = "total"
+    ) -> Dict[str, Dict[str, float]]:
+        """Per-day summary of one stage: {"YYYY-MM-DD": {"count", "avg_ms", "p50_ms", ...}}"""
+        docs = await db[self.COLLECTION].find(
+            {
+                "chatbot_id": chatbot_id,
+                "day": {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
+            },
+            {"day": 1, f"stages.{stage}": 1}
+        ).to_list(length=None)
+        daily = {}
+        for doc in docs:
+            summary = self.summarize([doc.get("stages", {})])
+            if stage in summary:
+                daily[doc["day"]] = summary[stage]
+        return daily
+
+    @staticmethod
+    def summarize(stage_docs: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+        """Merge stored stage documents into count/avg/min/max and p50/p95/p99 per stage"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for stages in stage_docs:
+            for stage, data in stages.items():
+                entry = merged.setdefault(stage, {
+                    "sketch": LatencySketch(), "count": 0, "sum_ms": 0.0, "min_ms": None, "max_ms": None
+                })
+                entry["sketch"].merge(LatencySketch(data.get("buckets")))
+                entry["count"] += data.get("count", 0)
+                entry["sum_ms"] += data.get("sum_ms", 0.0)
+                for field, pick in (("min_ms", min), ("max_ms", max)):
+                    if data.get(field) is not None:
+                        current = entry[field]
+                        entry[field] = data[field] if current is None else pick(current, data[field])
+
+        summary = {}
+        for stage, entry in merged.items():
+            if not entry["count"]:
+                continue
+            sketch = entry["sketch"]
+            summary[stage] = {
+                "count": entry["count"],
+                "avg_ms": round(entry["sum_ms"] / entry["count"], 2),
+                "min_ms": round(entry["min_ms"] or 0.0, 2),
+                "max_ms": round(entry["max_ms"] or 0.0, 2),
+                "p50_ms": round(sketch.quantile(0.50), 2),
+                "p95_ms": round(sketch.quantile(0.95), 2),
+                "p99_ms": round(sketch.quantile(0.99), 2),
+            }
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending_chatbot_days": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes
+        }
+
+
+# Global recorder; server.py starts it with the database on startup
+latency_recorder = LatencyRecorder()
@@ -0,0 +1,121 @@
+from typing import Any, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow() -> datetime:
+    # Naive UTC, like the datetimes Motor returns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class LeasedJob:
+    """
+    A periodic background job that one worker at a time runs.
+
+    Every worker runs the loop; a run starts by taking the lease on the
+    job's state document (`STATE_ID` in `STATE`), which only succeeds if
+    the lease expired, was never taken or is already this worker's. Long
+    runs renew the lease as they go - renewals only match while this
+    worker still owns it, so a worker that stalled past its lease stops
+    instead of racing the one that took over - and release it when done.
+
+    Subclasses set STATE, STATE_ID and NAME and implement run_once().
+    """
+
+    STATE: str
+    STATE_ID: str
+    # Used in log messages
+    NAME = "Leased job"
+
+    def __init__(self, interval_seconds: float, lease_seconds: float):
+        """
+        Args:
+            interval_seconds: Pause between runs
+            lease_seconds: How long a worker may hold the job before another
+                one takes over
+        """
+        self.interval = interval_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Start the periodic job"""
+        if self.running:
+            return
+        self.db = db
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.NAME} failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> Any:
+        raise NotImplementedError
+
+    async def _acquire_lease(self, now: datetime) -> Optional[Dict[str, Any]]:
+        """Take the lease; returns the state document, or None if another worker holds it"""
+        try:
+            return await self.db[self.STATE].find_one_and_update(
+                {
+                    "_id": self.STATE_ID,
+                    "$or": [{"lease_until": {"$lt": now}}, {"lease_until": None}, {"lease_owner": self.worker_id}]
+                },
+                {"$set": {"lease_owner": self.worker_id, "lease_until": now + self.lease}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease
+            return None
+
+    async def _renew_lease(self, fields: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Extend the lease and store fields in the state document
+
+        Returns:
+            False if another worker took the lease over (nothing is written)
+        """
+        result = await self.db[self.STATE].update_one(
+            {"_id": self.STATE_ID, "lease_owner": self.worker_id},
+            {"$set": {**(fields or {}), "lease_until": utcnow() + self.lease}}
+        )
+        if result.matched_count == 0:
+            logger.warning(f"{self.NAME}: lease lost to another worker, stopping this run")
+            return False
+        return True
+
+    async def _release_lease(self):
+        await self.db[self.STATE].update_one(
+            {"_id": self.STATE_ID, "lease_owner": self.worker_id},
+            {"$set": {"lease_until": utcnow()}}
+        )
@@ -3,15 +3,12 @@ import httpx
 import logging
 from typing import Optional, Dict, Any
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
 
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'chatbase_db')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# MongoDB connection (shared client)
+db = get_database()
 
 
 class LemonSqueezyService:
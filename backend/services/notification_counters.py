@@ -0,0 +1,126 @@
+from typing import Any, Dict, Iterable
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from services.cache_service import CacheService
+from services.cache_invalidation import cache_invalidation_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCounters:
+    """
+    Maintained per-user unread counters with a change version.
+
+    Each user has one document in `notification_counters`:
+    {"user_id", "unread", "version"}. Every write to a user's notifications
+    adjusts `unread` and bumps `version` (one bulk_write per notification
+    batch), so reading the unread count is a point lookup instead of a
+    count_documents, and `version` doubles as the ETag of the user's
+    notification list. States are cached per worker and invalidated on
+    every worker through the cache invalidation bus, so an unchanged poll
+    does not reach the database at all.
+
+    A counter is seeded from count_documents the first time it is read:
+    the document is created first (unseeded, so increments from then on
+    bump its version), the notifications are counted, and the count is
+    stored only if the version did not move in between - otherwise the
+    count may or may not include those increments and is taken again.
+    Increments for users without a counter are skipped, since the seeding
+    count includes them.
+    """
+
+    COLLECTION = "notification_counters"
+    PROJECTION = {"_id": 0, "unread": 1, "version": 1, "seeded": 1}
+    # Attempts to seed a counter before storing a count that may be off
+    SEED_ATTEMPTS = 5
+
+    def __init__(self, ttl_seconds: int = 60):
+        self.cache = CacheService(
+            default_ttl_seconds=ttl_seconds,
+            max_entries=50000,
+            max_bytes=8 * 1024 * 1024
+        )
+        cache_invalidation_bus.register_cache(self.cache)
+
+    @staticmethod
+    def _namespace(user_id: str) -> str:
+        return f"notification_counter:{user_id}"
+
+    async def _seed(self, db: AsyncIOMotorDatabase, user_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        collection = db[self.COLLECTION]
+        for attempt in range(1, self.SEED_ATTEMPTS + 1):
+            unread = await db.notifications.count_documents({"user_id": user_id, "read": False})
+            query = {"user_id": user_id, "seeded": False}
+            if attempt < self.SEED_ATTEMPTS:
+                # Only if no increment landed while counting
+                query["version"] = state.get("version", 0)
+            seeded = await collection.find_one_and_update(
+                query,
+                {"$set": {"unread": unread, "seeded": True}, "$inc": {"version": 1}},
+                projection=self.PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+            if seeded is not None:
+                return seeded
+            state = await collection.find_one({"user_id": user_id}, self.PROJECTION)
+            if state is None or state.get("seeded", True):
+                # Seeded by another worker meanwhile
+                return state or {}
+        return state
+
+    async def get(self, db: AsyncIOMotorDatabase, user_id: str) -> Dict[str, int]:
+        """Unread count and version of a user's notifications"""
+        async def load():
+            try:
+                state = await db[self.COLLECTION].find_one_and_update(
+                    {"user_id": user_id},
+                    {"$setOnInsert": {"unread": 0, "version": 1, "seeded": False}},
+                    projection=self.PROJECTION,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Created by a concurrent upsert
+                state = await db[self.COLLECTION].find_one({"user_id": user_id}, self.PROJECTION)
+            # Counters created before seeding existed have no flag
+            if not state.get("seeded", True):
+                state = await self._seed(db, user_id, state)
+            return {"unread": max(0, state.get("unread", 0)), "version": state.get("version", 0)}
+
+        return await self.cache.get_or_load(
+            f"counter:{user_id}",
+            load,
+            namespaces=[self._namespace(user_id)]
+        )
+
+    async def increment(self, db: AsyncIOMotorDatabase, deltas: Dict[str, int]):
+        """
+        Adjust unread counts by user id and bump their versions
+
+        A delta of 0 only bumps the version (the list changed, the count
+        did not).
+        """
+        if not deltas:
+            return
+        operations = [
+            UpdateOne({"user_id": user_id}, {"$inc": {"unread": delta, "version": 1}})
+            for user_id, delta in deltas.items()
+        ]
+        await db[self.COLLECTION].bulk_write(operations, ordered=False)
+        await self.invalidate(deltas.keys())
+
+    async def invalidate(self, user_ids: Iterable[str]):
+        """Drop cached counter states on every worker"""
+        await cache_invalidation_bus.publish([self._namespace(user_id) for user_id in user_ids])
+
+    @staticmethod
+    def etag(state: Dict[str, int], *parts) -> str:
+        """Weak ETag for a view of the user's notifications at this version"""
+        suffix = "".join(f"-{part}" for part in parts)
+        return f'W/"{state["version"]}-{state["unread"]}{suffix}"'
+
+
+# Global counters, shared by the pipeline, the digester and the router
+notification_counters = NotificationCounters()
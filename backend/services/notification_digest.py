@@ -0,0 +1,249 @@
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from models_notifications import Notification
+from services.notification_counters import notification_counters
+from services.notification_pipeline import notification_pipeline
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds during which repeats of a notification type are folded into one
+# digest; NOTIFICATION_DIGEST_WINDOWS="new_conversation=300,usage_warning=0"
+# overrides entries (0 turns digesting off for that type)
+DEFAULT_DIGEST_WINDOWS = {
+    "new_conversation": 600,
+    "usage_warning": 3600,
+    "performance_alert": 900,
+    "source_processing": 300,
+    "webhook_event": 300,
+    "new_user_signup": 900,
+}
+
+DIGEST_TITLES = {
+    "new_conversation": "{count} new conversations",
+    "usage_warning": "{count} usage warnings",
+    "performance_alert": "{count} performance alerts",
+    "source_processing": "{count} sources processed",
+    "webhook_event": "{count} webhook events",
+    "new_user_signup": "{count} new user signups",
+}
+
+# Never held back, whatever the type
+URGENT_PRIORITIES = {"high", "critical"}
+
+
+def parse_digest_windows(value: Optional[str]) -> Dict[str, int]:
+    """Parse "type=seconds,type=seconds" into a dict, skipping bad entries"""
+    windows: Dict[str, int] = {}
+    for entry in (value or "").split(","):
+        name, _, seconds = entry.partition("=")
+        try:
+            windows[name.strip()] = int(seconds)
+        except ValueError:
+            if entry.strip():
+                logger.warning(f"Ignoring invalid notification digest window: {entry!r}")
+    return windows
+
+
+class _DigestWindow:
+    __slots__ = ("notification_id", "closes_at", "count", "first_event_at", "latest")
+
+    def __init__(self, doc: Dict[str, Any], closes_at: float):
+        self.notification_id = doc["_id"]
+        self.closes_at = closes_at
+        self.count = 1
+        self.first_event_at = doc["created_at"]
+        self.latest = doc
+
+
+class NotificationDigester:
+    """
+    Folds bursts of the same notification into one digest notification.
+
+    The first notification of a type for a user (and chatbot, or title when
+    there is no chatbot) goes out as usual and opens a window. Repeats
+    inside the window are only counted in memory. When the window closes
+    the original document is rewritten in place as a digest ("12 new
+    conversations", count=12, latest message, marked unread again) and
+    pushed and emailed once; if the user deleted it meanwhile, the digest
+    is dropped. So a window costs one insert plus one update
+    instead of one insert and one email/push per event, and the unread
+    count stays small for heavy users.
+
+    Windows live in each worker, so with N workers a burst produces at most
+    N digests per window. Expired windows of all users are written with a
+    single bulk_write.
+    """
+
+    def __init__(
+        self,
+        windows: Optional[Dict[str, int]] = None,
+        sweep_interval_seconds: float = 1.0
+    ):
+        """
+        Args:
+            windows: Digest window in seconds per notification type (defaults
+                to DEFAULT_DIGEST_WINDOWS plus NOTIFICATION_DIGEST_WINDOWS)
+            sweep_interval_seconds: How often closed windows are written
+        """
+        self.windows = windows
+        self.sweep_interval = sweep_interval_seconds
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._open: Dict[Tuple[str, str, Any], _DigestWindow] = {}
+        self._closed: List[_DigestWindow] = []
+        self._task: Optional[asyncio.Task] = None
+        self.absorbed = 0
+        self.digests_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Resolve the windows and start writing digests"""
+        if self.running:
+            return
+        if self.windows is None:
+            self.windows = {
+                **DEFAULT_DIGEST_WINDOWS,
+                **parse_digest_windows(os.environ.get('NOTIFICATION_DIGEST_WINDOWS'))
+            }
+        self.db = db
+        self._task = asyncio.create_task(self._sweep())
+        enabled = {name: seconds for name, seconds in self.windows.items() if seconds > 0}
+        logger.info(f"Notification digests enabled: {enabled}")
+
+    async def stop(self):
+        """Write every window that has absorbed something and stop"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        windows = self._closed + list(self._open.values())
+        self._closed = []
+        self._open.clear()
+        await self._write([window for window in windows if window.count > 1])
+
+    def absorb(self, doc: Dict[str, Any]) -> Optional[Notification]:
+        """
+        Fold a new notification document into an open digest
+
+        Returns:
+            The digest it was folded into, or None if the document should be
+            stored and delivered normally (it may have opened a new window)
+        """
+        if not self.running or doc.get("priority") in URGENT_PRIORITIES:
+            return None
+        window_seconds = self.windows.get(doc["type"], 0)
+        if window_seconds <= 0:
+            return None
+
+        metadata = doc.get("metadata") or {}
+        key = (doc["user_id"], doc["type"], metadata.get("chatbot_id") or doc["title"])
+        now = time.monotonic()
+        window = self._open.get(key)
+        if window is not None and window.closes_at > now:
+            window.count += 1
+            window.latest = doc
+            self.absorbed += 1
+            return Notification(**self._digest_fields(window), id=str(window.notification_id))
+
+        if window is not None and window.count > 1:
+            # Expired but not swept yet
+            self._closed.append(window)
+        self._open[key] = _DigestWindow(doc, now + window_seconds)
+        return None
+
+    def _digest_fields(self, window: _DigestWindow) -> Dict[str, Any]:
+        latest = window.latest
+        template = DIGEST_TITLES.get(latest["type"], "{title} ({count})")
+        return {
+            "user_id": latest["user_id"],
+            "type": latest["type"],
+            "title": template.format(count=window.count, title=latest["title"]),
+            "message": latest["message"],
+            "priority": latest.get("priority", "medium"),
+            "metadata": latest.get("metadata") or {},
+            "action_url": latest.get("action_url"),
+            "count": window.count,
+            "first_event_at": window.first_event_at,
+            "created_at": latest["created_at"],
+            "read": False,
+            "read_at": None
+        }
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            now = time.monotonic()
+            expired = [key for key, window in self._open.items() if window.closes_at <= now]
+            windows, self._closed = self._closed, []
+            for key in expired:
+                windows.append(self._open.pop(key))
+            windows = [window for window in windows if window.count > 1]
+            if not windows:
+                continue
+            try:
+                await self._write(windows)
+            except Exception as e:
+                logger.error(f"Failed to write {len(windows)} notification digests: {str(e)}")
+
+    async def _write(self, windows: List[_DigestWindow]):
+        if not windows:
+            return
+        # Digests come back unread; only those the user had read add to the
+        # unread count. Notifications the user deleted meanwhile stay deleted.
+        ids = [window.notification_id for window in windows]
+        existing = {}
+        async for doc in self.db.notifications.find({"_id": {"$in": ids}}, {"_id": 1, "read": 1}):
+            existing[doc["_id"]] = doc.get("read", False)
+        windows = [window for window in windows if window.notification_id in existing]
+        if not windows:
+            return
+
+        operations = []
+        digests = []
+        for window in windows:
+            fields = self._digest_fields(window)
+            operations.append(UpdateOne({"_id": window.notification_id}, {"$set": fields}))
+            digests.append(Notification(**fields, id=str(window.notification_id)))
+
+        result = await self.db.notifications.bulk_write(operations, ordered=False)
+        if result.matched_count < len(operations):
+            # Some were deleted between the read and the write
+            remaining = set()
+            async for doc in self.db.notifications.find({"_id": {"$in": ids}}, {"_id": 1}):
+                remaining.add(doc["_id"])
+            kept = [i for i, window in enumerate(windows) if window.notification_id in remaining]
+            windows = [windows[i] for i in kept]
+            digests = [digests[i] for i in kept]
+        self.digests_written += len(digests)
+
+        unread: Dict[str, int] = {}
+        for window, digest in zip(windows, digests):
+            unread[digest.user_id] = unread.get(digest.user_id, 0) + bool(existing[window.notification_id])
+        try:
+            await notification_counters.increment(self.db, unread)
+        except Exception as e:
+            logger.warning(f"Failed to update unread counters for digests: {str(e)}")
+        await notification_pipeline.dispatch(digests)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "open_windows": len(self._open),
+            "absorbed": self.absorbed,
+            "digests_written": self.digests_written
+        }
+
+
+# Global digester; server.py starts it with the database on startup
+notification_digester = NotificationDigester()
@@ -0,0 +1,325 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import CollectionInvalid, OperationFailure
+from fastapi import WebSocket
+from services.cache_invalidation import tail_capped
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class NotificationBroker:
+    """Carries notifications to every worker; each worker delivers to its own sockets"""
+
+    async def start(self, deliver: Deliver):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+    async def publish(self, user_id: str, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class InMemoryNotificationBroker(NotificationBroker):
+    """Single-process stand-in: delivers straight to this worker"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, user_id: str, payload: Dict[str, Any]):
+        if self._deliver is not None:
+            await self._deliver(user_id, payload)
+
+
+class MongoNotificationBroker(NotificationBroker):
+    """
+    Fans notifications out through the capped collection `notification_events`.
+
+    Same scheme as the cache invalidation bus: publish() delivers locally and
+    appends one event, and every worker tails the collection with a
+    tailable-await cursor, delivering events published by the others.
+    """
+
+    COLLECTION = "notification_events"
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        capped_size_bytes: int = 8 * 1024 * 1024,
+        capped_max_docs: int = 20000,
+        retry_delay_seconds: float = 1.0
+    ):
+        self.db = db
+        self.capped_size_bytes = capped_size_bytes
+        self.capped_max_docs = capped_max_docs
+        self.retry_delay = retry_delay_seconds
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._deliver: Optional[Deliver] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        if self._task is not None:
+            return
+        self._deliver = deliver
+        try:
+            await self.db.create_collection(
+                self.COLLECTION,
+                capped=True,
+                size=self.capped_size_bytes,
+                max=self.capped_max_docs
+            )
+        except (CollectionInvalid, OperationFailure):
+            # Already exists
+            pass
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def publish(self, user_id: str, payload: Dict[str, Any]):
+        await self._deliver(user_id, payload)
+        try:
+            await self.db[self.COLLECTION].insert_one({
+                "user_id": user_id,
+                "payload": payload,
+                "origin": self.worker_id,
+                "created_at": datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            logger.warning(f"Failed to publish notification event for {user_id}: {str(e)}")
+
+    async def _tail(self):
+        await tail_capped(self.db[self.COLLECTION], self._apply, self.retry_delay, "Notification event")
+
+    async def _apply(self, doc: Dict[str, Any]):
+        if doc.get("origin") == self.worker_id:
+            return
+        await self._deliver(doc["user_id"], doc.get("payload", {}))
+
+
+class _Connection:
+    __slots__ = ("websocket", "connected_at", "last_seen", "lock")
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.connected_at = time.monotonic()
+        self.last_seen = self.connected_at
+        self.lock = asyncio.Lock()
+
+
+class NotificationHub:
+    """
+    Real-time notification delivery over WebSockets.
+
+    - A user may hold any number of sockets (tabs, devices); all receive
+      every notification.
+    - Notifications reach sockets on every worker through a
+      NotificationBroker.
+    - Bursts are buffered for batch_window_seconds per user, notifications
+      for the same thing (same type and chatbot) are coalesced into one
+      with a count, and several left over are sent as one
+      "notification_batch" message.
+    - A heartbeat pings every socket; sockets that fail or time out on a
+      send are dropped, and so are sockets the client has not sent anything
+      on (clients answer pings with "pong") for idle_timeout_seconds.
+    """
+
+    def __init__(
+        self,
+        batch_window_seconds: float = 0.2,
+        max_batch: int = 50,
+        heartbeat_interval_seconds: float = 30.0,
+        send_timeout_seconds: float = 5.0,
+        idle_timeout_seconds: Optional[float] = None
+    ):
+        self.batch_window = batch_window_seconds
+        self.max_batch = max_batch
+        self.heartbeat_interval = heartbeat_interval_seconds
+        self.send_timeout = send_timeout_seconds
+        # Three missed heartbeats by default
+        self.idle_timeout = idle_timeout_seconds or 3 * heartbeat_interval_seconds
+        self.connections: Dict[str, Set[_Connection]] = {}
+        self.broker: Optional[NotificationBroker] = None
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.messages_sent = 0
+        self.coalesced = 0
+        self.dropped_connections = 0
+
+    async def start(self, broker: NotificationBroker):
+        """Attach the broker and start the heartbeat"""
+        self.broker = broker
+        await broker.start(self._deliver_local)
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"Notification hub started with {type(broker).__name__}")
+
+    async def stop(self):
+        """Stop the heartbeat and the broker"""
+        for task in [self._heartbeat_task, *self._flush_tasks.values()]:
+            if task is not None:
+                task.cancel()
+        self._heartbeat_task = None
+        self._flush_tasks.clear()
+        if self.broker is not None:
+            await self.broker.stop()
+
+    async def connect(self, user_id: str, websocket: WebSocket) -> _Connection:
+        """Accept a socket and register it for the user"""
+        await websocket.accept()
+        connection = _Connection(websocket)
+        self.connections.setdefault(user_id, set()).add(connection)
+        logger.info(f"WebSocket connected for user: {user_id} ({len(self.connections[user_id])} open)")
+        return connection
+
+    def disconnect(self, user_id: str, connection: _Connection):
+        """Forget a socket"""
+        sockets = self.connections.get(user_id)
+        if not sockets or connection not in sockets:
+            return
+        sockets.discard(connection)
+        if not sockets:
+            del self.connections[user_id]
+            self._pending.pop(user_id, None)
+        logger.info(f"WebSocket disconnected for user: {user_id}")
+
+    def touch(self, connection: _Connection):
+        """Record that the client sent something"""
+        connection.last_seen = time.monotonic()
+
+    async def send(self, user_id: str, connection: _Connection, message: Dict[str, Any]) -> bool:
+        """Send one message to one socket; drops the socket on failure"""
+        return await self._send_text(user_id, connection, json.dumps(message, default=str))
+
+    async def publish(self, user_id: str, notification: Dict[str, Any]):
+        """Deliver a notification to every socket of the user on every worker"""
+        if self.broker is None:
+            await self._deliver_local(user_id, notification)
+            return
+        await self.broker.publish(user_id, notification)
+
+    async def _deliver_local(self, user_id: str, payload: Dict[str, Any]):
+        if user_id not in self.connections:
+            return
+        pending = self._pending.setdefault(user_id, [])
+        pending.append(payload)
+
+        if len(pending) >= self.max_batch:
+            task = self._flush_tasks.pop(user_id, None)
+            if task is not None:
+                task.cancel()
+            await self._flush(user_id)
+        elif user_id not in self._flush_tasks:
+            self._flush_tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: str):
+        await asyncio.sleep(self.batch_window)
+        self._flush_tasks.pop(user_id, None)
+        await self._flush(user_id)
+
+    def _coalesce(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge notifications about the same thing, keeping the latest with a count"""
+        merged: Dict[Any, Dict[str, Any]] = {}
+        for index, item in enumerate(items):
+            chatbot_id = (item.get("metadata") or {}).get("chatbot_id")
+            key = (item.get("type"), chatbot_id) if chatbot_id else index
+            previous = merged.pop(key, None)
+            if previous is not None:
+                item = {**item, "count": previous.get("count", 1) + 1}
+                self.coalesced += 1
+            merged[key] = item
+        return list(merged.values())
+
+    async def _flush(self, user_id: str):
+        items = self._pending.pop(user_id, None)
+        sockets = self.connections.get(user_id)
+        if not items or not sockets:
+            return
+
+        items = self._coalesce(items)
+        total = sum(item.get("count", 1) for item in items)
+        if len(items) == 1:
+            message = items[0]
+        else:
+            message = {
+                "type": "notification_batch",
+                "title": f"{total} new notifications",
+                "message": items[-1].get("title", ""),
+                "count": total,
+                "notifications": items
+            }
+
+        text = json.dumps(message, default=str)
+        await asyncio.gather(*[self._send_text(user_id, connection, text) for connection in list(sockets)])
+        self.delivered += total
+        self.messages_sent += 1
+
+    async def _send_text(self, user_id: str, connection: _Connection, text: str) -> bool:
+        try:
+            async with connection.lock:
+                await asyncio.wait_for(connection.websocket.send_text(text), timeout=self.send_timeout)
+            return True
+        except Exception as e:
+            await self._drop(user_id, connection, type(e).__name__)
+            return False
+
+    async def _drop(self, user_id: str, connection: _Connection, reason: str):
+        logger.info(f"Dropping WebSocket for user {user_id}: {reason}")
+        self.dropped_connections += 1
+        self.disconnect(user_id, connection)
+        try:
+            await connection.websocket.close()
+        except Exception:
+            pass
+
+    async def _heartbeat(self):
+        ping = json.dumps({"type": "ping", "message": "Connection alive"})
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            # Half-open connections never fail a send; drop the ones gone quiet
+            idle_before = time.monotonic() - self.idle_timeout
+            sends = []
+            for user_id, sockets in list(self.connections.items()):
+                for connection in list(sockets):
+                    if connection.last_seen < idle_before:
+                        sends.append(self._drop(user_id, connection, "idle"))
+                    else:
+                        sends.append(self._send_text(user_id, connection, ping))
+            if sends:
+                await asyncio.gather(*sends)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "broker": type(self.broker).__name__ if self.broker else None,
+            "users": len(self.connections),
+            "sockets": sum(len(sockets) for sockets in self.connections.values()),
+            "delivered": self.delivered,
+            "messages_sent": self.messages_sent,
+            "coalesced": self.coalesced,
+            "dropped_connections": self.dropped_connections
+        }
+
+
+# Global hub; server.py attaches the broker on startup
+notification_hub = NotificationHub()
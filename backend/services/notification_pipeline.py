@@ -0,0 +1,378 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
+from models_notifications import Notification
+from services.cache_service import CacheService
+from services.cache_invalidation import cache_invalidation_bus
+from services.notification_counters import notification_counters
+from services.notification_hub import notification_hub
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+EMAIL_PREFERENCE_KEYS = {
+    "new_conversation": "email_new_conversation",
+    "high_priority_message": "email_high_priority",
+    "performance_alert": "email_performance_alert",
+    "usage_warning": "email_usage_warning",
+}
+
+PUSH_PREFERENCE_KEYS = {
+    "new_conversation": "push_new_conversation",
+    "high_priority_message": "push_high_priority",
+    "performance_alert": "push_performance_alert",
+    "usage_warning": "push_usage_warning",
+}
+
+
+def should_send_email(notification_type: str, prefs: Optional[Dict]) -> bool:
+    """Check if email should be sent for this notification type"""
+    if not prefs or not prefs.get("email_enabled"):
+        return False
+    pref_key = EMAIL_PREFERENCE_KEYS.get(notification_type)
+    return prefs.get(pref_key, True) if pref_key else False
+
+
+def should_send_push(notification_type: str, prefs: Optional[Dict]) -> bool:
+    """Check if push should be sent for this notification type"""
+    if not prefs or not prefs.get("push_enabled"):
+        return False
+    pref_key = PUSH_PREFERENCE_KEYS.get(notification_type)
+    return prefs.get(pref_key, True) if pref_key else False
+
+
+async def deliver_email(email: str, notification: Notification):
+    """Send email notification (TEST MODE - Just log)"""
+    email_content = {
+        "to": email,
+        "subject": f"[BotSmith] {notification.title}",
+        "body": notification.message,
+        "priority": notification.priority
+    }
+
+    # TEST MODE: Just log the email instead of sending
+    logger.info("📧 EMAIL NOTIFICATION (TEST MODE):")
+    logger.info(f"   To: {email_content['to']}")
+    logger.info(f"   Subject: {email_content['subject']}")
+    logger.info(f"   Body: {email_content['body']}")
+    logger.info(f"   Priority: {email_content['priority']}")
+
+
+async def deliver_push(subscriptions: List[Dict], notification: Notification):
+    """Send browser push notification"""
+    # In production, you would use web-push library here
+    # For now, we'll log it
+    logger.info("🔔 PUSH NOTIFICATION:")
+    logger.info(f"   User: {notification.user_id}")
+    logger.info(f"   Title: {notification.title}")
+    logger.info(f"   Message: {notification.message}")
+    logger.info(f"   Subscriptions: {len(subscriptions)}")
+
+
+class NotificationPipeline:
+    """
+    Queue that turns notification bursts into a few batched round trips.
+
+    submit() only enqueues. A background worker drains the queue in batches
+    of up to batch_size (waiting at most flush_interval_seconds for a batch
+    to fill) and for each batch:
+
+    1. inserts all notifications with one insert_many and bumps the unread
+       counters of their users with one bulk_write; documents rejected by
+       the insert are logged and left out, the rest go on. If the insert
+       fails as a whole it is retried with backoff, and after max_attempts
+       the batch goes back on the queue
+    2. pushes them to open sockets through the notification hub
+    3. loads missing preferences, user emails and push subscriptions with
+       one query each (preferences are cached per user)
+    4. runs the email/push senders concurrently, at most
+       channel_concurrency at a time, retrying failures with backoff
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        flush_interval_seconds: float = 0.05,
+        max_queue: int = 10000,
+        channel_concurrency: int = 10,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 0.5,
+        preferences_ttl_seconds: int = 300
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_seconds
+        self.max_queue = max_queue
+        self.channel_concurrency = channel_concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff_seconds
+        self.preferences_ttl = preferences_ttl_seconds
+        self.preferences_cache = CacheService(
+            default_ttl_seconds=preferences_ttl_seconds,
+            max_entries=50000,
+            max_bytes=16 * 1024 * 1024
+        )
+        cache_invalidation_bus.register_cache(self.preferences_cache)
+        self.db: Optional[AsyncIOMotorDatabase] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._senders: Optional[asyncio.Semaphore] = None
+        self._channel_tasks: set = set()
+        self.submitted = 0
+        self.inserted = 0
+        self.batches = 0
+        self.requeued = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.channel_sent = 0
+        self.channel_failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Start the background worker"""
+        if self.running:
+            return
+        self.db = db
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._senders = asyncio.Semaphore(self.channel_concurrency)
+        self._worker = asyncio.create_task(self._run())
+        logger.info("Notification pipeline started")
+
+    async def stop(self):
+        """Flush whatever is queued, wait for channel sends and stop"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            batch = remaining[start:start + self.batch_size]
+            try:
+                await self._process(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"Dropped {len(batch)} queued notifications on shutdown: {str(e)}")
+        if self._channel_tasks:
+            await asyncio.gather(*self._channel_tasks, return_exceptions=True)
+
+    async def submit(self, db: AsyncIOMotorDatabase, doc: Dict[str, Any]):
+        """
+        Queue a notification document (with its _id already assigned)
+
+        Waits only if the queue is full. When the pipeline is not running
+        (scripts, tests) the document is processed inline against db.
+        """
+        self.submitted += 1
+        if not self.running:
+            if self.db is None:
+                self.db = db
+            await self._process([doc])
+            return
+        await self._queue.put(doc)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._process(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Notification batch of {len(batch)} failed: {str(e)}")
+
+    async def _store(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch, retrying failures of the whole insert; returns the documents stored"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.db.notifications.insert_many(docs, ordered=False)
+                return docs
+            except BulkWriteError as e:
+                # ordered=False: everything not listed in writeErrors was inserted
+                rejected = {}
+                for error in e.details.get("writeErrors", []):
+                    if error.get("code") == DUPLICATE_KEY:
+                        # Stored by an earlier attempt that failed afterwards
+                        continue
+                    rejected[error["index"]] = error
+                if rejected:
+                    self.rejected += len(rejected)
+                    first = next(iter(rejected.values()))
+                    logger.error(f"{len(rejected)} notifications could not be stored: {first.get('errmsg')}")
+                return [doc for index, doc in enumerate(docs) if index not in rejected]
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning(f"Storing {len(docs)} notifications failed (attempt {attempt}): {str(e)}")
+                await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    def _requeue(self, docs: List[Dict[str, Any]]):
+        for index, doc in enumerate(docs):
+            try:
+                self._queue.put_nowait(doc)
+            except asyncio.QueueFull:
+                self.dropped += len(docs) - index
+                logger.error(f"Notification queue full, dropped {len(docs) - index} notifications")
+                return
+            self.requeued += 1
+
+    async def _process(self, docs: List[Dict[str, Any]]):
+        if not docs:
+            return
+        try:
+            docs = await self._store(docs)
+        except Exception as e:
+            if not self.running:
+                raise
+            logger.error(f"Storing {len(docs)} notifications failed, queued again: {str(e)}")
+            self._requeue(docs)
+            return
+        if not docs:
+            return
+        self.inserted += len(docs)
+        self.batches += 1
+
+        unread: Dict[str, int] = {}
+        for doc in docs:
+            unread[doc["user_id"]] = unread.get(doc["user_id"], 0) + (0 if doc.get("read") else 1)
+        try:
+            await notification_counters.increment(self.db, unread)
+        except Exception as e:
+            logger.warning(f"Failed to update unread counters: {str(e)}")
+        await self.dispatch([Notification(**{**doc, "id": str(doc["_id"])}) for doc in docs])
+
+    async def dispatch(self, notifications: List[Notification]):
+        """
+        Push already-stored notifications to open sockets and queue their
+        email/push sends (one lookup per kind for the whole list)
+        """
+        if not notifications:
+            return
+        for notification in notifications:
+            try:
+                await notification_hub.publish(notification.user_id, notification.model_dump(mode="json"))
+            except Exception as e:
+                logger.warning(f"Failed to push notification to {notification.user_id}: {str(e)}")
+
+        user_ids = {n.user_id for n in notifications}
+        prefs = await self.get_preferences_many(user_ids)
+
+        email_targets = [n for n in notifications if should_send_email(n.type, prefs.get(n.user_id))]
+        push_targets = [n for n in notifications if should_send_push(n.type, prefs.get(n.user_id))]
+
+        emails: Dict[str, str] = {}
+        if email_targets:
+            cursor = self.db.users.find(
+                {"id": {"$in": list({n.user_id for n in email_targets})}},
+                {"_id": 0, "id": 1, "email": 1}
+            )
+            async for user in cursor:
+                emails[user["id"]] = user.get("email")
+
+        subscriptions: Dict[str, List[Dict]] = {}
+        if push_targets:
+            cursor = self.db.push_subscriptions.find(
+                {"user_id": {"$in": list({n.user_id for n in push_targets})}},
+                {"_id": 0}
+            )
+            async for subscription in cursor:
+                subscriptions.setdefault(subscription["user_id"], []).append(subscription)
+
+        for notification in email_targets:
+            email = emails.get(notification.user_id)
+            if email:
+                self._spawn_send("email", deliver_email, email, notification)
+        for notification in push_targets:
+            user_subscriptions = subscriptions.get(notification.user_id)
+            if not user_subscriptions:
+                logger.info(f"No push subscriptions found for user {notification.user_id}")
+                continue
+            self._spawn_send("push", deliver_push, user_subscriptions, notification)
+
+    def _spawn_send(self, channel: str, sender: Callable[..., Awaitable[None]], *args):
+        task = asyncio.create_task(self._send_with_retry(channel, sender, *args))
+        self._channel_tasks.add(task)
+        task.add_done_callback(self._channel_tasks.discard)
+
+    async def _send_with_retry(self, channel: str, sender: Callable[..., Awaitable[None]], *args):
+        semaphore = self._senders or asyncio.Semaphore(self.channel_concurrency)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with semaphore:
+                    await sender(*args)
+                self.channel_sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.channel_failed += 1
+                    logger.error(f"{channel} notification failed after {attempt} attempts: {str(e)}")
+                    return
+                await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+
+    async def get_preferences_many(self, user_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Notification preferences by user id ({} for users without any)"""
+        result: Dict[str, Dict] = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self.preferences_cache.get(f"prefs:{user_id}")
+            if cached is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = cached
+
+        if missing:
+            found = {}
+            async for prefs in self.db.notification_preferences.find({"user_id": {"$in": missing}}, {"_id": 0}):
+                found[prefs["user_id"]] = prefs
+            for user_id in missing:
+                prefs = found.get(user_id, {})
+                self.preferences_cache.set(
+                    f"prefs:{user_id}",
+                    prefs,
+                    namespaces=[f"notification_prefs:{user_id}"]
+                )
+                result[user_id] = prefs
+        return result
+
+    async def invalidate_preferences(self, user_id: str):
+        """Drop cached preferences of a user on every worker"""
+        await cache_invalidation_bus.publish([f"notification_prefs:{user_id}"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "inserted": self.inserted,
+            "batches": self.batches,
+            "requeued": self.requeued,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "channel_sends_in_flight": len(self._channel_tasks),
+            "channel_sent": self.channel_sent,
+            "channel_failed": self.channel_failed
+        }
+
+
+# Global pipeline; server.py starts it with the database on startup
+notification_pipeline = NotificationPipeline()
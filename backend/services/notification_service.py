@@ -1,13 +1,47 @@
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
 from models_notifications import Notification, NotificationCreate, NotificationPreferences
+from services.notification_pipeline import (
+    notification_pipeline,
+    should_send_email,
+    should_send_push,
+    deliver_email,
+    deliver_push
+)
+from services.notification_digest import notification_digester
+from services.notification_counters import notification_counters
+import base64
 import json
 
 logger = logging.getLogger(__name__)
 
 
+def encode_cursor(notification: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing just after this notification"""
+    created_at = notification["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = f"{created_at}|{notification['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, notification_id = raw.rsplit("|", 1)
+        created_at = datetime.fromisoformat(created_at)
+        # Stored datetimes come back naive (UTC) from MongoDB
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return created_at, ObjectId(notification_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 class NotificationService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
@@ -25,9 +59,18 @@ class NotificationService:
         metadata: Dict[str, Any] = None,
         action_url: Optional[str] = None
     ) -> Notification:
-        """Create a new notification and trigger all enabled notification channels"""
+        """
+        Create a new notification and trigger all enabled notification channels
+
+        The notification is queued on the notification pipeline, which
+        inserts it, pushes it to open sockets and runs the email/push
+        channels in batches; this returns as soon as it is queued. Repeats
+        of the same notification within its type's digest window are folded
+        into the open digest instead, which is returned.
+        """
         
         notification_data = {
+            "_id": ObjectId(),
             "user_id": user_id,
             "type": notification_type,
             "title": title,
@@ -39,69 +82,32 @@ class NotificationService:
             "created_at": datetime.now(timezone.utc),
             "read_at": None
         }
+        digest = notification_digester.absorb(notification_data)
+        if digest is not None:
+            return digest
+
+        notification = Notification(**notification_data, id=str(notification_data["_id"]))
         
-        # Insert notification into database
-        result = await self.notifications.insert_one(notification_data)
-        notification_data["id"] = str(result.inserted_id)
-        
-        notification = Notification(**notification_data)
-        
-        # Get user preferences
-        prefs = await self.get_user_preferences(user_id)
-        
-        # Send email notification if enabled
-        if prefs and prefs.get("email_enabled") and self._should_send_email(notification_type, prefs):
-            await self.send_email_notification(user_id, notification)
-        
-        # Send push notification if enabled
-        if prefs and prefs.get("push_enabled") and self._should_send_push(notification_type, prefs):
-            await self.send_push_notification(user_id, notification)
+        await notification_pipeline.submit(self.db, notification_data)
         
         logger.info(f"Created notification: {title} for user {user_id}")
         return notification
     
     def _should_send_email(self, notification_type: str, prefs: Dict) -> bool:
         """Check if email should be sent for this notification type"""
-        type_mapping = {
-            "new_conversation": "email_new_conversation",
-            "high_priority_message": "email_high_priority",
-            "performance_alert": "email_performance_alert",
-            "usage_warning": "email_usage_warning",
-        }
-        pref_key = type_mapping.get(notification_type)
-        return prefs.get(pref_key, True) if pref_key else False
+        return should_send_email(notification_type, prefs)
     
     def _should_send_push(self, notification_type: str, prefs: Dict) -> bool:
         """Check if push should be sent for this notification type"""
-        type_mapping = {
-            "new_conversation": "push_new_conversation",
-            "high_priority_message": "push_high_priority",
-            "performance_alert": "push_performance_alert",
-            "usage_warning": "push_usage_warning",
-        }
-        pref_key = type_mapping.get(notification_type)
-        return prefs.get(pref_key, True) if pref_key else False
+        return should_send_push(notification_type, prefs)
     
     async def send_email_notification(self, user_id: str, notification: Notification):
         """Send email notification (TEST MODE - Just log)"""
         # Get user email
-        user = await self.db.users.find_one({"id": user_id})
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "email": 1})
         if not user:
             return
-        
-        email_content = {
-            "to": user.get("email"),
-            "subject": f"[BotSmith] {notification.title}",
-            "body": notification.message,
-            "priority": notification.priority
-        }
-        
-        # TEST MODE: Just log the email instead of sending
-        logger.info(f"📧 EMAIL NOTIFICATION (TEST MODE):")
-        logger.info(f"   To: {email_content['to']}")
-        logger.info(f"   Subject: {email_content['subject']}")
-        logger.info(f"   Body: {email_content['body']}")
-        logger.info(f"   Priority: {email_content['priority']}")
+        await deliver_email(user.get("email"), notification)
     
     async def send_push_notification(self, user_id: str, notification: Notification):
         """Send browser push notification"""
@@ -112,28 +118,36 @@ class NotificationService:
             logger.info(f"No push subscriptions found for user {user_id}")
             return
         
-        # In production, you would use web-push library here
-        # For now, we'll log it
-        logger.info(f"🔔 PUSH NOTIFICATION:")
-        logger.info(f"   User: {user_id}")
-        logger.info(f"   Title: {notification.title}")
-        logger.info(f"   Message: {notification.message}")
-        logger.info(f"   Subscriptions: {len(subscriptions)}")
+        await deliver_push(subscriptions, notification)
     
     async def get_user_notifications(
         self,
         user_id: str,
         limit: int = 50,
         skip: int = 0,
-        unread_only: bool = False
+        unread_only: bool = False,
+        before: Optional[str] = None
     ) -> List[Dict]:
-        """Get notifications for a user"""
-        query = {"user_id": user_id}
+        """
+        Get notifications for a user, newest first
+
+        Args:
+            before: Cursor from a previous page (see encode_cursor); when
+                given, skip is ignored and the page starts right after it
+        """
+        query: Dict[str, Any] = {"user_id": user_id}
         if unread_only:
             query["read"] = False
+        if before:
+            created_at, last_id = decode_cursor(before)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}}
+            ]
+            skip = 0
         
         notifications = await self.notifications.find(query).sort(
-            "created_at", -1
+            [("created_at", -1), ("_id", -1)]
         ).skip(skip).limit(limit).to_list(None)
         
         # Convert MongoDB _id to id for each notification
@@ -144,42 +158,38 @@ class NotificationService:
         
         return notifications
     
+    async def get_unread_state(self, user_id: str) -> Dict[str, int]:
+        """Unread count and change version of the user's notifications"""
+        return await notification_counters.get(self.db, user_id)
+    
     async def get_unread_count(self, user_id: str) -> int:
         """Get count of unread notifications"""
-        count = await self.notifications.count_documents({
-            "user_id": user_id,
-            "read": False
-        })
-        return count
+        state = await self.get_unread_state(user_id)
+        return state["unread"]
     
-    async def mark_as_read(self, notification_id: str, user_id: str) -> bool:
-        """Mark notification as read"""
-        from bson import ObjectId
-        
-        # Try updating by _id (MongoDB's native field)
+    def _id_filter(self, notification_id: str, user_id: str) -> Dict[str, Any]:
+        # Match by _id (MongoDB's native field), falling back to the id field
         try:
-            result = await self.notifications.update_one(
-                {"_id": ObjectId(notification_id), "user_id": user_id},
-                {
-                    "$set": {
-                        "read": True,
-                        "read_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            return result.modified_count > 0
+            return {"_id": ObjectId(notification_id), "user_id": user_id}
         except Exception:
-            # Fallback to id field if ObjectId conversion fails
-            result = await self.notifications.update_one(
-                {"id": notification_id, "user_id": user_id},
-                {
-                    "$set": {
-                        "read": True,
-                        "read_at": datetime.now(timezone.utc)
-                    }
+            return {"id": notification_id, "user_id": user_id}
+    
+    async def mark_as_read(self, notification_id: str, user_id: str) -> bool:
+        """Mark notification as read"""
+        previous = await self.notifications.find_one_and_update(
+            self._id_filter(notification_id, user_id),
+            {
+                "$set": {
+                    "read": True,
+                    "read_at": datetime.now(timezone.utc)
                 }
-            )
-            return result.modified_count > 0
+            },
+            projection={"read": 1}
+        )
+        if previous is None:
+            return False
+        await notification_counters.increment(self.db, {user_id: 0 if previous.get("read") else -1})
+        return True
     
     async def mark_all_as_read(self, user_id: str) -> int:
         """Mark all notifications as read for a user"""
@@ -192,26 +202,20 @@ class NotificationService:
                 }
             }
         )
+        # Only what this update changed: newer notifications stay unread
+        await notification_counters.increment(self.db, {user_id: -result.modified_count})
         return result.modified_count
     
     async def delete_notification(self, notification_id: str, user_id: str) -> bool:
         """Delete a notification"""
-        from bson import ObjectId
-        
-        # Try deleting by _id (MongoDB's native field)
-        try:
-            result = await self.notifications.delete_one({
-                "_id": ObjectId(notification_id),
-                "user_id": user_id
-            })
-            return result.deleted_count > 0
-        except Exception:
-            # Fallback to id field if ObjectId conversion fails
-            result = await self.notifications.delete_one({
-                "id": notification_id,
-                "user_id": user_id
-            })
-            return result.deleted_count > 0
+        deleted = await self.notifications.find_one_and_delete(
+            self._id_filter(notification_id, user_id),
+            projection={"read": 1}
+        )
+        if deleted is None:
+            return False
+        await notification_counters.increment(self.db, {user_id: 0 if deleted.get("read") else -1})
+        return True
     
     async def get_user_preferences(self, user_id: str) -> Optional[Dict]:
         """Get notification preferences for a user"""
@@ -244,6 +248,7 @@ class NotificationService:
             preferences["created_at"] = datetime.now(timezone.utc)
             await self.preferences.insert_one(preferences)
         
+        await notification_pipeline.invalidate_preferences(user_id)
         return await self.get_user_preferences(user_id)
     
     async def save_push_subscription(
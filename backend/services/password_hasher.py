@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+
+# Cost and pool settings are read at import, possibly before server.py loads .env
+load_dotenv(Path(__file__).parent.parent / '.env')
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hashing jobs are already waiting"""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a bounded thread pool.
+
+    A bcrypt call takes tens to hundreds of milliseconds of CPU; run inline
+    it stalls every other request on the worker. The bcrypt C extension
+    releases the GIL, so a small thread pool runs hashes in parallel with
+    the event loop. Jobs beyond max_pending are refused straight away with
+    PasswordHasherBusy instead of queueing up behind a login burst.
+    """
+
+    def __init__(
+        self,
+        rounds: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None
+    ):
+        """
+        Args:
+            rounds: bcrypt cost factor for new hashes (passlib default if None).
+                Existing hashes with a different cost are upgraded on login
+                through verify_and_update().
+            max_workers: Hashing threads (defaults to min(4, CPU count))
+            max_pending: Jobs allowed running or queued before refusing more
+        """
+        settings = {"bcrypt__rounds": rounds} if rounds else {}
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", **settings)
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 8
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="password-hasher"
+            )
+        return self._executor
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Password hasher saturated ({self._pending} jobs pending), refusing request")
+            raise PasswordHasherBusy(f"{self._pending} password hashing jobs already pending")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password off the event loop."""
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """Verify a password off the event loop."""
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and rehash it if its cost settings are outdated
+
+        Returns:
+            (valid, new_hash) where new_hash is None unless the stored hash
+            should be replaced
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        """Stop the hashing threads (pending jobs are finished first)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed
+        }
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Global hasher (BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+password_hasher = PasswordHasher(
+    rounds=_int_env('BCRYPT_ROUNDS'),
+    max_workers=_int_env('PASSWORD_HASH_WORKERS'),
+    max_pending=_int_env('PASSWORD_HASH_MAX_PENDING')
+)
@@ -1,23 +1,30 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
+from pymongo import UpdateOne
 from typing import Optional, List
 from datetime import datetime, timedelta
 from models import Plan, PlanLimits
-import os
 
 class PlanService:
     """Service for managing plans and subscriptions"""
     
     def __init__(self):
-        mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-        db_name = os.environ.get('DB_NAME', 'chatbase_db')
-        self.client = AsyncIOMotorClient(mongo_url)
-        self.db = self.client[db_name]
+        self.db = get_database()
         self.plans_collection = self.db.plans
         self.subscriptions_collection = self.db.subscriptions
         self.users_collection = self.db.users
         
-    async def initialize_plans(self):
-        """Initialize default plans in database"""
+    async def initialize_plans(self) -> int:
+        """
+        Bring the default plans in the database up to date
+
+        Idempotent: plans whose stored definition already matches are left
+        alone (keeping their _id and created_at), changed or missing ones are
+        upserted and plans that are no longer defined are removed. A boot
+        with nothing to change costs one find.
+
+        Returns:
+            Number of plans written or removed
+        """
         plans_data = [
             {
                 "id": "free",
@@ -152,10 +159,30 @@ class PlanService:
             }
         ]
         
-        # Clear existing plans and insert new ones
-        await self.plans_collection.delete_many({})
-        await self.plans_collection.insert_many(plans_data)
-        print("✅ Plans initialized successfully")
+        existing = {
+            plan["id"]: plan
+            async for plan in self.plans_collection.find({}, {"_id": 0})
+        }
+        operations = []
+        for plan in plans_data:
+            created_at = plan.pop("created_at")
+            stored = existing.get(plan["id"])
+            if stored is not None and all(stored.get(key) == value for key, value in plan.items()):
+                continue
+            operations.append(UpdateOne(
+                {"id": plan["id"]},
+                {"$set": plan, "$setOnInsert": {"created_at": created_at}},
+                upsert=True
+            ))
+        
+        if operations:
+            await self.plans_collection.bulk_write(operations, ordered=False)
+        defined_ids = [plan["id"] for plan in plans_data]
+        removed = 0
+        if set(existing) - set(defined_ids):
+            result = await self.plans_collection.delete_many({"id": {"$nin": defined_ids}})
+            removed = result.deleted_count
+        return len(operations) + removed
     
     async def get_all_plans(self) -> List[dict]:
         """Get all active plans"""
@@ -0,0 +1,428 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import numpy as np
+from datetime import datetime, timedelta
+from services.leased_job import LeasedJob, utcnow
+from services.top_questions import STOPWORDS, SpaceSaving, normalize_question
+import asyncio
+import logging
+import math
+import random
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Async callable turning texts into embedding vectors, e.g.
+# EmbeddingService().generate_embeddings_batch
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+# Hashed TF-IDF dimensions; a chunk of 500 questions is 16 MB of float32
+N_FEATURES = 2 ** 13
+
+# Chunks retrieved per question, as the chat endpoints do
+RETRIEVAL_TOP_K = 2
+RETRIEVAL_MIN_SIMILARITY = 0.5
+
+# Clusters whose representative questions find less than this share of
+# their words in the retrieved chunks, on average, are flagged as knowledge
+# gaps (a two-word question with one word found scores 0.5)
+LOW_COVERAGE_THRESHOLD = 0.6
+
+# Fewer questions than this are not worth clustering
+MIN_QUESTIONS = 20
+
+
+def tokenize(question: str) -> List[str]:
+    """Meaningful words of a normalized question"""
+    return [word for word in question.split() if len(word) > 1 and word not in STOPWORDS]
+
+
+def _stem(word: str) -> str:
+    # Same plural folding as question_signature
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def keyword_coverage(question: str, texts: List[str]) -> float:
+    """
+    Share of a question's meaningful words found in the best of the texts
+
+    Unlike VectorStore.search's similarity, which is relative to the top
+    hit of each query (so any hit scores 1.0), this is comparable across
+    questions: 0 when nothing relevant was retrieved, 1 when one chunk
+    contains every word of the question.
+    """
+    terms = {_stem(term) for term in tokenize(question)}
+    if not terms:
+        return 0.0
+    best = 0
+    for text in texts:
+        words = {_stem(word) for word in normalize_question(text).split()}
+        best = max(best, len(terms & words))
+    return best / len(terms)
+
+
+def _normalize_rows(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    np.divide(X, norms, out=X, where=norms > 0)
+    return X
+
+
+class HashingTfidf:
+    """
+    TF-IDF over hashed terms.
+
+    Terms are hashed (crc32, stable across processes) into a fixed number
+    of columns, so there is no vocabulary to hold and document frequencies
+    can be counted chunk by chunk. One term per column is remembered to
+    label clusters.
+    """
+
+    def __init__(self, n_features: int = N_FEATURES):
+        self.n_features = n_features
+        self.df = np.zeros(n_features, dtype=np.float64)
+        self.docs = 0
+        self.terms: Dict[int, str] = {}
+        self.idf: Optional[np.ndarray] = None
+
+    def _column(self, term: str) -> int:
+        return zlib.crc32(term.encode("utf-8")) % self.n_features
+
+    def observe(self, questions: List[str]):
+        """Count document frequencies of a chunk of questions"""
+        columns = []
+        for question in questions:
+            seen = set()
+            for term in tokenize(question):
+                column = self._column(term)
+                if column not in seen:
+                    seen.add(column)
+                    self.terms.setdefault(column, term)
+            columns.extend(seen)
+        np.add.at(self.df, np.asarray(columns, dtype=np.int64), 1)
+        self.docs += len(questions)
+
+    def finalize(self):
+        self.idf = (np.log((1 + self.docs) / (1 + self.df)) + 1).astype(np.float32)
+
+    def transform(self, questions: List[str]) -> np.ndarray:
+        """L2-normalized TF-IDF rows (all zero for questions with no terms)"""
+        rows, columns = [], []
+        for row, question in enumerate(questions):
+            for term in tokenize(question):
+                rows.append(row)
+                columns.append(self._column(term))
+        X = np.zeros((len(questions), self.n_features), dtype=np.float32)
+        np.add.at(X, (np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)), 1)
+        np.log1p(X, out=X)
+        X *= self.idf
+        return _normalize_rows(X)
+
+    def label(self, centroid: np.ndarray, count: int = 5) -> List[str]:
+        top = np.argsort(centroid)[::-1][:count]
+        return [self.terms[column] for column in top if centroid[column] > 0 and column in self.terms]
+
+
+class MiniBatchKMeans:
+    """
+    Spherical mini-batch k-means (Sculley, 2010).
+
+    Centers are seeded with k-means++ on a sample and then moved by each
+    mini-batch with a per-center learning rate of 1 / points seen, which
+    is a running mean of the points assigned to it. Assignment is by cosine
+    similarity, so rows are expected to be L2-normalized.
+    """
+
+    def __init__(self, k: int, seed: int = 0):
+        self.k = k
+        self.seed = seed
+        self.centers: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+
+    def init(self, sample: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        sample = sample[np.linalg.norm(sample, axis=1) > 0]
+        self.k = min(self.k, len(sample))
+        if not self.k:
+            return
+        chosen = [int(rng.integers(len(sample)))]
+        distance = 1 - sample @ sample[chosen[0]]
+        for _ in range(1, self.k):
+            weights = np.clip(distance, 0, None).astype(np.float64) ** 2
+            if weights.sum() <= 0:
+                break
+            chosen.append(int(rng.choice(len(sample), p=weights / weights.sum())))
+            distance = np.minimum(distance, 1 - sample @ sample[chosen[-1]])
+        self.k = len(chosen)
+        self.centers = sample[chosen].astype(np.float64)
+        self.counts = np.zeros(self.k, dtype=np.int64)
+
+    def assign(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Closest center and its cosine similarity per row"""
+        centers = _normalize_rows(self.centers.copy()).astype(np.float32)
+        similarities = X @ centers.T
+        labels = similarities.argmax(axis=1)
+        return labels, similarities[np.arange(len(X)), labels]
+
+    def partial_fit(self, X: np.ndarray):
+        X = X[np.linalg.norm(X, axis=1) > 0]
+        if not len(X):
+            return
+        labels, _ = self.assign(X)
+        for center in np.unique(labels):
+            points = X[labels == center]
+            self.counts[center] += len(points)
+            self.centers[center] += (points.sum(axis=0) - len(points) * self.centers[center]) / self.counts[center]
+
+
+class QuestionClusteringService(LeasedJob):
+    """
+    Clusters the questions asked to each chatbot into themes and flags
+    the ones the knowledge base does not cover.
+
+    For every chatbot with new user messages, a leased background job
+    streams the questions of the lookback window from MongoDB in chunks:
+    one pass counts TF-IDF document frequencies (skipped with an injected
+    embedder) and keeps a reservoir sample to seed k-means++, `epochs`
+    passes run mini-batch k-means, and a last pass assigns every question
+    and keeps the most asked ones per cluster. Memory is bounded by the
+    chunk size and the sample, not by the number of messages.
+
+    The most asked questions of each cluster are then run through the
+    chatbot's retrieval (VectorStore.search, as the chat does). Each one
+    scores the share of its words found in the best chunk it retrieved
+    (see keyword_coverage), and their mean is the cluster's coverage.
+    Results go to
+    `question_clusters` (one document per chatbot) for the dashboard.
+    """
+
+    CLUSTERS = "question_clusters"
+    STATE = "question_clusters_state"
+    STATE_ID = "clustering"
+    NAME = "Question clustering"
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        retriever: Optional[Callable[..., Awaitable[List[Dict]]]] = None,
+        max_clusters: int = 20,
+        lookback_days: int = 90,
+        chunk_size: int = 500,
+        sample_size: int = 1000,
+        epochs: int = 2,
+        probes_per_cluster: int = 3,
+        interval_seconds: float = 6 * 3600,
+        lease_seconds: int = 3600
+    ):
+        """
+        Args:
+            embedder: Embeds question texts instead of hashed TF-IDF
+            retriever: Knowledge base search with VectorStore.search's
+                signature (default: the shared RAG service's vector store)
+            max_clusters: Upper bound of clusters per chatbot
+            lookback_days: Questions older than this are not clustered
+            chunk_size: Questions vectorized at a time
+            sample_size: Questions sampled to seed the clusters
+            epochs: Mini-batch passes over the questions
+            probes_per_cluster: Questions per cluster checked against retrieval
+            interval_seconds: Pause between runs
+            lease_seconds: How long a worker may hold the job before another
+                one takes over
+        """
+        super().__init__(interval_seconds, lease_seconds)
+        self.embedder = embedder
+        self.retriever = retriever
+        self.max_clusters = max_clusters
+        self.lookback = timedelta(days=lookback_days)
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.epochs = epochs
+        self.probes_per_cluster = probes_per_cluster
+        self.runs = 0
+        self.chatbots_clustered = 0
+
+    async def run_once(self) -> int:
+        """
+        Re-cluster every chatbot that received questions since its last run
+
+        Returns:
+            Number of chatbots clustered (0 if another worker holds the job)
+        """
+        if await self._acquire_lease(utcnow()) is None:
+            return 0
+
+        generated = {}
+        async for doc in self.db[self.CLUSTERS].find({}, {"generated_at": 1}):
+            generated[doc["_id"]] = doc.get("generated_at")
+
+        clustered = 0
+        try:
+            async for chatbot in self.db.chatbots.find({}, {"_id": 0, "id": 1}):
+                chatbot_id = chatbot["id"]
+                since = generated.get(chatbot_id)
+                if since and not await self.db.messages.find_one(
+                    {"chatbot_id": chatbot_id, "timestamp": {"$gt": since}, "role": "user"},
+                    {"_id": 1}
+                ):
+                    continue
+                try:
+                    await self.cluster_chatbot(chatbot_id)
+                    clustered += 1
+                except Exception as e:
+                    logger.error(f"Failed to cluster questions of chatbot {chatbot_id}: {str(e)}")
+                if not await self._renew_lease():
+                    break
+        finally:
+            await self._release_lease()
+
+        self.runs += 1
+        self.chatbots_clustered += clustered
+        if clustered:
+            logger.info(f"Clustered the questions of {clustered} chatbots")
+        return clustered
+
+    async def _question_chunks(self, chatbot_id: str, since: datetime) -> AsyncIterator[List[str]]:
+        cursor = self.db.messages.find(
+            {"chatbot_id": chatbot_id, "timestamp": {"$gte": since}, "role": "user"},
+            {"_id": 0, "content": 1}
+        ).batch_size(self.chunk_size)
+        chunk = []
+        async for message in cursor:
+            question = normalize_question(message.get("content"))
+            if question:
+                chunk.append(question)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _vectorize(self, vectorizer: Optional[HashingTfidf], questions: List[str]) -> np.ndarray:
+        if vectorizer is not None:
+            return await asyncio.to_thread(vectorizer.transform, questions)
+        vectors = await self.embedder(questions)
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    async def _search(self, chatbot_id: str, question: str) -> List[Dict]:
+        if self.retriever is None:
+            from services.rag_service import get_rag_service
+            self.retriever = get_rag_service().vector_store.search
+        return await self.retriever(
+            chatbot_id=chatbot_id,
+            query=question,
+            top_k=RETRIEVAL_TOP_K,
+            min_similarity=RETRIEVAL_MIN_SIMILARITY
+        )
+
+    async def cluster_chatbot(self, chatbot_id: str) -> Dict[str, Any]:
+        """Cluster one chatbot's questions and store the result"""
+        started = utcnow()
+        since = started - self.lookback
+
+        # Pass 1: document frequencies and a reservoir sample to seed from
+        vectorizer = HashingTfidf() if self.embedder is None else None
+        rng = random.Random(chatbot_id)
+        sample: List[str] = []
+        total = 0
+        async for chunk in self._question_chunks(chatbot_id, since):
+            if vectorizer is not None:
+                await asyncio.to_thread(vectorizer.observe, chunk)
+            for question in chunk:
+                total += 1
+                if len(sample) < self.sample_size:
+                    sample.append(question)
+                else:
+                    slot = rng.randrange(total)
+                    if slot < self.sample_size:
+                        sample[slot] = question
+
+        result: Dict[str, Any] = {
+            "chatbot_id": chatbot_id,
+            "generated_at": started,
+            "period_start": since,
+            "questions": total,
+            "method": "tfidf" if vectorizer is not None else "embeddings",
+            "clusters": []
+        }
+        if total >= MIN_QUESTIONS:
+            if vectorizer is not None:
+                vectorizer.finalize()
+            k = min(self.max_clusters, max(2, int(math.sqrt(total / 2))))
+            model = MiniBatchKMeans(k, seed=zlib.crc32(chatbot_id.encode("utf-8")))
+            model.init(await self._vectorize(vectorizer, sample))
+            if model.k:
+                # Passes 2..epochs+1: mini-batch updates
+                for _ in range(self.epochs):
+                    async for chunk in self._question_chunks(chatbot_id, since):
+                        X = await self._vectorize(vectorizer, chunk)
+                        await asyncio.to_thread(model.partial_fit, X)
+                result["clusters"] = await self._describe(chatbot_id, since, model, vectorizer)
+
+        await self.db[self.CLUSTERS].replace_one({"_id": chatbot_id}, result, upsert=True)
+        return result
+
+    async def _describe(
+        self,
+        chatbot_id: str,
+        since: datetime,
+        model: MiniBatchKMeans,
+        vectorizer: Optional[HashingTfidf]
+    ) -> List[Dict[str, Any]]:
+        # Last pass: final assignment, cohesion and the most asked questions per cluster
+        sizes = np.zeros(model.k, dtype=np.int64)
+        similarity_sums = np.zeros(model.k, dtype=np.float64)
+        examples = [SpaceSaving(50) for _ in range(model.k)]
+        async for chunk in self._question_chunks(chatbot_id, since):
+            X = await self._vectorize(vectorizer, chunk)
+            valid = np.linalg.norm(X, axis=1) > 0
+            labels, similarities = await asyncio.to_thread(model.assign, X)
+            for question, label, similarity, ok in zip(chunk, labels, similarities, valid):
+                if ok:
+                    sizes[label] += 1
+                    similarity_sums[label] += similarity
+                    examples[label].add(question)
+
+        assigned = int(sizes.sum())
+        clusters = []
+        for center in np.argsort(sizes)[::-1]:
+            size = int(sizes[center])
+            if not size:
+                continue
+            top = examples[center].top(5)
+            probes = []
+            for question, _, _ in top[:self.probes_per_cluster]:
+                matches = await self._search(chatbot_id, question)
+                probes.append({
+                    "question": question,
+                    "matches": len(matches),
+                    "score": round(keyword_coverage(question, [match.get("text") or "" for match in matches]), 4)
+                })
+            coverage = sum(probe["score"] for probe in probes) / len(probes) if probes else 0.0
+            clusters.append({
+                "cluster": len(clusters),
+                "label": vectorizer.label(model.centers[center]) if vectorizer is not None else [],
+                "size": size,
+                "share": round(size / assigned * 100, 2),
+                "cohesion": round(float(similarity_sums[center] / size), 4),
+                "examples": [{"question": question, "count": count} for question, count, _ in top],
+                "coverage": round(coverage, 2),
+                "probes": probes,
+                "low_coverage": coverage < LOW_COVERAGE_THRESHOLD
+            })
+        return clusters
+
+    async def get_clusters(self, db: AsyncIOMotorDatabase, chatbot_id: str) -> Optional[Dict[str, Any]]:
+        """Latest stored clustering of a chatbot, or None before the first run"""
+        return await db[self.CLUSTERS].find_one({"_id": chatbot_id}, {"_id": 0})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "chatbots_clustered": self.chatbots_clustered
+        }
+
+
+# Global service; server.py starts the job with the database on startup
+question_clustering = QuestionClusteringService()
@@ -276,3 +276,14 @@ class RAGService:
         except Exception as e:
             logger.error(f"Error getting RAG stats: {str(e)}")
             return {"error": str(e)}
+
+
+_rag_service: Optional[RAGService] = None
+
+
+def get_rag_service() -> RAGService:
+    """Shared RAGService of this worker, created on first use"""
+    global _rag_service
+    if _rag_service is None:
+        _rag_service = RAGService()
+    return _rag_service
@@ -0,0 +1,418 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
+from datetime import datetime, timedelta
+from services.leased_job import LeasedJob, utcnow
+import asyncio
+import heapq
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Questions tracked per chatbot and day; anything that makes a top list of
+# up to 50 is far above the error bound at this size
+DEFAULT_CAPACITY = 500
+
+# Messages newer than this may still be in flight (the timestamp is set
+# before the insert), so the job leaves them to the next run
+SCAN_LAG = timedelta(seconds=5)
+
+# Words that do not change what is being asked; two questions with the same
+# remaining words are grouped as paraphrases
+STOPWORDS = frozenset(
+    "a an the i me my we our you your it its is are was were be been am do does did can could "
+    "would should will shall may might must to of in on at for from with about by and or "
+    "how what when where why which who whom please hi hello hey there this that these those "
+    "any some get have has had there here just".split()
+)
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    content = (text or "").strip().lower()
+    content = re.sub(r'[^\w\s]', '', content)
+    return re.sub(r'\s+', ' ', content).strip()
+
+
+def question_signature(question: str) -> str:
+    """Order-free key of the meaningful words, shared by simple paraphrases"""
+    words = set()
+    for word in question.split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return " ".join(sorted(words)) or question
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters summary (Metwally et al.).
+
+    Keeps at most `capacity` counters. A new item evicts the smallest
+    counter and inherits its count as overestimation error, so every
+    item's true count is between count - error and count, and any item
+    seen more than total / capacity times is guaranteed to be tracked.
+    Summaries of different days merge into one with the same guarantee.
+
+    The smallest counter is found with a min-heap of (count, item) entries.
+    Counts only grow, so an entry is current when it matches the item's
+    count; outdated entries are skipped when they surface and the heap is
+    rebuilt once they outnumber the counters.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.total = 0
+        # item -> [count, error]
+        self.counters: Dict[str, List[int]] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1):
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[item] = [count, 0]
+        else:
+            floor, victim = self._smallest()
+            del self.counters[victim]
+            heapq.heappop(self._heap)
+            counter = self.counters[item] = [floor + count, floor]
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(counter[0], item) for item, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def _smallest(self) -> Tuple[int, str]:
+        # Drop outdated entries until the top of the heap is current
+        while True:
+            count, item = self._heap[0]
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+            heapq.heappop(self._heap)
+
+    def _floor(self) -> int:
+        # Upper bound of the count of any item this summary does not track
+        if len(self.counters) < self.capacity:
+            return 0
+        return self._smallest()[0]
+
+    def merge(self, other: "SpaceSaving"):
+        """Fold another summary in, keeping the `capacity` largest counters"""
+        own_floor, other_floor = self._floor(), other._floor()
+        merged: Dict[str, List[int]] = {}
+        for item in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(item, [own_floor, own_floor])
+            other_count, other_error = other.counters.get(item, [other_floor, other_floor])
+            merged[item] = [count + other_count, error + other_error]
+        largest = heapq.nlargest(self.capacity, merged.items(), key=lambda entry: entry[1][0])
+        self.counters = dict(largest)
+        self.total += other.total
+        self._rebuild_heap()
+
+    def top(self, limit: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """
+        Tracked items as (item, guaranteed count, error), most frequent first
+
+        The guaranteed count (count - error) is how often the item was
+        certainly seen; its true count is at most guaranteed + error.
+        Merging many summaries adds up their floors as error, so ranking by
+        the upper bound would favour questions that merely got tracked late.
+        """
+        ranked = sorted(
+            self.counters.items(),
+            key=lambda entry: (entry[1][0] - entry[1][1], entry[1][0]),
+            reverse=True
+        )
+        return [(item, count - error, error) for item, (count, error) in ranked[:limit]]
+
+    @property
+    def exact(self) -> bool:
+        """
+        Whether every item seen is still tracked with its exact count
+
+        Once the summary is full, items may have been evicted, and the
+        number of counters is only a lower bound of the distinct items.
+        """
+        return len(self.counters) < self.capacity
+
+    def to_document(self) -> Dict[str, Any]:
+        # A list, since questions are not valid field names
+        return {
+            "total": self.total,
+            "items": [{"q": item, "count": count, "error": error} for item, (count, error) in self.counters.items()]
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any], capacity: int = DEFAULT_CAPACITY) -> "SpaceSaving":
+        summary = cls(capacity)
+        summary.total = doc.get("total", 0)
+        for entry in doc.get("items", []):
+            summary.counters[entry["q"]] = [entry["count"], entry.get("error", 0)]
+        summary._rebuild_heap()
+        return summary
+
+
+class TopQuestionsService(LeasedJob):
+    """
+    Incremental top questions per chatbot and day.
+
+    A background job tails new user messages from every channel by
+    timestamp (past `top_questions_state.scanned_to`) and folds their
+    normalized text into one Space-Saving summary per chatbot and UTC day
+    in `top_questions_daily`. A lease keeps one worker on the job, and a
+    `scanned_to` watermark on every summary makes rescans after a crash or
+    a lost lease idempotent (see _scan_range).
+
+    A top questions query merges one summary per day plus the few messages
+    newer than the last scan, instead of reading and counting every message
+    the chatbot ever received.
+    """
+
+    DAILY = "top_questions_daily"
+    STATE = "top_questions_state"
+    STATE_ID = "scanner"
+    NAME = "Top questions scan"
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        interval_seconds: float = 60.0,
+        chunk_hours: int = 24,
+        lease_seconds: int = 900
+    ):
+        """
+        Args:
+            capacity: Questions tracked per chatbot and day
+            interval_seconds: Pause between scans
+            chunk_hours: Hours of messages scanned per step during a catch-up
+            lease_seconds: How long a worker may hold the job before another
+                one takes over
+        """
+        super().__init__(interval_seconds, lease_seconds)
+        self.capacity = capacity
+        self.chunk = timedelta(hours=chunk_hours)
+        self.runs = 0
+        self.messages_scanned = 0
+
+    async def run_once(self) -> int:
+        """
+        Fold every user message since the last scan into the daily summaries
+
+        Returns:
+            Number of messages scanned (0 if another worker holds the job)
+        """
+        now = utcnow()
+        state = await self._acquire_lease(now)
+        if state is None:
+            return 0
+
+        target = now - SCAN_LAG
+        scanned_to = state.get("scanned_to") or await self._oldest_message(target)
+        scanned = 0
+        try:
+            while scanned_to < target:
+                chunk_end = min(target, scanned_to + self.chunk)
+                chunk_scanned = await self._scan_range(scanned_to, chunk_end)
+                if chunk_scanned is None or not await self._renew_lease({"scanned_to": chunk_end}):
+                    break
+                scanned += chunk_scanned
+                scanned_to = chunk_end
+        finally:
+            await self._release_lease()
+
+        self.runs += 1
+        self.messages_scanned += scanned
+        return scanned
+
+    async def _oldest_message(self, default: datetime) -> datetime:
+        doc = await self.db.messages.find_one(
+            {"timestamp": {"$type": "date"}},
+            {"_id": 0, "timestamp": 1},
+            sort=[("timestamp", 1)]
+        )
+        oldest = min(default, doc["timestamp"]) if doc else default
+        return oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _fold(self, messages: Iterable[Dict[str, Any]], summaries: Dict[Tuple[str, str], SpaceSaving]):
+        for message in messages:
+            question = normalize_question(message.get("content"))
+            if not question or not message.get("chatbot_id"):
+                continue
+            timestamp = message.get("timestamp")
+            key = (message["chatbot_id"], timestamp.strftime("%Y-%m-%d") if timestamp else "")
+            if key not in summaries:
+                summaries[key] = SpaceSaving(self.capacity)
+            summaries[key].add(question)
+
+    async def _scan_range(self, start: datetime, end: datetime) -> Optional[int]:
+        """
+        Fold the user messages of [start, end) into the daily summaries
+
+        Each daily document keeps a `scanned_to` watermark: it holds every
+        message of its chatbot and day older than that. A chunk that a
+        previous run already (partly) merged before losing its lease or
+        crashing is only folded from the watermark on, and documents are
+        replaced only if their watermark is still the one read, so a
+        rescan never counts a message twice and a stalled worker cannot
+        overwrite a newer summary.
+
+        Returns:
+            Messages scanned, or None if the lease was lost (nothing written)
+        """
+        summaries: Dict[Tuple[str, str], SpaceSaving] = {}
+        scanned = 0
+        cursor = self.db.messages.find(
+            {"timestamp": {"$gte": start, "$lt": end}, "role": "user"},
+            {"_id": 0, "chatbot_id": 1, "content": 1, "timestamp": 1}
+        )
+        batch = []
+        async for message in cursor:
+            batch.append(message)
+            if len(batch) >= 1000:
+                await asyncio.to_thread(self._fold, batch, summaries)
+                scanned += len(batch)
+                batch = []
+        await asyncio.to_thread(self._fold, batch, summaries)
+        scanned += len(batch)
+        if not summaries:
+            return scanned
+
+        # Merge into the stored summaries of the touched days
+        ids = [f"{chatbot_id}|{day}" for chatbot_id, day in summaries]
+        stored = {}
+        async for doc in self.db[self.DAILY].find({"_id": {"$in": ids}}):
+            stored[doc["_id"]] = doc
+
+        for key in list(summaries):
+            watermark = stored.get(f"{key[0]}|{key[1]}", {}).get("scanned_to")
+            if watermark is None or watermark <= start:
+                continue
+            if watermark >= end:
+                # Already merged by a run that stopped before moving scanned_to
+                del summaries[key]
+            else:
+                summaries[key] = await self._rescan(key, watermark, end)
+
+        if not summaries:
+            return scanned
+        operations = await asyncio.to_thread(self._merge_stored, summaries, stored, end)
+        if not await self._renew_lease():
+            return None
+        await self.db[self.DAILY].bulk_write(operations, ordered=False)
+        return scanned
+
+    async def _rescan(self, key: Tuple[str, str], since: datetime, end: datetime) -> SpaceSaving:
+        """Summary of one chatbot and day from `since` on (uses the (chatbot_id, timestamp) index)"""
+        cursor = self.db.messages.find(
+            {"chatbot_id": key[0], "timestamp": {"$gte": since, "$lt": end}, "role": "user"},
+            {"_id": 0, "chatbot_id": 1, "content": 1, "timestamp": 1}
+        )
+        summaries: Dict[Tuple[str, str], SpaceSaving] = {}
+        await asyncio.to_thread(self._fold, [message async for message in cursor], summaries)
+        return summaries.get(key, SpaceSaving(self.capacity))
+
+    def _merge_stored(
+        self,
+        summaries: Dict[Tuple[str, str], SpaceSaving],
+        stored: Dict[str, Dict[str, Any]],
+        end: datetime
+    ) -> List[ReplaceOne]:
+        operations = []
+        for (chatbot_id, day), summary in summaries.items():
+            doc_id = f"{chatbot_id}|{day}"
+            previous = stored.get(doc_id)
+            if previous is not None:
+                existing = SpaceSaving.from_document(previous, self.capacity)
+                existing.merge(summary)
+                summary = existing
+            # Only replaces the version read; a document written in between
+            # fails the filter, and the upsert then fails on the duplicate _id
+            operations.append(ReplaceOne(
+                {"_id": doc_id, "scanned_to": previous.get("scanned_to") if previous else None},
+                {"chatbot_id": chatbot_id, "day": day, "scanned_to": end, **summary.to_document()},
+                upsert=True
+            ))
+        return operations
+
+    def _merge_all(self, docs: List[Dict[str, Any]], live: Iterable[SpaceSaving]) -> SpaceSaving:
+        summary = SpaceSaving(self.capacity)
+        for doc in docs:
+            summary.merge(SpaceSaving.from_document(doc, self.capacity))
+        for day_summary in live:
+            summary.merge(day_summary)
+        return summary
+
+    async def get_summary(
+        self,
+        db: AsyncIOMotorDatabase,
+        chatbot_id: str,
+        start: Optional[datetime] = None
+    ) -> SpaceSaving:
+        """
+        Merged summary of a chatbot's questions since `start` (default: all time)
+
+        Whole days are read from the daily summaries (so a start in the
+        middle of a day counts that whole day); messages past the last scan
+        are counted live.
+        """
+        state = await db[self.STATE].find_one({"_id": self.STATE_ID}, {"scanned_to": 1})
+        scanned_to = state.get("scanned_to") if state else None
+
+        docs: List[Dict[str, Any]] = []
+        if scanned_to:
+            query: Dict[str, Any] = {"chatbot_id": chatbot_id}
+            if start:
+                query["day"] = {"$gte": start.strftime("%Y-%m-%d")}
+            docs = await db[self.DAILY].find(query, {"total": 1, "items": 1}).to_list(None)
+
+        # Not scanned yet (everything, before the first run)
+        live_query: Dict[str, Any] = {"chatbot_id": chatbot_id, "role": "user"}
+        if scanned_to:
+            live_query["timestamp"] = {"$gte": scanned_to}
+        elif start:
+            live_query["timestamp"] = {"$gte": start}
+        live: Dict[Tuple[str, str], SpaceSaving] = {}
+        cursor = db.messages.find(live_query, {"_id": 0, "chatbot_id": 1, "content": 1, "timestamp": 1})
+        await asyncio.to_thread(self._fold, [message async for message in cursor], live)
+        return await asyncio.to_thread(self._merge_all, docs, live.values())
+
+    @staticmethod
+    def group_paraphrases(entries: List[Tuple[str, int, int]]) -> List[Dict[str, Any]]:
+        """
+        Group questions whose meaningful words are the same
+
+        Returns:
+            [{"question": most asked wording, "count": summed count, "variants": [...]}],
+            most frequent first
+        """
+        groups: Dict[str, Dict[str, Any]] = {}
+        for question, count, _ in entries:
+            signature = question_signature(question)
+            group = groups.get(signature)
+            if group is None:
+                # Entries come most frequent first, so the first wording leads
+                groups[signature] = {"question": question, "count": count, "variants": []}
+            else:
+                group["count"] += count
+                group["variants"].append(question)
+        return sorted(groups.values(), key=lambda group: group["count"], reverse=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "messages_scanned": self.messages_scanned
+        }
+
+
+# Global service; server.py starts the scan with the database on startup
+top_questions = TopQuestionsService()
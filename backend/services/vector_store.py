@@ -1,7 +1,7 @@
 import logging
 from typing import List, Dict, Optional
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import get_database
 from pymongo import TEXT
 import re
 from collections import Counter
@@ -16,16 +16,13 @@ class VectorStore:
     def __init__(self):
         """Initialize MongoDB connection for chunk storage"""
         try:
-            # Get MongoDB connection string
-            mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-            db_name = os.environ.get('MONGO_DB_NAME', 'botsmith')
-            
-            # Initialize MongoDB client
-            self.client = AsyncIOMotorClient(mongo_url)
-            self.db = self.client[db_name]
+            # MONGO_DB_NAME is honoured for deployments that keep chunks in a
+            # separate database; otherwise chunks live next to the app data.
+            # Either way the shared client (and its pool) is reused.
+            self.db = get_database(os.environ.get('MONGO_DB_NAME'))
             self.chunks_collection = self.db['document_chunks']
             
-            logger.info(f"MongoDB VectorStore initialized with database: {db_name}")
+            logger.info(f"MongoDB VectorStore initialized with database: {self.db.name}")
             
         except Exception as e:
             logger.error(f"Error initializing MongoDB VectorStore: {str(e)}")
@@ -1,5 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
 from typing import Optional
 import logging
 
@@ -7,7 +5,12 @@ logger = logging.getLogger(__name__)
 
 
 class WebsiteScraper:
-    """Scrape and extract text content from websites"""
+    """
+    Scrape and extract text content from websites
+
+    requests and BeautifulSoup are imported on first use, keeping them out
+    of application startup.
+    """
     
     @staticmethod
     def scrape_url(url: str, timeout: int = 30) -> str:
@@ -21,6 +24,9 @@ class WebsiteScraper:
         Returns:
             Extracted text content
         """
+        import requests
+        from bs4 import BeautifulSoup
+
         try:
             # Add headers to avoid being blocked
             headers = {
@@ -60,6 +66,8 @@ class WebsiteScraper:
     @staticmethod
     def validate_url(url: str) -> bool:
         """Validate if URL is accessible"""
+        import requests
+
         try:
             response = requests.head(url, timeout=5)
             return response.status_code < 400
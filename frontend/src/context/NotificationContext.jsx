@@ -86,7 +86,8 @@ export const NotificationProvider = ({ children, user }) => {
           const notification = JSON.parse(event.data);
           
           if (notification.type === 'ping') {
-            // Keep-alive message, ignore
+            // Keep-alive message; answer so the server keeps the socket
+            ws.send('pong');
             return;
           }
 
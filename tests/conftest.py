@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The backend is not a package; its modules import each other as top-level
+# modules (services.x, routers.x), as they do when server.py runs
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from repositories import AdminStatsRepository
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if isinstance(condition, dict) and "$in" in condition:
+            if doc.get(field) not in condition["$in"]:
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+def _value(doc, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return doc.get(expression[1:])
+    if isinstance(expression, dict) and "$cond" in expression:
+        (field, expected), yes, no = expression["$cond"][0]["$eq"], expression["$cond"][1], expression["$cond"][2]
+        return yes if _value(doc, field) == expected else no
+    return expression
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for AdminStatsRepository, counting every query"""
+
+    def __init__(self, db, docs):
+        self.db = db
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        self.db.queries += 1
+        return FakeCursor([doc for doc in self.docs if _matches(doc, query)])
+
+    def aggregate(self, pipeline):
+        self.db.queries += 1
+        docs = list(self.docs)
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [doc for doc in docs if _matches(doc, stage["$match"])]
+            elif "$sort" in stage:
+                for field, direction in reversed(list(stage["$sort"].items())):
+                    docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+            elif "$group" in stage:
+                spec = dict(stage["$group"])
+                key = spec.pop("_id")
+                groups = {}
+                for doc in docs:
+                    group = groups.setdefault(_value(doc, key), {})
+                    for name, accumulator in spec.items():
+                        if "$sum" in accumulator:
+                            group[name] = group.get(name, 0) + _value(doc, accumulator["$sum"])
+                        elif "$first" in accumulator and name not in group:
+                            group[name] = _value(doc, accumulator["$first"])
+                docs = [{"_id": group_id, **fields} for group_id, fields in groups.items()]
+        return FakeCursor(docs)
+
+
+class FakeDatabase:
+    def __init__(self, **collections):
+        self.queries = 0
+        self.collections = {name: FakeCollection(self, docs) for name, docs in collections.items()}
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, []))
+
+
+def _database(owners: int, bots_per_owner: int = 2) -> FakeDatabase:
+    start = datetime(2025, 1, 1)
+    users, chatbots, messages, conversations, sources, integrations = [], [], [], [], [], []
+    for u in range(owners):
+        users.append({"id": f"user-{u}", "name": f"User {u}", "email": f"user{u}@example.com"})
+        for b in range(bots_per_owner):
+            bot_id = f"bot-{u}-{b}"
+            chatbots.append({"id": bot_id, "user_id": f"user-{u}", "created_at": start + timedelta(days=b)})
+            sources.append({"chatbot_id": bot_id})
+            integrations.append({"chatbot_id": bot_id, "enabled": True})
+            integrations.append({"chatbot_id": bot_id, "enabled": False})
+            conversations.append({"chatbot_id": bot_id})
+            for m in range(3):
+                messages.append({"chatbot_id": bot_id, "timestamp": start + timedelta(minutes=m)})
+    return FakeDatabase(
+        users=users, chatbots=chatbots, messages=messages,
+        conversations=conversations, sources=sources, integrations=integrations
+    )
+
+
+@pytest.mark.parametrize("page_size", [1, 10, 100])
+def test_chatbot_page_costs_constant_queries(page_size):
+    db = _database(page_size, bots_per_owner=1)
+    repository = AdminStatsRepository(db)
+    page = [bot["id"] for bot in db.chatbots.docs]
+
+    async def load():
+        return await asyncio.gather(
+            repository.get_owners(bot["user_id"] for bot in db.chatbots.docs),
+            repository.get_chatbot_stats(page),
+        )
+
+    owners, stats = asyncio.run(load())
+
+    # One $in lookup of owners, one aggregation per counted collection
+    assert db.queries == 6
+    assert len(owners) == page_size
+    assert stats[page[0]] == {
+        "sources_count": 1,
+        "conversations_count": 1,
+        "messages_count": 3,
+        "integrations_count": 2,
+        "active_integrations": 1,
+        "last_message_at": datetime(2025, 1, 1, 0, 2),
+    }
+
+
+@pytest.mark.parametrize("page_size", [1, 10, 100])
+def test_user_page_costs_constant_queries(page_size):
+    db = _database(page_size)
+    user_ids = [user["id"] for user in db.users.docs]
+
+    stats = asyncio.run(AdminStatsRepository(db).get_user_stats(user_ids))
+
+    # Chatbots of the page, then one aggregation per statistic
+    assert db.queries == 5
+    assert stats["user-0"]["chatbots_count"] == 2
+    assert stats["user-0"]["messages_count"] == 6
+    assert stats["user-0"]["first_chatbot_at"] == datetime(2025, 1, 1)
+
+
+def test_empty_page_runs_no_statistics_queries():
+    db = _database(0)
+
+    stats = asyncio.run(AdminStatsRepository(db).get_chatbot_stats([]))
+
+    assert stats == {}
+    assert db.queries == 0
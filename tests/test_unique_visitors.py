@@ -0,0 +1,44 @@
+import pytest
+
+from services.unique_visitors import HyperLogLog
+
+
+def _sketch(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize("cardinality", [10, 1000, 20000, 200000])
+def test_estimate_within_three_standard_errors(cardinality):
+    sketch = _sketch(f"session-{i}" for i in range(cardinality))
+
+    assert abs(sketch.estimate() - cardinality) <= 3 * sketch.standard_error * cardinality
+
+
+def test_duplicates_are_not_counted():
+    sketch = _sketch(f"user-{i % 500}@example.com" for i in range(10000))
+
+    assert abs(sketch.estimate() - 500) <= 3 * sketch.standard_error * 500
+
+
+def test_merge_equals_sketch_of_union():
+    monday = [f"visitor-{i}" for i in range(0, 6000)]
+    tuesday = [f"visitor-{i}" for i in range(4000, 15000)]
+
+    merged = _sketch(monday)
+    merged.merge(_sketch(tuesday))
+    union = _sketch(set(monday) | set(tuesday))
+
+    assert merged.registers == union.registers
+    assert merged.estimate() == union.estimate()
+
+
+def test_binary_round_trip():
+    sketch = _sketch(f"session-{i}" for i in range(3000))
+
+    restored = HyperLogLog(bytes(sketch.to_binary()))
+
+    assert restored.registers == sketch.registers
+    assert restored.estimate() == sketch.estimate()